@@ -1,113 +1,177 @@
-import openai
-from typing import List, Dict
+import asyncio
+import itertools
+import sqlite3
+import threading
+from typing import AsyncIterator, Iterator, List, Dict
 import json
-import os
-import streamlit as st
 import random
+from intent_matcher import classify
+from intent_router import ROUTED_RESPONSES, get_intent_router
+from context_builder import ConversationSummary, count_tokens, select_recent
+from conversation_analyzer import ConversationAnalyzer
+from conversation_memory import MEMORY_CAPACITY, ConversationMemory, MemoryView
+from knowledge_index import BUILTIN_KNOWLEDGE, get_knowledge_index
+from model_router import get_model_router
+from openrouter_client import get_api_key, get_async_client, get_client, load_openai
+from prompt_templates import RenderedPrompt, get_prompt_template
+from response_cache import get_response_cache
+from session_store import get_session_store
+from telemetry import TurnTrace, get_telemetry
+
+FALLBACK_RESPONSE = "We can help with company formation across multiple jurisdictions. Which market are you considering?"
+
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+async def prepend_chunk(first_chunk, stream) -> AsyncIterator:
+    """The rest of an async stream after the chunk already read from it"""
+    if first_chunk is not None:
+        yield first_chunk
+    async for chunk in stream:
+        yield chunk
+
+class ResponseStreamCleaner:
+    """Apply the response clean-up to a stream of text deltas"""
+    prefix = "CONSULTANT:"
 
-class OpenRouterSalesAgent:
     def __init__(self):
-        # Get API key from Streamlit secrets or environment variables
-        try:
-            api_key = st.secrets["OPENROUTER_API_KEY"]
-        except:
-            api_key = os.environ.get("OPENROUTER_API_KEY")
-        
-        if not api_key:
-            raise ValueError("OpenRouter API key not found. Please set it in Streamlit secrets or environment variables.")
-        
-        # Initialize OpenRouter client
-        self.client = openai.OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key
-        )
-        
-        # Initialize memory
-        self.conversation_history = []
+        self.raw = ""
+        self.head = ""
+        self.prefix_checked = False
+        self.emitted = False
+        self.pending = ""
+
+    def feed(self, delta: str) -> str:
+        """Consume a delta and return the text that is safe to display"""
+        self.raw += delta
+        
+        # Hold back the start of the response until we know it is not the prefix
+        if not self.prefix_checked:
+            self.head = (self.head + delta).lstrip()
+            if self.prefix.startswith(self.head):
+                return ""
+            if self.head.startswith(self.prefix):
+                self.head = self.head[len(self.prefix):]
+            self.prefix_checked = True
+            delta = self.head
+        
+        # Hold back trailing whitespace so the output matches the stripped response
+        text = self.pending + delta
+        if not self.emitted:
+            text = text.lstrip()
+        body = text.rstrip()
+        self.pending = text[len(body):]
+        if body:
+            self.emitted = True
+        return body
+
+    def finish(self) -> str:
+        """Return any text still held back once the stream has ended"""
+        if self.prefix_checked:
+            return ""
+        if self.head.startswith(self.prefix):
+            self.head = self.head[len(self.prefix):]
+        return self.head.strip()
+
+class Turn:
+    """One turn's state between the steps before and after the model call"""
+    __slots__ = ("exchange_count", "response", "cache_key", "cached", "messages", "trigger", "recorded")
+
+    def __init__(self, exchange_count: int):
+        self.exchange_count = exchange_count
+        # The whole reply when the turn was answered without the model (routed or learned)
+        self.response = None
+        self.cache_key = None
+        self.cached = None
+        self.messages = None
+        self.trigger = ""
+        self.recorded = False
+
+class OpenRouterSalesAgent:
+    def __init__(self, client=None, lead_id: str = None):
+        # Share one pooled OpenRouter client across all sessions in the process;
+        # it is created on the first model call, the key is checked right away
+        self.client = client
+        if client is None:
+            get_api_key()
+        
+        # Model chain, deadlines, retries and hedging for the OpenRouter calls
+        self.router = get_model_router()
+        self.model = self.router.primary
+        
+        # Initialize memory, the full transcript is shared with the UI
         self.max_history = 20
+        self.memory = ConversationMemory(max(MEMORY_CAPACITY, self.max_history))
         
-        # Knowledge base
-        self.knowledge = self.load_simple_knowledge()
+        # Turns that leave the prompt window are folded into a cached summary
+        self.history_summary = ConversationSummary()
+        self.summarized_count = 0
         
-        # Strategy context
-        self.current_strategy = None
+        # Learning features and the outcome so far, updated as messages are added
+        self.analyzer = ConversationAnalyzer()
         
-        # Base system prompt
-        self.base_system_prompt = """You are a professional corporate services consultant [choose one of the English names] from Strasia Group specializing in company incorporation and secretarial services across Hong Kong, Singapore, Malaysia, Thailand, UK, and USA.
-
-GUIDELINES:
-- Be direct and professional, not overly enthusiastic
-- Introduce yourself once in the first message to the user [choose one of the English names] and ask something like this (please stay generalized and you can change it according to first input): May I know what services you are looking for? Stay generalized let user ask about your services.
-- Don't use "I", use "We"
-- Don't describe Strasia Group Services at all unless you are asked
-- Stay very abstract and general, name only benefits and positive features when asked, e.g. If asked if Singapore jurisdiction is better than Hong Kong, name only benefits of both. Benefits of Hong Kong include taxation benefits and international financial center status (avoid mentioning Chinese market access unless specifically asked about China).
-- Your answers should imply more questions when answered like for a professional sales guy
-- Don't start with "I specialize" and never use word "insights"
-- Don't ask for details like: "Are you looking for monthly or yearly accounting services?" Because it should be asked and upselled in the online meeting
-- Keep responses to 2-3 sentences maximum
-- Ask one specific question to understand their needs
-- Guide toward scheduling a consultation within 4-5 exchanges
-- Use knowledge when relevant but don't overwhelm
-- Ask clarifications to be completely aligned, e.g. "What trading you mean when you say about your business niche?"
-- Avoid phrases like "Great question!" or "I'd be happy to help"
-- Avoid saying directly that we monitor conversation number like never say "since this is your 4th exchange" or so
-- Always add in every message beginning small details humans add like "sure dont worry" before actually explaining why not to worry or "yes no problem" "Let me share some details" "Happy to help" before explaining why its no problem add this or similar everyday wording
-- You MUST output just the response to the message, nothing else
-- Add some wording that confirms that the lead has found the right partner (we have many clients doing [name of industry]; we have established relationships with banking institutions; we work with various payment processors including established partners).
-- Always mention our personal relationships with banking and payment processing partners when relevant: at banking institutions like Airwallex, Aspire, HSBC; we know people at payment processors like Airwallex, Oceanpayment and PayPal.
-- You must call a lead for a booking/consultation at 4-5th message if not yet shared in message for example with (try to stay general and easy going, you may change it according to the need): "I will put you in touch with one of our experts. Please, choose your preferred time in the calendar CALENDLY_LINK or via email EMAIL to discuss the details."
-- If they want booking/consultation, immediately provide something like (change it): "I will put you in touch with one of our consultants. Please, choose your preferred time in the calendar CALENDLY_LINK or via email EMAIL to discuss the details."
-- If you provide details and does not end the message with a call proposal, it should say something like "I hope this answers your question(s)" "I hope this provides some clarity" "Our team would be happy to provide more information if needed"
-- Always check if it's the time to send (change it) "I will put you in touch with one of our consultants/experts. Please, choose your preferred time in the calendar CALENDLY_LINK or via email EMAIL to discuss the details." or not yet
-- NEVER provide specific pricing, costs, or numerical quotes - always say pricing is customized and we provide quotes individually after a free expert consultation
-- For incorporation timelines, say "usually around one week" instead of specific days like "1-2 days"
-- For US incorporation, recommend Florida and New Mexico instead of Delaware or Wyoming due to banking advantages
-- For US banking, say "we work with several banking partners in USA" without specific names, and if asked which ones, say "it depends on industry and home country of owner" and guide them to consultation
-- Never mention clients and services in sanctioned countries like Myanmar
-- Always mention Hong Kong's 8.25% tax rate (for first HK$2M) when discussing Hong Kong taxation
-- Reject any requests that could support illegal activities immediately
-- Never recommend Wyoming or Delaware but Florida and New Mexico instead
-- Include all major jurisdictions (USA, UK, not just Singapore and Hong Kong) in recommendations not just HK and Singapore
-
-CONVERSATION GOAL: Get them to ask for contact information or schedule a consultation."""
-
-    def set_strategy_context(self, strategy: Dict):
-        """Apply learned strategy to agent behavior"""
-        self.current_strategy = strategy
-        if not strategy:
-            return
-        
-        # Add learned tactics to system prompt
-        tactics = strategy.get('conversation_tactics', {})
-        timing = strategy.get('timing_strategy', {})
+        # A lead's conversation is stored and resumed on their first turn back
+        self.lead_id = lead_id
+        self.session_store = get_session_store() if lead_id else None
+        self.resumed = self.session_store is None
+        self.resumed_count = 0
+        self.persisted_count = 0
+        # Strategy variant and learning queue key, stored with the conversation
+        self.variant = None
+        self.conversation_id = None
         
-        strategy_additions = "\n\nLEARNED STRATEGY:\n"
+        # Prompt token budget, history gets what the other parts leave over
+        self.max_prompt_tokens = 3000
+        self.max_history_tokens = 800
         
-        # Add successful opening phrases
-        opening_phrases = tactics.get('opening_phrases', [])
-        if opening_phrases:
-            strategy_additions += f"- Use these proven opening phrases: {', '.join(opening_phrases[:3])}\n"
+        # Knowledge base, indexed once per process
+        self.knowledge_index = get_knowledge_index()
+        self.max_knowledge_snippets = 2
+        self.knowledge_token_budget = 150
         
-        # Add successful transitions
-        transitions = tactics.get('successful_transitions', [])
-        if transitions:
-            strategy_additions += f"- Use these successful transitions: {', '.join(transitions[:3])}\n"
+        # Responses shared across sessions for repeated questions
+        self.response_cache = get_response_cache()
         
-        # Add proven questions
-        questions = tactics.get('proven_questions', [])
-        if questions:
-            strategy_additions += f"- Ask these effective questions: {', '.join(questions[:3])}\n"
+        # Local classifier answering deterministic turns from templates; turns
+        # go to the model while a warm-up thread is still training it
+        self.intent_router = get_intent_router(wait=False)
         
-        # Add timing strategy
-        link_timing = timing.get('link_timing', 4)
-        strategy_additions += f"- Offer consultation link around message {link_timing}\n"
+        # Per-turn timings, token usage and cost
+        self.telemetry = get_telemetry()
+        self.last_trace = None
         
-        # Add consultation triggers
-        consultation_triggers = tactics.get('consultation_triggers', [])
-        if consultation_triggers:
-            strategy_additions += f"- Use these consultation phrases: {consultation_triggers[0]}\n"
+        # Strategy context
+        self.current_strategy = None
+        self.strategy_version = None
         
-        self.system_prompt = self.base_system_prompt + strategy_additions
+        # System prompt, compiled once and rendered per strategy
+        self.prompt_template = get_prompt_template()
+        self.base_system_prompt = self.prompt_template.base
+        self.apply_prompt(self.prompt_template.render(None))
+
+    def create_client(self):
+        """Get the OpenRouter client used when none is passed in"""
+        return get_client()
+
+    def get_client(self):
+        if self.client is None:
+            self.client = self.create_client()
+        return self.client
+
+    def set_strategy_context(self, strategy: Dict, version: int = None):
+        """Apply learned strategy to agent behavior"""
+        # Skip the prompt lookup while the strategy version is unchanged
+        if version is not None and version == self.strategy_version and strategy is self.current_strategy:
+            return
+        self.strategy_version = version
+        self.current_strategy = strategy
+        self.apply_prompt(self.prompt_template.render(strategy))
+
+    def apply_prompt(self, prompt: RenderedPrompt):
+        self.prompt = prompt
+        self.system_prompt = prompt.text
+        self.system_prompt_hash = prompt.hash
+        self.system_prompt_tokens = prompt.tokens
 
     def get_learned_response_pattern(self, user_message: str) -> str:
         """Get learned response pattern for specific scenarios"""
@@ -115,18 +179,18 @@ CONVERSATION GOAL: Get them to ask for contact information or schedule a consult
             return None
         
         response_patterns = self.current_strategy.get('conversation_tactics', {}).get('response_patterns', {})
-        message_lower = user_message.lower()
+        intents = classify(user_message)
         
         # Check for cost inquiry
-        if any(word in message_lower for word in ['cost', 'price', 'how much', 'expensive', 'pricing']):
+        if intents.has('cost'):
             return response_patterns.get('cost_inquiry')
         
         # Check for banking inquiry
-        if any(word in message_lower for word in ['bank', 'banking', 'account', 'payment']):
+        if intents.has('bank', 'account', 'payment'):
             return response_patterns.get('banking_inquiry')
         
         # Check for urgency
-        if any(word in message_lower for word in ['urgent', 'asap', 'quickly', 'fast', 'immediate']):
+        if intents.has('urgent'):
             return response_patterns.get('urgency_response')
         
         return None
@@ -140,20 +204,20 @@ CONVERSATION GOAL: Get them to ask for contact information or schedule a consult
         urgency_triggers = timing_strategy.get('urgency_triggers', [])
         early_scenarios = timing_strategy.get('early_link_scenarios', [])
         
-        message_lower = user_message.lower()
+        intents = classify(user_message)
         
         # Check urgency triggers
-        if any(trigger in message_lower for trigger in urgency_triggers):
+        if any(intents.mentions(trigger) for trigger in urgency_triggers):
             return True
         
         # Check early link scenarios
-        if 'detailed_cost_question' in early_scenarios and len(user_message.split()) > 15 and any(word in message_lower for word in ['cost', 'price']):
+        if 'detailed_cost_question' in early_scenarios and intents.word_count > 15 and intents.has('cost'):
             return True
         
-        if 'banking_requirements' in early_scenarios and any(word in message_lower for word in ['bank', 'banking', 'account']):
+        if 'banking_requirements' in early_scenarios and intents.has('bank', 'account'):
             return True
         
-        if 'multiple_jurisdictions' in early_scenarios and sum(1 for jurisdiction in ['singapore', 'hong kong', 'uk', 'usa', 'florida', 'new mexico'] if jurisdiction in message_lower) > 1:
+        if 'multiple_jurisdictions' in early_scenarios and len(intents.jurisdictions) > 1:
             return True
         
         return False
@@ -166,7 +230,7 @@ CONVERSATION GOAL: Get them to ask for contact information or schedule a consult
         successful_phrases = self.current_strategy.get('learned_patterns', {}).get('successful_phrases', [])
         opening_phrases = self.current_strategy.get('conversation_tactics', {}).get('opening_phrases', [])
         
-        all_phrases = successful_phrases + opening_phrases
+        all_phrases = list(successful_phrases) + opening_phrases
         if all_phrases:
             return random.choice(all_phrases)
         
@@ -174,116 +238,153 @@ CONVERSATION GOAL: Get them to ask for contact information or schedule a consult
 
     def load_simple_knowledge(self):
         """Load simple knowledge base without external dependencies"""
-        knowledge_base = {
-            "singapore": {
-                "incorporation": "Singapore Private Limited Company can be incorporated usually around one week. Minimum 1 director required (can be foreigner). Minimum paid-up capital SGD $1. Corporate secretary mandatory.",
-                "taxation": "Corporate tax rate 17%. No capital gains tax. Extensive tax incentives available. Annual filing required.",
-                "benefits": "Strategic location, business-friendly environment, strong legal framework, access to ASEAN markets."
-            },
-            "hong_kong": {
-                "incorporation": "Hong Kong Limited Company incorporation takes usually around one week. Minimum 1 director and 1 shareholder. Company secretary required. No minimum capital requirement.",
-                "taxation": "Profits tax rate 8.25% for first HK$2M and 16.5% above. No capital gains tax, dividend tax, or withholding tax. Territorial taxation system.",
-                "benefits": "International financial center, simple tax system, no foreign exchange controls, strategic Asian hub."
-            },
-            "uk": {
-                "incorporation": "UK Limited Company formation usually around one week. Minimum 1 director and 1 shareholder. Company secretary optional.",
-                "taxation": "Corporation tax rate 25% (19% for small companies). VAT registration may be required. Annual confirmation statement required.",
-                "benefits": "Access to global markets, strong legal system, established business infrastructure, English-speaking."
-            },
-            "usa": {
-                "incorporation": "US Corporation or LLC formation usually around one week. Requirements vary by state. Florida and New Mexico are popular options. Registered agent required.",
-                "taxation": "Federal corporate tax 21% plus state taxes. LLC has pass-through taxation. We work with several banking partners in USA.",
-                "benefits": "World's largest economy, access to capital markets, strong IP protection, established business ecosystem."
-            },
-            "malaysia": {
-                "incorporation": "Malaysian Sdn Bhd incorporation takes usually around one week. Minimum 1 director (Malaysian resident required). Company secretary mandatory.",
-                "taxation": "Corporate tax rate 24%. MSC status companies get tax incentives. Labuan jurisdiction offers attractive tax rates.",
-                "benefits": "ASEAN hub, multicultural workforce, government incentives, strategic location."
-            },
-            "thailand": {
-                "incorporation": "Thai Limited Company registration takes usually around one week. Minimum 3 shareholders. Foreign ownership restrictions apply.",
-                "taxation": "Corporate income tax 20%. BOI promoted companies get tax privileges. VAT 7%.",
-                "benefits": "Growing economy, ASEAN member, government investment promotion, skilled workforce."
-            }
-        }
-        return knowledge_base
+        return BUILTIN_KNOWLEDGE
 
     def get_knowledge(self, message: str) -> str:
-        """Get relevant knowledge from simple knowledge base"""
-        message_lower = message.lower()
-        relevant_info = []
-        
-        # Check which jurisdictions are mentioned
-        jurisdictions_mentioned = []
-        for jurisdiction in self.knowledge.keys():
-            if jurisdiction.replace("_", " ") in message_lower or jurisdiction in message_lower:
+        """Get relevant knowledge from the knowledge index"""
+        intents = classify(message)
+        
+        # Only filter by the jurisdictions the query names, as tagged in the index
+        jurisdictions_mentioned = [jurisdiction for jurisdiction in intents.jurisdictions
+                                   if jurisdiction in self.knowledge_index.jurisdictions]
+        for jurisdiction in self.knowledge_index.jurisdictions_in(message):
+            if jurisdiction not in jurisdictions_mentioned:
                 jurisdictions_mentioned.append(jurisdiction)
         
-        # If no specific jurisdiction mentioned, check for general topics
-        if not jurisdictions_mentioned:
-            if any(word in message_lower for word in ["incorporation", "company", "business", "setup", "formation"]):
-                jurisdictions_mentioned = ["singapore", "hong_kong"]
-            elif any(word in message_lower for word in ["tax", "taxation", "cost", "rate"]):
-                jurisdictions_mentioned = ["singapore", "hong_kong", "uk"]
-        
-        # Gather relevant information
-        for jurisdiction in jurisdictions_mentioned[:2]:
-            if jurisdiction in self.knowledge:
-                jurisdiction_name = jurisdiction.replace("_", " ").title()
-                
-                # Determine what type of info to include based on query
-                if any(word in message_lower for word in ["cost", "tax", "rate", "price"]):
-                    info = f"{jurisdiction_name}: {self.knowledge[jurisdiction]['taxation']}"
-                elif any(word in message_lower for word in ["incorporation", "setup", "formation", "company"]):
-                    info = f"{jurisdiction_name}: {self.knowledge[jurisdiction]['incorporation']}"
-                else:
-                    info = f"{jurisdiction_name}: {self.knowledge[jurisdiction]['benefits']}"
-                
-                relevant_info.append(info)
+        # Steer retrieval towards the type of info the query asks for
+        query = [message]
+        if intents.has("cost", "tax", "rate"):
+            query.append("taxation")
+        elif intents.has("incorporation"):
+            query.append("incorporation")
+        elif jurisdictions_mentioned or intents.has("business"):
+            query.append("benefits")
+        query.extend(jurisdiction.replace("_", " ") for jurisdiction in jurisdictions_mentioned)
+        results = self.knowledge_index.search(" ".join(query), top_k=8, jurisdictions=jurisdictions_mentioned)
+        
+        # Gather the best snippet per jurisdiction within the token budget
+        relevant_info = []
+        used_jurisdictions = set()
+        tokens_used = 0
+        for result in results:
+            if result["jurisdiction"] and result["jurisdiction"] in used_jurisdictions:
+                continue
+            info = f"{result['title']}: {result['text']}" if result["title"] else result["text"]
+            tokens = count_tokens(info)
+            if tokens_used + tokens > self.knowledge_token_budget:
+                continue
+            relevant_info.append(info)
+            used_jurisdictions.add(result["jurisdiction"])
+            tokens_used += tokens
+            if len(relevant_info) >= self.max_knowledge_snippets:
+                break
         
         return " | ".join(relevant_info) if relevant_info else "We can help with company formation across multiple jurisdictions."
 
+    def resume(self):
+        """Page the lead's stored conversation and summary in, once"""
+        if self.resumed:
+            return
+        self.resumed = True
+        stored = self.session_store.load(self.lead_id, self.max_history)
+        if stored is None:
+            return
+        state, messages = stored
+        self.memory.restore(messages, state["total"], state["user_turns"])
+        self.summarized_count = state["summarized_count"]
+        self.history_summary.restore(state["summary"])
+        if state["analysis"]:
+            self.analyzer.restore(state["analysis"])
+        else:
+            # Stored before sessions kept their analysis, the paged-in messages are the best available
+            self.analyzer = ConversationAnalyzer.from_messages(messages)
+        self.variant = state["variant"]
+        self.conversation_id = state["conversation_id"]
+        self.resumed_count = self.persisted_count = state["total"]
+
+    def persist(self):
+        """Store the messages added since the last save along with the summary"""
+        if self.session_store is None:
+            return
+        state = {
+            "total": self.memory.total,
+            "user_turns": self.memory.user_turns,
+            "summarized_count": self.summarized_count,
+            "summary": self.history_summary.state(),
+            "analysis": self.analyzer.state(),
+            "variant": self.variant,
+            "conversation_id": self.conversation_id
+        }
+        try:
+            self.session_store.save(self.lead_id, self.persisted_count, self.memory.since(self.persisted_count), state)
+            self.persisted_count = self.memory.total
+        except sqlite3.Error as e:
+            # Retried with the next exchange, the reply itself is not affected
+            print(f"Error saving session: {e}")
+
+    @property
+    def conversation_history(self) -> MemoryView:
+        """The messages in the prompt window"""
+        return self.memory.recent(self.max_history)
+
     def add_to_history(self, role: str, content: str):
         """Add message to conversation history"""
-        self.conversation_history.append({"role": role, "content": content})
+        self.memory.append(role, content)
+        self.analyzer.add(role, content)
+        if role == "assistant":
+            self.analyzer.link_timing = self.get_link_timing()
         
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history = self.conversation_history[-self.max_history:]
+        # Fold messages leaving the prompt window into the summary
+        self.summarize_until(self.memory.total - self.max_history)
+
+    def summarize_until(self, message_number: int):
+        """Fold messages up to the given position in the conversation into the summary"""
+        while self.summarized_count < message_number:
+            msg = self.memory.at(self.summarized_count)
+            self.history_summary.add(msg.role, msg.content)
+            self.summarized_count += 1
 
-    def format_conversation_history(self) -> str:
-        """Format conversation history for the prompt"""
-        if not self.conversation_history:
+    def format_conversation_history(self, token_budget: int = None) -> str:
+        """Format conversation history for the prompt within a token budget"""
+        if not self.memory:
             return "This is the start of the conversation."
         
+        if token_budget is None:
+            token_budget = self.max_history_tokens
+        
+        # Keep the newest messages that fit, summarizing the ones before them
+        recent = self.memory.since(self.summarized_count)
+        start = select_recent(recent, token_budget - self.history_summary.max_tokens)
+        self.summarize_until(self.summarized_count + start)
+        
         formatted = []
-        for msg in self.conversation_history[-8:]:
-            role = "User" if msg['role'] == 'user' else "Consultant"
-            formatted.append(f"{role}: {msg['content']}")
+        if self.history_summary.text:
+            formatted.append(f"Earlier in the conversation: {self.history_summary.text}")
+        for msg in recent[start:]:
+            role = "User" if msg.role == 'user' else "Consultant"
+            formatted.append(f"{role}: {msg.content}")
         
         return "\n".join(formatted)
 
-    def generate_response(self, user_message: str) -> str:
-        """Generate response using OpenRouter with learned strategy"""
-        try:
-            # Get relevant knowledge
+    def count_exchanges(self) -> int:
+        """Count user messages in the conversation"""
+        return self.memory.user_turns
+
+    def build_messages(self, user_message: str, exchange_count: int, trace: TurnTrace = None) -> List[Dict]:
+        """Build the chat messages sent to OpenRouter for this turn"""
+        trace = trace or TurnTrace(self.model)
+        
+        # Get relevant knowledge
+        with trace.stage("knowledge"):
             knowledge = self.get_knowledge(user_message)
-            
-            # Format conversation history
-            conv_history = self.format_conversation_history()
-            
-            # Count current exchanges
-            user_messages = [msg for msg in self.conversation_history if msg['role'] == 'user']
-            exchange_count = len(user_messages)
-            
-            # Check for learned response pattern first
-            learned_response = self.get_learned_response_pattern(user_message)
-            if learned_response and exchange_count < 4:
-                self.add_to_history("user", user_message)
-                self.add_to_history("assistant", learned_response)
-                return learned_response
-            
-            # Create the prompt
-            prompt = f"""CONVERSATION HISTORY:
+        
+        # Format conversation history with what is left of the prompt budget
+        with trace.stage("history"):
+            history_budget = self.max_prompt_tokens - self.system_prompt_tokens - count_tokens(knowledge) - count_tokens(user_message) - 100
+            conv_history = self.format_conversation_history(max(0, min(self.max_history_tokens, history_budget)))
+        
+        # Create the prompt
+        prompt = f"""CONVERSATION HISTORY:
 {conv_history}
 
 RELEVANT KNOWLEDGE:
@@ -293,62 +394,403 @@ USER: {user_message}
 
 Remember the guidelines and respond as a professional consultant using learned strategies. Current exchange count: {exchange_count + 1}"""
 
-            # Call OpenRouter API
-            response = self.client.chat.completions.create(
-                model="anthropic/claude-3.5-sonnet",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=200,
-                temperature=0.7
-            )
+        # The static system prompt goes first and is marked cacheable so the
+        # provider can reuse that prefix, the per-turn parts follow it
+        return [
+            {"role": "system", "content": self.prompt.system_content()},
+            {"role": "user", "content": prompt}
+        ]
+
+    def get_cache_key(self, user_message: str, exchange_count: int):
+        """Response cache key for this turn under the current system prompt"""
+        return self.response_cache.make_key(user_message, exchange_count, self.prompt, self.variant)
+
+    def use_routed_response(self, user_message: str, exchange_count: int, trace: TurnTrace) -> str:
+        """Answer pricing, booking and rejection turns from templates when the router is confident"""
+        if self.intent_router is None:
+            self.intent_router = get_intent_router(wait=False)
+            if self.intent_router is None:
+                return None
+        decision = self.intent_router.route(user_message)
+        trace.intent = decision.intent
+        trace.intent_confidence = decision.confidence
+        if not decision.handled:
+            return None
+        
+        tactics = self.current_strategy.get('conversation_tactics', {}) if self.current_strategy else {}
+        response = ROUTED_RESPONSES[decision.intent]
+        if decision.intent == "pricing":
+            response = tactics.get('response_patterns', {}).get('cost_inquiry') or response
+            consultation_trigger = self.get_consultation_trigger(user_message, response, exchange_count)
+            if consultation_trigger:
+                response += f" {consultation_trigger}"
+        elif decision.intent == "booking" and tactics.get('consultation_triggers'):
+            response = random.choice(tactics['consultation_triggers'])
+        
+        self.record_response(user_message, response)
+        return response
+
+    def use_learned_response(self, user_message: str, exchange_count: int) -> str:
+        """Answer early exchanges from a learned response pattern, if one matches"""
+        learned_response = self.get_learned_response_pattern(user_message)
+        if learned_response and exchange_count < 4:
+            self.record_response(user_message, learned_response)
+            return learned_response
+        return None
+
+    def start_turn(self, user_message: str, trace: TurnTrace) -> Turn:
+        """Steps before the model call: local answers, the cache lookup and the prompt"""
+        turn = Turn(self.count_exchanges())
+        
+        # Deterministic turns are answered locally
+        with trace.stage("route"):
+            turn.response = self.use_routed_response(user_message, turn.exchange_count, trace)
+        if turn.response:
+            trace.source = "routed"
+            turn.recorded = True
+            return turn
+        
+        # Check for learned response pattern first
+        with trace.stage("learned_lookup"):
+            turn.response = self.use_learned_response(user_message, turn.exchange_count)
+        if turn.response:
+            trace.source = "learned"
+            turn.recorded = True
+            return turn
+        
+        # Repeated questions are answered from the shared response cache
+        with trace.stage("cache_lookup"):
+            turn.cache_key = self.get_cache_key(user_message, turn.exchange_count)
+            turn.cached = self.response_cache.get(turn.cache_key)
+        if turn.cached is not None:
+            trace.source = "cache"
+        else:
+            turn.messages = self.build_messages(user_message, turn.exchange_count, trace)
+        return turn
+
+    def finish_turn(self, user_message: str, raw_response: str, turn: Turn, trace: TurnTrace) -> str:
+        """Steps after the model call: cache, clean-up, call to action and history; returns the whole reply"""
+        if turn.cached is None:
+            self.response_cache.put(turn.cache_key, raw_response)
+        with trace.stage("postprocess"):
+            ai_response = self.clean_response(raw_response, turn.exchange_count)
+            turn.trigger = self.get_consultation_trigger(user_message, ai_response, turn.exchange_count)
+            if turn.trigger:
+                ai_response += f" {turn.trigger}"
+            self.record_response(user_message, ai_response)
+            turn.recorded = True
+        return ai_response
+
+    def fail_turn(self, user_message: str, error: Exception, trace: TurnTrace, turn: Turn = None, shown: str = "") -> str:
+        """Keep what the lead was shown of a failed turn, the partial reply or the fallback"""
+        print(f"Error generating response: {error}")
+        trace.fail(error)
+        if turn is None or not turn.recorded:
+            self.record_response(user_message, shown or FALLBACK_RESPONSE)
+        return FALLBACK_RESPONSE
+
+    @staticmethod
+    def read_chunk(chunk, cleaner: ResponseStreamCleaner, trace: TurnTrace) -> str:
+        """Text of a streamed chunk that is safe to display, recording usage when it arrives"""
+        if chunk.usage is not None:
+            trace.record_usage(chunk.usage)
+        if not chunk.choices:
+            return ""
+        return cleaner.feed(chunk.choices[0].delta.content or "")
+
+    def record_response(self, user_message: str, ai_response: str):
+        """Add the exchange, as the lead saw it, to the conversation; stored when the turn ends"""
+        self.add_to_history("user", user_message)
+        self.add_to_history("assistant", ai_response)
+
+    def clean_response(self, ai_response: str, exchange_count: int) -> str:
+        """Clean the model output"""
+        ai_response = ai_response.strip()
+        
+        # Clean response
+        if ai_response.startswith("CONSULTANT:"):
+            ai_response = ai_response.replace("CONSULTANT:", "").strip()
+        
+        # Add successful phrase if available and not first message
+        if exchange_count > 0:
+            successful_phrase = self.get_successful_phrase()
+            if successful_phrase and not ai_response.startswith(successful_phrase.split()[0]):
+                if len(successful_phrase.split()) < 6:  # Short phrases only
+                    ai_response = f"{ai_response}"
+        
+        return ai_response
+
+    def get_link_timing(self) -> int:
+        """Exchange at which the strategy shares the consultation link"""
+        if self.current_strategy:
+            return self.current_strategy.get('timing_strategy', {}).get('link_timing', 4)
+        return 4
+
+    def get_consultation_trigger(self, user_message: str, ai_response: str, exchange_count: int) -> str:
+        """Get the consultation call-to-action to append, or an empty string"""
+        # Determine link timing based on strategy
+        target_timing = self.get_link_timing()
+        
+        # Check for early link offering
+        should_offer_early = self.should_offer_link_early(user_message, exchange_count)
+        
+        # Check if we should suggest contact
+        if ((exchange_count >= target_timing or should_offer_early) and 
+            "CALENDLY_LINK" not in ai_response and "EMAIL" not in ai_response):
+            if classify(user_message).has("cost", "timeline", "when", "process", "bank"):
+                consultation_trigger = "I will put you in touch with one of our experts. Please, choose your preferred time in the calendar CALENDLY_LINK or via email EMAIL to discuss the details."
+                if self.current_strategy:
+                    triggers = self.current_strategy.get('conversation_tactics', {}).get('consultation_triggers', [])
+                    if triggers:
+                        consultation_trigger = random.choice(triggers)
+                return consultation_trigger
+        
+        return ""
+
+    def generate_response(self, user_message: str) -> str:
+        """Generate response using OpenRouter with learned strategy"""
+        trace = TurnTrace(self.model)
+        turn = None
+        try:
+            # Count current exchanges, after resuming a returning lead
+            self.resume()
+            turn = self.start_turn(user_message, trace)
+            if turn.response:
+                return turn.response
             
-            ai_response = response.choices[0].message.content.strip()
+            ai_response = turn.cached
+            if ai_response is None:
+                # Call OpenRouter API down the model chain
+                with trace.stage("llm"):
+                    response = self.router.complete(
+                        self.get_client(), turn.messages, self.router.choose_models(user_message), trace,
+                        max_tokens=200,
+                        temperature=0.7
+                    )
+                trace.record_usage(response.usage)
+                ai_response = response.choices[0].message.content
+            return self.finish_turn(user_message, ai_response, turn, trace)
             
-            # Clean response
-            if ai_response.startswith("CONSULTANT:"):
-                ai_response = ai_response.replace("CONSULTANT:", "").strip()
+        except Exception as e:
+            return self.fail_turn(user_message, e, trace, turn)
+        finally:
+            self.persist()
+            self.record_trace(trace)
+
+    def generate_response_stream(self, user_message: str) -> Iterator[str]:
+        """Stream the response as text deltas, e.g. into st.write_stream"""
+        trace = TurnTrace(self.model, stream=True)
+        cleaner = ResponseStreamCleaner()
+        turn = None
+        emitted = False
+        stream = None
+        try:
+            # Count current exchanges, after resuming a returning lead
+            self.resume()
+            turn = self.start_turn(user_message, trace)
+            if turn.response:
+                trace.first_token()
+                emitted = True
+                yield turn.response
+                return
             
-            # Add successful phrase if available and not first message
-            if exchange_count > 0:
-                successful_phrase = self.get_successful_phrase()
-                if successful_phrase and not ai_response.startswith(successful_phrase.split()[0]):
-                    if len(successful_phrase.split()) < 6:  # Short phrases only
-                        ai_response = f"{ai_response}"
+            if turn.cached is not None:
+                text = cleaner.feed(turn.cached)
+                if text:
+                    trace.first_token()
+                    emitted = True
+                    yield text
+            else:
+                # Call OpenRouter API down the model chain, the stage includes reading the stream
+                with trace.stage("llm"):
+                    stream, first_chunk = self.router.open_stream(
+                        self.get_client(), turn.messages, self.router.choose_models(user_message), trace,
+                        max_tokens=200,
+                        temperature=0.7,
+                        stream_options={"include_usage": True}
+                    )
+                    for chunk in itertools.chain([first_chunk] if first_chunk is not None else [], stream):
+                        text = self.read_chunk(chunk, cleaner, trace)
+                        if text:
+                            trace.first_token()
+                            emitted = True
+                            yield text
+            text = cleaner.finish()
+            if text:
+                trace.first_token()
+                emitted = True
+                yield text
             
-            # Add to conversation history
-            self.add_to_history("user", user_message)
-            self.add_to_history("assistant", ai_response)
+            # Post-process once the full response is known
+            self.finish_turn(user_message, cleaner.raw, turn, trace)
+            if turn.trigger:
+                yield f" {turn.trigger}"
             
-            # Determine link timing based on strategy
-            target_timing = 4
-            if self.current_strategy:
-                target_timing = self.current_strategy.get('timing_strategy', {}).get('link_timing', 4)
+        except Exception as e:
+            fallback = self.fail_turn(user_message, e, trace, turn, cleaner.raw.strip() if emitted else "")
+            if not emitted:
+                yield fallback
+        finally:
+            # Return the connection to the shared pool
+            if stream is not None:
+                stream.close()
+            self.persist()
+            self.record_trace(trace)
+
+    def record_trace(self, trace: TurnTrace):
+        """Publish the turn trace to the shared telemetry"""
+        self.last_trace = trace
+        self.telemetry.record(trace)
+
+    def clear_memory(self):
+        """Clear conversation history"""
+        # Cleared in place, the UI may hold the same memory
+        self.memory.clear()
+        self.history_summary.clear()
+        self.analyzer.clear()
+        self.summarized_count = 0
+        self.resumed_count = self.persisted_count = 0
+        # A cleared conversation is a new one, the caller assigns its variant and key
+        self.variant = None
+        self.conversation_id = None
+        if self.session_store is not None:
+            self.session_store.delete(self.lead_id)
+            self.resumed = True
+
+class AsyncOpenRouterSalesAgent(OpenRouterSalesAgent):
+    """Async agent on the process-wide pooled AsyncOpenAI client
+
+    The session store is SQLite, so loading and saving the conversation run
+    on a worker thread instead of blocking every session on the event loop.
+    """
+
+    def get_client(self):
+        # Resolved per event loop at call time, see get_async_client
+        return self.client if self.client is not None else get_async_client()
+
+    async def generate_response(self, user_message: str) -> str:
+        """Generate response using OpenRouter with learned strategy"""
+        trace = TurnTrace(self.model)
+        turn = None
+        try:
+            # Count current exchanges, after resuming a returning lead
+            await asyncio.to_thread(self.resume)
+            turn = self.start_turn(user_message, trace)
+            if turn.response:
+                return turn.response
             
-            # Check for early link offering
-            should_offer_early = self.should_offer_link_early(user_message, exchange_count)
+            ai_response = turn.cached
+            if ai_response is None:
+                # Call OpenRouter API down the model chain
+                with trace.stage("llm"):
+                    response = await self.router.complete_async(
+                        self.get_client(), turn.messages, self.router.choose_models(user_message), trace,
+                        max_tokens=200,
+                        temperature=0.7
+                    )
+                trace.record_usage(response.usage)
+                ai_response = response.choices[0].message.content
+            return self.finish_turn(user_message, ai_response, turn, trace)
+            
+        except Exception as e:
+            return self.fail_turn(user_message, e, trace, turn)
+        finally:
+            await asyncio.to_thread(self.persist)
+            self.record_trace(trace)
+
+    async def generate_response_stream(self, user_message: str) -> AsyncIterator[str]:
+        """Stream the response as text deltas"""
+        trace = TurnTrace(self.model, stream=True)
+        cleaner = ResponseStreamCleaner()
+        turn = None
+        emitted = False
+        stream = None
+        try:
+            # Count current exchanges, after resuming a returning lead
+            await asyncio.to_thread(self.resume)
+            turn = self.start_turn(user_message, trace)
+            if turn.response:
+                trace.first_token()
+                emitted = True
+                yield turn.response
+                return
             
-            # Check if we should suggest contact
-            if ((exchange_count >= target_timing or should_offer_early) and 
-                "CALENDLY_LINK" not in ai_response and "EMAIL" not in ai_response):
-                if any(word in user_message.lower() for word in ["cost", "price", "how much", "timeline", "when", "process", "bank", "banking"]):
-                    consultation_trigger = "I will put you in touch with one of our experts. Please, choose your preferred time in the calendar CALENDLY_LINK or via email EMAIL to discuss the details."
-                    if self.current_strategy:
-                        triggers = self.current_strategy.get('conversation_tactics', {}).get('consultation_triggers', [])
-                        if triggers:
-                            consultation_trigger = random.choice(triggers)
-                    ai_response += f" {consultation_trigger}"
+            if turn.cached is not None:
+                text = cleaner.feed(turn.cached)
+                if text:
+                    trace.first_token()
+                    emitted = True
+                    yield text
+            else:
+                # Call OpenRouter API down the model chain, the stage includes reading the stream
+                with trace.stage("llm"):
+                    stream, first_chunk = await self.router.open_stream_async(
+                        self.get_client(), turn.messages, self.router.choose_models(user_message), trace,
+                        max_tokens=200,
+                        temperature=0.7,
+                        stream_options={"include_usage": True}
+                    )
+                    async for chunk in prepend_chunk(first_chunk, stream):
+                        text = self.read_chunk(chunk, cleaner, trace)
+                        if text:
+                            trace.first_token()
+                            emitted = True
+                            yield text
+            text = cleaner.finish()
+            if text:
+                trace.first_token()
+                emitted = True
+                yield text
             
-            return ai_response
+            # Post-process once the full response is known
+            self.finish_turn(user_message, cleaner.raw, turn, trace)
+            if turn.trigger:
+                yield f" {turn.trigger}"
             
         except Exception as e:
-            print(f"Error generating response: {e}")
-            return "We can help with company formation across multiple jurisdictions. Which market are you considering?"
+            fallback = self.fail_turn(user_message, e, trace, turn, cleaner.raw.strip() if emitted else "")
+            if not emitted:
+                yield fallback
+        finally:
+            # Return the connection to the shared pool
+            if stream is not None:
+                await stream.close()
+            await asyncio.to_thread(self.persist)
+            self.record_trace(trace)
 
-    def clear_memory(self):
-        """Clear conversation history"""
-        self.conversation_history = []
+def warm_up_shared_resources(sync_client: bool = True) -> threading.Thread:
+    """Load what every session shares on a background thread, once per process.
+
+    New agents wait only for the resources they use at construction; the
+    OpenAI SDK (and the sync client) are ready by the time the first turn
+    needs them. Async agents build their client on their event loop.
+    """
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=load_shared_resources, args=(sync_client,),
+                                               name="agent-warm-up", daemon=True)
+            _warm_up_thread.start()
+        return _warm_up_thread
+
+def load_shared_resources(sync_client: bool = True):
+    telemetry = get_telemetry()
+    for name, load in (("knowledge_index", get_knowledge_index), ("intent_router", get_intent_router),
+                       ("prompt_template", get_prompt_template), ("response_cache", get_response_cache),
+                       ("session_store", get_session_store), ("openai_import", load_openai)):
+        with telemetry.startup_phase(name):
+            load()
+    if not sync_client:
+        return
+    try:
+        with telemetry.startup_phase("openai_client"):
+            get_client()
+    except ValueError:
+        # No API key yet, the agent reports it when it is created
+        pass
+
+def create_agent(lead_id: str = None):
+    return OpenRouterSalesAgent(lead_id=lead_id)
 
-def create_agent():
-    return OpenRouterSalesAgent()
+def create_async_agent(lead_id: str = None):
+    return AsyncOpenRouterSalesAgent(lead_id=lead_id)
@@ -0,0 +1,114 @@
+"""Re-learn the strategy offline from an archive of exported transcripts.
+
+    python batch_analyze.py transcripts/*.jsonl --workers 8
+
+Each JSONL line is one conversation, either a list of {"role", "content"}
+messages or an object with "messages" and optionally "link_shared",
+"consultation_requested" and "timestamp". Missing outcomes are read from
+the assistant messages like the app does.
+
+Conversations are analyzed on a process pool in windows of --window lines,
+so memory stays flat however large the archive is. Each window is appended
+to the strategy store in one transaction and folded into a single snapshot,
+instead of one append, refresh and save per conversation. The JSON strategy
+file is exported once at the end. To rebuild from scratch, point --store,
+--strategy-file, --archive-file and --analytics-file at new paths.
+"""
+import argparse
+import json
+import time
+from itertools import islice
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Optional
+from strategy_manager import StrategyManager, analyze_conversation_outcome
+
+def read_lines(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+def analyze_line(line: str) -> Optional[Dict]:
+    """Analysis of one transcript line, None if it is not a usable conversation"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if isinstance(record, list):
+        record = {"messages": record}
+    messages = record.get("messages") if isinstance(record, dict) else None
+    if not messages or not all(isinstance(m, dict) and "role" in m and "content" in m for m in messages):
+        return None
+
+    link_shared, consultation_requested = analyze_conversation_outcome(messages)
+    link_shared = record.get("link_shared", link_shared)
+    consultation_requested = record.get("consultation_requested", consultation_requested)
+    return StrategyManager.build_analysis(messages, link_shared, consultation_requested, record.get("timestamp"),
+                                         record.get("variant"))
+
+def analyze_batch(lines: List[str]) -> List[Optional[Dict]]:
+    return [analyze_line(line) for line in lines]
+
+def batches(lines: Iterator[str], size: int) -> Iterator[List[str]]:
+    while True:
+        batch = list(islice(lines, size))
+        if not batch:
+            return
+        yield batch
+
+def run(paths: List[str], manager: StrategyManager, workers: int = None, window: int = 10000,
+        chunk_size: int = 500, progress=print) -> Dict:
+    """Analyze every transcript and fold the results into the manager's store"""
+    stats = {"conversations": 0, "skipped": 0}
+    start = time.perf_counter()
+    with Pool(workers) as pool:
+        for lines in batches(read_lines(paths), window):
+            # Workers parse and analyze; results come back in input order
+            chunks = [lines[i:i + chunk_size] for i in range(0, len(lines), chunk_size)]
+            analyses = [analysis for chunk in pool.map(analyze_batch, chunks) for analysis in chunk]
+            events = [analysis for analysis in analyses if analysis is not None]
+            stats["skipped"] += len(analyses) - len(events)
+            stats["conversations"] += len(events)
+
+            with manager.lock:
+                manager.store.append_events(events)
+                manager.refresh()
+                manager.compact()
+            if progress:
+                rate = stats["conversations"] / (time.perf_counter() - start)
+                progress(f"{stats['conversations']} conversations analyzed ({rate:.0f}/s), {stats['skipped']} skipped")
+
+    manager.save_strategies()
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-learn the strategy from exported transcripts")
+    parser.add_argument("paths", nargs="+", help="JSONL transcript files")
+    parser.add_argument("--workers", type=int, help="worker processes, defaults to the CPU count")
+    parser.add_argument("--window", type=int, default=10000, help="transcripts read and folded at a time")
+    parser.add_argument("--chunk-size", type=int, default=500, help="transcripts per worker task")
+    parser.add_argument("--store", default="conversation_strategies.db")
+    parser.add_argument("--strategy-file", default="conversation_strategies.json")
+    parser.add_argument("--archive-file", default="conversation_archive.jsonl")
+    parser.add_argument("--analytics-file", default="conversation_analytics.npz")
+    parser.add_argument("--max-conversations", type=int, default=50)
+    parser.add_argument("--max-age-days", type=float)
+    args = parser.parse_args()
+
+    manager = StrategyManager(
+        strategy_file=args.strategy_file,
+        store_path=args.store,
+        archive_file=args.archive_file,
+        analytics_file=args.analytics_file,
+        max_conversations=args.max_conversations,
+        max_age_days=args.max_age_days
+    )
+    stats = run(args.paths, manager, args.workers, args.window, args.chunk_size)
+    metrics = manager.strategies["success_metrics"]
+    print(f"Done in {stats['seconds']:.1f}s: {stats['conversations']} conversations, {stats['skipped']} skipped, "
+          f"conversion rate {metrics['conversion_rate']:.1f}%, link timing {manager.strategies['timing_strategy']['link_timing']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Offline load test for the sales agent and strategy manager.
+
+    python benchmark.py --sessions 1 8 32 --latency 0.3 --tokens-per-second 80
+
+Runs scripted multi-turn conversations against a local mock OpenRouter
+server and reports turn latency percentiles, throughput per concurrency
+level, strategy-save cost against history size and memory per session.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from mock_openrouter import get_base_url, start_mock_server
+
+# The four sidebar test scenarios with scripted follow-ups
+SCENARIOS = [
+    [
+        "I'm looking to set up a company in Singapore. What do I need to know?",
+        "We are an ecommerce business selling electronics.",
+        "Do we need a local director?",
+        "What about opening a bank account there?",
+        "How much would all of this cost?"
+    ],
+    [
+        "How much does it cost to incorporate in Hong Kong and what's the timeline?",
+        "We trade textiles with Europe.",
+        "Is the 8.25% tax rate available for us?",
+        "Can you help with the banking too?"
+    ],
+    [
+        "What banking options are available for US companies?",
+        "I'm a non-resident from Germany.",
+        "Would Florida or New Mexico be better?",
+        "What's the process and timeline?"
+    ],
+    [
+        "I need to compare incorporation options between UK and Singapore for my tech startup",
+        "We plan to raise funding next year.",
+        "Which has better taxation for software revenue?",
+        "When could we get started?"
+    ]
+]
+
+JURISDICTION_NAMES = ["Singapore", "Hong Kong", "the UK", "the USA", "Malaysia", "Thailand"]
+INDUSTRIES = ["ecommerce", "consulting", "software", "trading", "logistics", "fintech"]
+FOLLOW_UPS = [
+    "What documents do you need from me?",
+    "How long does the whole process take?",
+    "Can you help with a corporate bank account?",
+    "What are the ongoing compliance requirements?",
+    "How much are the annual fees?",
+    "Is it urgent to decide this month?"
+]
+
+def generate_conversations(count: int, seed: int = 7) -> List[List[str]]:
+    """The sidebar scenarios plus generated variants"""
+    rng = random.Random(seed)
+    conversations = [list(scenario) for scenario in SCENARIOS]
+    while len(conversations) < count:
+        jurisdiction = rng.choice(JURISDICTION_NAMES)
+        industry = rng.choice(INDUSTRIES)
+        conversation = [f"I want to open a {industry} company in {jurisdiction}. Where do I start?"]
+        conversation += rng.sample(FOLLOW_UPS, rng.randint(2, 5))
+        conversations.append(conversation)
+    return conversations[:count]
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def new_agent(strategy: Dict, use_response_cache: bool):
+    from agent_openrouter import create_agent
+    from response_cache import ResponseCache
+
+    agent = create_agent()
+    if not use_response_cache:
+        agent.response_cache = ResponseCache(max_entries=0, similarity_threshold=None)
+    agent.set_strategy_context(strategy)
+    return agent
+
+def run_conversation(messages: List[str], strategy: Dict, stream: bool, use_response_cache: bool) -> List[float]:
+    agent = new_agent(strategy, use_response_cache)
+    latencies = []
+    for message in messages:
+        start = time.perf_counter()
+        if stream:
+            # Time to first token is what the lead notices; drain the rest so
+            # the turn is recorded like it is in the app
+            first_token = None
+            for _ in agent.generate_response_stream(message):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+            latencies.append(first_token if first_token is not None else time.perf_counter() - start)
+        else:
+            agent.generate_response(message)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+def bench_concurrency(session_counts: List[int], conversations_per_session: int, strategy: Dict,
+                      stream: bool, use_response_cache: bool) -> List[Dict]:
+    results = []
+    for sessions in session_counts:
+        conversations = generate_conversations(sessions * conversations_per_session)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            futures = [pool.submit(run_conversation, conversation, strategy, stream, use_response_cache) for conversation in conversations]
+            latencies = [latency for future in futures for latency in future.result()]
+        elapsed = time.perf_counter() - start
+        results.append({
+            "sessions": sessions,
+            "turns": len(latencies),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "turns_per_second": len(latencies) / elapsed
+        })
+    return results
+
+def bench_strategy_save(history_sizes: List[int], repeats: int = 20) -> List[Dict]:
+    """Cost of analyze_conversation_success against the number of logged conversations"""
+    from strategy_manager import StrategyManager
+
+    messages = [
+        {"role": "user", "content": SCENARIOS[1][0]},
+        {"role": "assistant", "content": "Sure, no problem. Pricing is customized. I will put you in touch with one of our experts. CALENDLY_LINK"}
+    ]
+    results = []
+    for size in history_sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = StrategyManager(
+                strategy_file=os.path.join(tmp, "strategies.json"),
+                store_path=os.path.join(tmp, "strategies.db"),
+                archive_file=os.path.join(tmp, "archive.jsonl"),
+                analytics_file=os.path.join(tmp, "analytics.npz")
+            )
+            for _ in range(size):
+                manager.analyze_conversation_success(messages, True, True)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                manager.analyze_conversation_success(messages, True, True)
+            elapsed = (time.perf_counter() - start) / repeats
+            manager.store.close()
+        results.append({"history_size": size, "save_ms": elapsed * 1000})
+    return results
+
+def bench_memory(sessions: int, strategy: Dict) -> Dict:
+    """Average traced memory of an agent after a full scripted conversation"""
+    agents = []
+    # Shared resources, the lazily created client included, are not per-session cost
+    new_agent(strategy, False).generate_response(SCENARIOS[0][0])
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for conversation in generate_conversations(sessions):
+        agent = new_agent(strategy, False)
+        for message in conversation:
+            agent.generate_response(message)
+        agents.append(agent)
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return {"sessions": sessions, "bytes_per_session": used / sessions}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sales agent against a local OpenRouter stand-in")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32], help="concurrency levels to run")
+    parser.add_argument("--conversations-per-session", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.3, help="mock time to first token in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="mock token rate, 0 for instant")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock requests that fail with a 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="share of mock requests that stall before the first token")
+    parser.add_argument("--stall-seconds", type=float, default=5.0)
+    parser.add_argument("--hedge-after", type=float, help="seconds before the router sends a hedged request")
+    parser.add_argument("--deadline", type=float, help="per-turn deadline for the model call")
+    parser.add_argument("--stream", action="store_true", help="measure time to first token on the streaming path")
+    parser.add_argument("--response-cache", action="store_true", help="keep the shared response cache enabled")
+    parser.add_argument("--history-sizes", type=int, nargs="+", default=[0, 100, 1000])
+    parser.add_argument("--memory-sessions", type=int, default=50)
+    parser.add_argument("--json", help="write results to this file for regression tracking")
+    args = parser.parse_args()
+
+    server = start_mock_server(latency=args.latency, tokens_per_second=args.tokens_per_second, error_rate=args.error_rate,
+                               stall_rate=args.stall_rate, stall_seconds=args.stall_seconds)
+    os.environ["OPENROUTER_BASE_URL"] = get_base_url(server)
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+    if args.hedge_after is not None:
+        os.environ["OPENROUTER_HEDGE_AFTER"] = str(args.hedge_after)
+    if args.deadline is not None:
+        os.environ["OPENROUTER_DEADLINE"] = str(args.deadline)
+
+    from strategy_manager import StrategyManager
+    strategy = StrategyManager.get_default_strategies()
+
+    results = {
+        "config": vars(args),
+        "concurrency": bench_concurrency(args.sessions, args.conversations_per_session, strategy, args.stream, args.response_cache),
+        "strategy_save": bench_strategy_save(args.history_sizes),
+        "memory": bench_memory(args.memory_sessions, strategy)
+    }
+    from telemetry import get_telemetry
+    results["telemetry"] = get_telemetry().summary()
+    server.shutdown()
+
+    print("Turn latency" + (" (time to first token)" if args.stream else ""))
+    print(f"{'sessions':>8} {'turns':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'turns/s':>8}")
+    for row in results["concurrency"]:
+        print(f"{row['sessions']:>8} {row['turns']:>6} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['turns_per_second']:>8.1f}")
+    print("\nStrategy save cost")
+    for row in results["strategy_save"]:
+        print(f"  {row['history_size']:>6} logged conversations: {row['save_ms']:.2f} ms")
+    memory = results["memory"]
+    print(f"\nMemory: {memory['bytes_per_session'] / 1024:.1f} KiB per session ({memory['sessions']} sessions)")
+    telemetry = get_telemetry()
+    print(f"\nModel calls: {telemetry.model_calls}, retries {telemetry.retries}, "
+          f"hedges won/lost {telemetry.hedges['won']}/{telemetry.hedges['lost']}, fallbacks {telemetry.turns['fallback']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import re
+from typing import Dict, Sequence
+from intent_matcher import classify
+
+TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def count_tokens(text: str) -> int:
+    """Approximate LLM token count without a tokenizer download.
+
+    Punctuation is one token and words are one token per ~6 characters,
+    which tracks BPE tokenizers closely enough for budgeting English text.
+    """
+    return sum(1 + len(piece) // 6 for piece in TOKEN_PIECES.findall(text))
+
+def first_sentence(text: str, max_chars: int = 100) -> str:
+    sentence = SENTENCE_END.split(text.strip(), 1)[0]
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars].rsplit(" ", 1)[0] + "..."
+    return sentence
+
+def select_recent(messages: Sequence, token_budget: int) -> int:
+    """Index of the oldest message that still fits the budget, newest first.
+
+    Messages are conversation_memory records, which count their tokens once.
+    """
+    start = len(messages)
+    used = 0
+    while start > 0:
+        tokens = messages[start - 1].tokens + 2
+        if used + tokens > token_budget:
+            break
+        used += tokens
+        start -= 1
+    return start
+
+class ConversationSummary:
+    """Running extractive summary of turns that dropped out of the prompt window.
+
+    Turns are folded in once, as they leave the window, so the summary text
+    is reused across turns instead of being recomputed from the transcript.
+    """
+
+    def __init__(self, max_tokens: int = 150):
+        self.max_tokens = max_tokens
+        self.clear()
+
+    def clear(self):
+        self.points = []
+        self.topics = []
+        self.link_shared = False
+        self.text = ""
+
+    def state(self) -> Dict:
+        """What the summary needs to be restored, e.g. for a stored session"""
+        return {"points": self.points, "topics": self.topics, "link_shared": self.link_shared}
+
+    def restore(self, state: Dict):
+        self.points = list(state.get("points", []))
+        self.topics = list(state.get("topics", []))
+        self.link_shared = bool(state.get("link_shared"))
+        self.render()
+
+    def add(self, role: str, content: str):
+        for topic in classify(content).topics:
+            if topic not in self.topics:
+                self.topics.append(topic)
+        if role == 'user':
+            self.points.append(first_sentence(content))
+        elif "CALENDLY_LINK" in content or "EMAIL" in content:
+            self.link_shared = True
+        self.render()
+
+    def render(self):
+        # Drop the oldest lead points until the summary fits its budget
+        while True:
+            parts = []
+            if self.points:
+                parts.append("Lead said: " + " / ".join(self.points))
+            if self.topics:
+                parts.append("Topics: " + ", ".join(topic.replace("_", " ") for topic in self.topics))
+            if self.link_shared:
+                parts.append("Consultation link already shared.")
+            self.text = "; ".join(parts)
+            if len(self.points) <= 1 or count_tokens(self.text) <= self.max_tokens:
+                return
+            self.points.pop(0)
@@ -0,0 +1,182 @@
+"""Incremental analysis of one conversation, for learning and live decisions.
+
+Every message is classified and scanned once, as it is added; the running
+counts, topics, flow markers and candidate phrases are what
+StrategyManager learns from. Finalizing only copies them into an analysis
+record, however long the conversation got, and the outcome (link shared,
+consultation requested, call accepted) and lead style can be read at any
+turn. The consultant's replies decide the first two; whether the lead
+accepted or asked for the call is read from the lead's replies after the
+link went out.
+"""
+import re
+from datetime import datetime
+from typing import Dict, List
+from intent_matcher import classify
+
+OPENING_MARKERS = ("Sure", "Yes", "Happy to help", "Let me share", "No problem")
+TRANSITION_STARTS = ("We have", "We work", "Our team")
+
+# Lead replies that accept or ask for the call, unless they also put it off
+ACCEPT_PATTERN = re.compile(
+    r"\b(?:book\w*|schedul\w*|call|meeting|appointment|slot|calendar|yes|sure|ok|okay|great|perfect|"
+    r"sounds good|let's|will do|see you)\b"
+)
+DECLINE_PATTERN = re.compile(r"\b(?:no(?! problem)|not|don't|dont|later|maybe|think about it|not now)\b")
+
+def opening_phrases(content: str) -> List[str]:
+    """Opening phrases of a consultant reply, e.g. "Sure, no problem" """
+    phrases = []
+    for sentence in content.split('. '):
+        if any(start in sentence for start in OPENING_MARKERS):
+            phrase = sentence.strip().split('.')[0][:50]
+            if phrase:
+                phrases.append(phrase)
+    return phrases
+
+def accepts_call(content: str) -> bool:
+    """Whether a lead reply accepts or asks for the call, e.g. "Great, I'll book a slot" """
+    lower = content.lower()
+    return ACCEPT_PATTERN.search(lower) is not None and DECLINE_PATTERN.search(lower) is None
+
+def transition_sentences(content: str) -> List[str]:
+    """Sentences where the consultant builds credibility, e.g. "We have many clients..." """
+    transitions = []
+    for sentence in content.split('. '):
+        sentence = sentence.strip()
+        if sentence.startswith(TRANSITION_STARTS):
+            transitions.append(sentence.split('.')[0][:80])
+    return transitions
+
+class ConversationAnalyzer:
+    """Running features of one conversation, updated in O(len(message)) per message"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.user_messages = 0
+        self.user_words = 0
+        self.user_questions = 0
+        # User message count when the link first went out, 0 if it never did
+        self.link_exchange = 0
+        self.link_shared = False
+        self.consultation_requested = False
+        # The lead accepted or asked for the call after the link went out
+        self.call_accepted = False
+        # Link timing of the strategy the replies were given under, 0 if unknown
+        self.link_timing = 0
+        # Dict keys as an ordered set
+        self.topics = {}
+        self.phrases = []
+        self.transitions = []
+        self.flow = []
+
+    def add(self, role: str, content: str):
+        intents = classify(content)
+        self.topics.update(dict.fromkeys(intents.topics))
+        if role == "user":
+            self.user_messages += 1
+            self.user_words += len(content.split())
+            if "?" in content:
+                self.user_questions += 1
+            if self.link_shared and not self.call_accepted and accepts_call(content):
+                self.call_accepted = True
+            return
+        if not self.link_exchange and ("CALENDLY_LINK" in content or "EMAIL" in content):
+            self.link_exchange = self.user_messages
+        if role != "assistant":
+            return
+        upper = content.upper()
+        if "CALENDLY_LINK" in upper or "EMAIL" in upper:
+            self.link_shared = True
+        if "CONSULTATION" in upper or "EXPERTS" in upper or "CONSULTANTS" in upper:
+            self.consultation_requested = True
+        self.phrases.extend(opening_phrases(content))
+        self.transitions.extend(transition_sentences(content))
+        self.flow.extend(intents.flow_markers)
+
+    @property
+    def link_answered(self) -> bool:
+        """The link went out and the lead has replied since, so the call outcome is known"""
+        return self.link_shared and self.user_messages > self.link_exchange
+
+    @property
+    def engagement(self) -> float:
+        if not self.user_messages:
+            return 0.0
+        return min(self.user_words / self.user_messages / 15, 1.0)
+
+    @property
+    def user_style(self) -> str:
+        if not self.user_messages:
+            return "unknown"
+        avg_length = self.user_words / self.user_messages
+        if avg_length < 5:
+            return "brief"
+        elif avg_length > 20:
+            return "detailed"
+        elif self.user_questions > 2:
+            return "inquisitive"
+        else:
+            return "standard"
+
+    def finalize(self, link_shared: bool = None, consultation_requested: bool = None, timestamp: str = None,
+                 variant: str = None) -> Dict:
+        """Analysis record for StrategyManager; the outcome defaults to what was seen in the replies"""
+        link_shared = self.link_shared if link_shared is None else link_shared
+        consultation_requested = self.consultation_requested if consultation_requested is None else consultation_requested
+        return {
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "variant": variant,
+            "message_count": self.user_messages,
+            "link_exchange": self.link_exchange,
+            "link_timing": self.link_timing,
+            "link_shared": link_shared,
+            "consultation_requested": consultation_requested,
+            "call_accepted": self.call_accepted,
+            "user_engagement": self.engagement,
+            "topics_discussed": list(self.topics),
+            "successful_phrases": list(self.phrases) if link_shared else [],
+            "phrases_used": list(self.phrases),
+            "transitions_used": list(self.transitions),
+            "conversation_flow": list(self.flow),
+            "user_response_style": self.user_style
+        }
+
+    def state(self) -> Dict:
+        """What the analyzer needs to be restored, e.g. for a stored session"""
+        return {
+            "user_messages": self.user_messages,
+            "user_words": self.user_words,
+            "user_questions": self.user_questions,
+            "link_exchange": self.link_exchange,
+            "link_timing": self.link_timing,
+            "link_shared": self.link_shared,
+            "consultation_requested": self.consultation_requested,
+            "call_accepted": self.call_accepted,
+            "topics": list(self.topics),
+            "phrases": self.phrases,
+            "transitions": self.transitions,
+            "flow": self.flow
+        }
+
+    def restore(self, state: Dict):
+        self.clear()
+        for key in ("user_messages", "user_words", "user_questions", "link_exchange", "link_timing"):
+            setattr(self, key, int(state.get(key, 0)))
+        self.link_shared = bool(state.get("link_shared"))
+        self.consultation_requested = bool(state.get("consultation_requested"))
+        self.call_accepted = bool(state.get("call_accepted"))
+        self.topics = dict.fromkeys(state.get("topics", []))
+        self.phrases = list(state.get("phrases", []))
+        self.transitions = list(state.get("transitions", []))
+        self.flow = list(state.get("flow", []))
+
+    @classmethod
+    def from_messages(cls, messages) -> "ConversationAnalyzer":
+        """Analyze a finished transcript in one pass"""
+        analyzer = cls()
+        for message in messages:
+            analyzer.add(message["role"], message["content"])
+        return analyzer
@@ -0,0 +1,147 @@
+"""Conversation transcript shared by the agent and the UI.
+
+Messages are slotted records in a bounded ring buffer. Appending never
+copies earlier messages, user turns are counted as they are appended and
+recent() returns views over the ring instead of sliced lists. Records
+support the message["role"] / message["content"] access the app and the
+strategy manager already use.
+"""
+import os
+import time
+from typing import Dict, Iterator, List, Optional
+from context_builder import count_tokens
+
+# Messages kept in RAM per conversation; older ones live on in the summary and the session store
+MEMORY_CAPACITY = int(os.environ.get("AGENT_MEMORY_CAPACITY", "200"))
+
+class Message:
+    __slots__ = ("role", "content", "timestamp", "_tokens")
+
+    def __init__(self, role: str, content: str, timestamp: float = None):
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self._tokens = None
+
+    @property
+    def tokens(self) -> int:
+        """Approximate token count, computed once"""
+        if self._tokens is None:
+            self._tokens = count_tokens(self.content)
+        return self._tokens
+
+    def __getitem__(self, key: str):
+        if key not in ("role", "content", "timestamp"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in ("role", "content", "timestamp")
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self else default
+
+    def to_dict(self) -> Dict:
+        return {"role": self.role, "content": self.content, "timestamp": self.timestamp}
+
+    def __repr__(self):
+        return f"Message({self.role!r}, {self.content!r})"
+
+class MemoryView:
+    """Read-only window over a ConversationMemory, by absolute message position"""
+    __slots__ = ("memory", "start", "stop")
+
+    def __init__(self, memory: "ConversationMemory", start: int, stop: int):
+        self.memory = memory
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("memory views do not support a step")
+            return MemoryView(self.memory, self.start + start, self.start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.memory.at(self.start + index)
+
+    def __iter__(self) -> Iterator[Message]:
+        for position in range(self.start, self.stop):
+            yield self.memory.at(position)
+
+class ConversationMemory:
+    """Bounded ring buffer of messages with an incremental user-turn count.
+
+    Positions are absolute: the n-th message ever appended has position n
+    and stays addressable until capacity newer messages push it out.
+    """
+
+    def __init__(self, capacity: int = MEMORY_CAPACITY):
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self):
+        self.slots = []
+        self.total = 0
+        self.user_turns = 0
+        # Position held by slots[0] until the ring wraps
+        self.base = 0
+
+    def restore(self, messages: List[Message], total: int, user_turns: int):
+        """Resume a stored conversation from its newest messages, which end at position total"""
+        messages = messages[-self.capacity:] if self.capacity else []
+        self.slots = list(messages)
+        self.total = total
+        self.user_turns = user_turns
+        self.base = total - len(messages)
+
+    def append(self, role: str, content: str, timestamp: float = None) -> Message:
+        message = Message(role, content, timestamp)
+        if len(self.slots) < self.capacity:
+            self.slots.append(message)
+        else:
+            self.slots[(self.total - self.base) % self.capacity] = message
+        self.total += 1
+        if role == "user":
+            self.user_turns += 1
+        return message
+
+    @property
+    def first_position(self) -> int:
+        """Position of the oldest message still held"""
+        return self.total - len(self.slots)
+
+    def at(self, position: int) -> Message:
+        if not self.first_position <= position < self.total:
+            raise IndexError(position)
+        return self.slots[(position - self.base) % self.capacity]
+
+    def recent(self, count: Optional[int] = None) -> MemoryView:
+        """View of the newest count messages, or all held messages"""
+        start = self.first_position if count is None else max(self.first_position, self.total - count)
+        return MemoryView(self, start, self.total)
+
+    def since(self, position: int) -> MemoryView:
+        """View of the messages from an absolute position on"""
+        return MemoryView(self, max(self.first_position, position), self.total)
+
+    def last(self) -> Optional[Message]:
+        return self.at(self.total - 1) if self.total else None
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __bool__(self):
+        return self.total > 0
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self.recent())
+
+    def __getitem__(self, index):
+        return self.recent()[index]
@@ -0,0 +1,243 @@
+import json
+import os
+from array import array
+from typing import Dict, List, Optional
+import numpy as np
+from intent_matcher import FLOW_GROUPS, JURISDICTIONS, TOPIC_GROUPS
+
+# Fixed vocabularies, stored as bit masks and codes
+TOPICS = JURISDICTIONS + list(TOPIC_GROUPS)
+FLOW_MARKERS = ["question_asked"] + list(FLOW_GROUPS)
+STYLES = ["unknown", "brief", "standard", "inquisitive", "detailed"]
+
+# Link timings the strategy may choose from
+LINK_TIMINGS = range(3, 7)
+
+class ItemColumn:
+    """Open-vocabulary multi-valued column (phrases, transitions) as (row, item id) pairs"""
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.rows = array('I')
+        self.items = array('I')
+
+    def add(self, row: int, names: List[str]):
+        for name in set(names):
+            item = self.ids.get(name)
+            if item is None:
+                item = self.ids[name] = len(self.names)
+                self.names.append(name)
+            self.rows.append(row)
+            self.items.append(item)
+
+    def arrays(self):
+        # Copies, a live view would stop the arrays from growing
+        return np.array(self.rows, dtype=np.uint32), np.array(self.items, dtype=np.uint32)
+
+class ConversionAnalytics:
+    """Columnar store of per-conversation features with vectorized conversion stats.
+
+    One row per analyzed conversation: message count, the exchange the link
+    was shared at, the link timing the strategy used, topic and flow-marker
+    bit masks, user style, engagement and outcomes, plus phrase and
+    transition pairs. Rates are smoothed towards the overall conversion rate
+    so rare values need support before they can win, and lift is the
+    smoothed rate over the overall rate.
+
+    Link timings are compared on the lead accepting or asking for the call
+    after the link, among all conversations run under each timing: the link
+    itself, and the consultant's own mention of a consultation, go out at
+    whatever timing is in effect, so their rates would always favour the
+    current timing. Sharing the link too early loses leads that were not
+    ready, too late loses the ones that left first.
+    """
+    columns = {
+        "message_count": np.uint16,
+        "link_exchange": np.uint16,
+        "link_timing": np.uint8,
+        "topics": np.uint32,
+        "flow": np.uint16,
+        "style": np.uint8,
+        "engagement": np.float32,
+        "converted": np.bool_,
+        "consulted": np.bool_,
+        "accepted": np.bool_,
+    }
+
+    def __init__(self, capacity: int = 1024, prior_strength: float = 10.0, min_support: int = 5):
+        self.size = 0
+        self.data = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.columns.items()}
+        self.phrases = ItemColumn()
+        self.transitions = ItemColumn()
+        self.prior_strength = prior_strength
+        self.min_support = min_support
+        self.last_event_id = 0
+
+    def add(self, analysis: Dict):
+        """Append one conversation analysis from StrategyManager.build_analysis"""
+        if self.size == len(self.data["converted"]):
+            for name, column in self.data.items():
+                self.data[name] = np.resize(column, len(column) * 2)
+        row = self.size
+        converted = bool(analysis.get("link_shared"))
+        message_count = analysis.get("message_count", 0)
+        flow = analysis.get("conversation_flow", [])
+        style = analysis.get("user_response_style", "unknown")
+
+        self.data["message_count"][row] = message_count
+        # Older records have no link exchange; successes were analyzed when the link went out
+        self.data["link_exchange"][row] = analysis.get("link_exchange", message_count if converted else 0)
+        # Older records do not know the timing they ran under
+        self.data["link_timing"][row] = min(analysis.get("link_timing") or 0, 255)
+        self.data["topics"][row] = sum(1 << TOPICS.index(topic) for topic in set(analysis.get("topics_discussed", [])) if topic in TOPICS)
+        self.data["flow"][row] = sum(1 << FLOW_MARKERS.index(marker) for marker in set(flow) if marker in FLOW_MARKERS)
+        self.data["style"][row] = STYLES.index(style) if style in STYLES else 0
+        self.data["engagement"][row] = analysis.get("user_engagement", 0.0)
+        self.data["converted"][row] = converted
+        self.data["consulted"][row] = bool(analysis.get("consultation_requested"))
+        self.data["accepted"][row] = bool(analysis.get("call_accepted"))
+        # Older records only kept phrases of successful conversations
+        self.phrases.add(row, analysis.get("phrases_used", analysis.get("successful_phrases", [])))
+        self.transitions.add(row, analysis.get("transitions_used", []))
+        self.size += 1
+
+    def column(self, name: str) -> np.ndarray:
+        return self.data[name][:self.size]
+
+    @property
+    def base_rate(self) -> float:
+        return float(self.column("converted").mean()) if self.size else 0.0
+
+    def smooth(self, counts: np.ndarray, wins: np.ndarray, base: float = None):
+        """Rates smoothed towards the overall rate, and their lift over it"""
+        base = self.base_rate if base is None else base
+        smoothed = (wins + self.prior_strength * base) / (counts + self.prior_strength)
+        lift = smoothed / base if base else np.zeros_like(smoothed)
+        return smoothed, lift
+
+    def summarize(self, counts: np.ndarray, wins: np.ndarray, names: List, base: float = None) -> Dict:
+        """Per-value conversations, raw rate, smoothed rate and lift"""
+        smoothed, lift = self.smooth(counts, wins, base)
+        return {
+            name: {"conversations": int(n), "conversion_rate": float(w / n) if n else 0.0,
+                   "smoothed_rate": float(s), "lift": float(l)}
+            for name, n, w, s, l in zip(names, counts, wins, smoothed, lift)
+            if n
+        }
+
+    def rates_by_bits(self, column: str, names: List[str]) -> Dict:
+        bits = (self.column(column)[:, None] >> np.arange(len(names), dtype=np.uint32)) & 1
+        converted = self.column("converted")
+        return self.summarize(bits.sum(axis=0), bits[converted].sum(axis=0), names)
+
+    def rates_by_code(self, values: np.ndarray, names: List) -> Dict:
+        converted = self.column("converted")
+        counts = np.bincount(values, minlength=len(names))[:len(names)]
+        wins = np.bincount(values, weights=converted, minlength=len(names))[:len(names)]
+        return self.summarize(counts, wins, names)
+
+    def item_counts(self, items: ItemColumn):
+        rows, ids = items.arrays()
+        counts = np.bincount(ids, minlength=len(items.names))
+        wins = np.bincount(ids, weights=self.column("converted")[rows], minlength=len(items.names))
+        return counts, wins
+
+    def rates_by_item(self, items: ItemColumn) -> Dict:
+        return self.summarize(*self.item_counts(items), items.names)
+
+    def top_items(self, items: ItemColumn, top_k: int) -> Dict:
+        """Items with enough support and positive lift, best first"""
+        counts, wins = self.item_counts(items)
+        _, lift = self.smooth(counts, wins)
+        eligible = np.flatnonzero((counts >= self.min_support) & (lift > 1.0))
+        order = eligible[np.argsort(-lift[eligible], kind="stable")[:top_k]]
+        return self.summarize(counts[order], wins[order], [items.names[i] for i in order])
+
+    def rates_by_topic(self) -> Dict:
+        return self.rates_by_bits("topics", TOPICS)
+
+    def rates_by_flow(self) -> Dict:
+        return self.rates_by_bits("flow", FLOW_MARKERS)
+
+    def rates_by_style(self) -> Dict:
+        return self.rates_by_code(self.column("style"), STYLES)
+
+    def rates_by_link_timing(self) -> Dict:
+        """Rate of leads accepting the call by the link timing the conversation ran under"""
+        timing = self.column("link_timing")
+        known = timing > 0
+        accepted = self.column("accepted")[known]
+        values = np.minimum(timing[known], 20)
+        counts = np.bincount(values, minlength=21)[:21]
+        wins = np.bincount(values, weights=accepted, minlength=21)[:21]
+        base = float(accepted.mean()) if len(accepted) else 0.0
+        return self.summarize(counts, wins, list(range(21)), base)
+
+    def rates_by_phrase(self) -> Dict:
+        return self.rates_by_item(self.phrases)
+
+    def rates_by_transition(self) -> Dict:
+        return self.rates_by_item(self.transitions)
+
+    def choose_link_timing(self) -> Optional[int]:
+        rates = self.rates_by_link_timing()
+        candidates = [(rates[t]["smoothed_rate"], t) for t in LINK_TIMINGS
+                      if t in rates and rates[t]["conversations"] >= self.min_support]
+        return max(candidates)[1] if candidates else None
+
+    def choose_phrases(self, top_k: int = 4) -> List[str]:
+        return list(self.top_items(self.phrases, top_k))
+
+    def choose_transitions(self, top_k: int = 3) -> List[str]:
+        return list(self.top_items(self.transitions, top_k))
+
+    def report(self, top_k: int = 5) -> Dict:
+        """Compact summary for the strategy file and the sidebar"""
+        return {
+            "conversations": self.size,
+            "conversion_rate": self.base_rate * 100,
+            "by_topic": self.rates_by_topic(),
+            "by_style": self.rates_by_style(),
+            "by_link_timing": {str(t): stats for t, stats in self.rates_by_link_timing().items()},
+            "top_phrases": self.top_items(self.phrases, top_k),
+            "top_transitions": self.top_items(self.transitions, top_k)
+        }
+
+    def save(self, path: str, last_event_id: int):
+        """Write the store atomically, tagged with the last event it includes"""
+        self.last_event_id = last_event_id
+        phrase_rows, phrase_items = self.phrases.arrays()
+        transition_rows, transition_items = self.transitions.arrays()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                last_event_id=np.array(last_event_id),
+                phrase_rows=phrase_rows, phrase_items=phrase_items,
+                phrase_names=np.array(json.dumps(self.phrases.names)),
+                transition_rows=transition_rows, transition_items=transition_items,
+                transition_names=np.array(json.dumps(self.transitions.names)),
+                **{name: self.column(name) for name in self.columns}
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["ConversionAnalytics"]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                analytics = cls(capacity=max(1024, len(data["converted"])))
+                analytics.size = len(data["converted"])
+                for name in cls.columns:
+                    analytics.data[name][:analytics.size] = data[name]
+                for items, prefix in ((analytics.phrases, "phrase"), (analytics.transitions, "transition")):
+                    items.names = json.loads(str(data[f"{prefix}_names"]))
+                    items.ids = {name: i for i, name in enumerate(items.names)}
+                    items.rows = array('I', data[f"{prefix}_rows"].tobytes())
+                    items.items = array('I', data[f"{prefix}_items"].tobytes())
+                analytics.last_event_id = int(data["last_event_id"])
+            return analytics
+        except Exception:
+            return None
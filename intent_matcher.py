@@ -0,0 +1,125 @@
+import re
+from functools import lru_cache
+from typing import List
+
+# Keyword groups matched on word boundaries; a trailing * also matches any
+# word ending (bank* -> banks, banking) and spaces match any whitespace
+KEYWORD_GROUPS = {
+    # Jurisdictions
+    "singapore": ["singapore*"],
+    "hong_kong": ["hong kong", "hk"],
+    "usa": ["usa", "america*", "florida", "new mexico"],
+    "uk": ["uk", "britain", "british", "united kingdom"],
+    "malaysia": ["malaysia*"],
+    "thailand": ["thailand", "thai"],
+    # Lead intents
+    "cost": ["cost*", "price*", "pricing", "how much", "expensive"],
+    "bank": ["bank*"],
+    "account": ["account", "accounts"],
+    "payment": ["payment*"],
+    "urgent": ["urgent*", "asap", "quick", "quickly", "fast", "immediate*"],
+    "timeline": ["timeline*"],
+    "when": ["when"],
+    "process": ["process*"],
+    "incorporation": ["incorporat*", "company", "companies", "setup", "set up", "formation"],
+    "business": ["business*"],
+    "tax": ["tax*"],
+    "rate": ["rate", "rates"],
+    # Consultant flow markers
+    "contact": ["calendly*", "email"],
+    "week": ["week*"],
+}
+
+JURISDICTIONS = ["singapore", "hong_kong", "usa", "uk", "malaysia", "thailand"]
+
+# Topics tracked by the strategy manager and the groups that signal them
+TOPIC_GROUPS = {
+    "pricing": ("cost",),
+    "urgency": ("timeline", "urgent"),
+    "banking": ("bank",),
+    "taxation": ("tax",),
+}
+
+# Consultant flow markers and the groups that signal them
+FLOW_GROUPS = {
+    "consultation_offered": ("contact",),
+    "banking_discussed": ("bank", "payment"),
+    "taxation_discussed": ("tax",),
+    "timeline_discussed": ("timeline", "week"),
+}
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset("a an and are as at be can could do does for from i in is it me my of on or our please the to we what which will with would you your".split())
+
+def compile_keyword_pattern(groups: dict) -> re.Pattern:
+    """Compile all keyword groups into one alternation with a named group each"""
+    alternatives = []
+    for name, keywords in groups.items():
+        parts = []
+        for keyword in keywords:
+            part = r"\s+".join(re.escape(word) for word in keyword.rstrip("*").split())
+            if keyword.endswith("*"):
+                part += r"\w*"
+            parts.append(part)
+        alternatives.append(f"(?P<{name}>{'|'.join(parts)})")
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+
+KEYWORD_PATTERN = compile_keyword_pattern(KEYWORD_GROUPS)
+
+class MessageIntents:
+    """Keyword groups, jurisdictions and counts read from one message"""
+    __slots__ = ("lower", "groups", "jurisdictions", "words", "word_count", "has_question")
+
+    def __init__(self, text: str):
+        self.lower = text.lower()
+        self.word_count = len(text.split())
+        self.has_question = "?" in text
+        self.words = frozenset(WORD_PATTERN.findall(self.lower))
+
+        # Single pass over the message for every keyword group
+        found = []
+        for match in KEYWORD_PATTERN.finditer(self.lower):
+            if match.lastgroup not in found:
+                found.append(match.lastgroup)
+        self.groups = frozenset(found)
+        self.jurisdictions = tuple(name for name in found if name in JURISDICTIONS)
+
+    def has(self, *groups: str) -> bool:
+        """Check whether any of the keyword groups was found"""
+        return any(group in self.groups for group in groups)
+
+    def mentions(self, term: str) -> bool:
+        """Check for an arbitrary word or phrase, e.g. a learned trigger"""
+        term = term.lower().strip()
+        if " " not in term:
+            return term in self.words
+        return re.search(r"\b" + r"\s+".join(map(re.escape, term.split())) + r"\b", self.lower) is not None
+
+    @property
+    def canonical_terms(self) -> List[str]:
+        """Content words with keywords replaced by their group name, e.g. hk -> hong_kong"""
+        text = KEYWORD_PATTERN.sub(lambda match: f" {match.lastgroup} ", self.lower)
+        return [word for word in WORD_PATTERN.findall(text) if word not in STOPWORDS]
+
+    @property
+    def topics(self) -> List[str]:
+        """Jurisdictions and tracked topics discussed in the message"""
+        topics = list(self.jurisdictions)
+        for topic, groups in TOPIC_GROUPS.items():
+            if self.has(*groups):
+                topics.append(topic)
+        return topics
+
+    @property
+    def flow_markers(self) -> List[str]:
+        """Consultant flow markers found in the message"""
+        flow = ["question_asked"] if self.has_question else []
+        for marker, groups in FLOW_GROUPS.items():
+            if self.has(*groups):
+                flow.append(marker)
+        return flow
+
+@lru_cache(maxsize=4096)
+def classify(text: str) -> MessageIntents:
+    """Classify a message once; repeated calls with the same text are free"""
+    return MessageIntents(text)
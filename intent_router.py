@@ -0,0 +1,351 @@
+"""Local intent router that answers deterministic turns without a model call.
+
+A multinomial logistic regression over hashed word unigrams and bigrams
+scores every turn in microseconds. Pricing questions, booking requests and
+requests to reject (illegal activity, sanctioned countries) are answered
+from templates when the router is confident; anything else, including
+mixed questions, goes to OpenRouter. The model trains on the examples below
+(plus INTENT_TRAINING_FILE, JSONL lines with "text" and "intent") the first
+time it is needed and is kept as a NumPy weight file, retrained whenever
+the examples change. A sanctions answer also needs a sanctioned country
+named in the message.
+
+    python intent_router.py  # trains if needed and runs ROUTING_CHECKS
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import zlib
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import numpy as np
+from telemetry import Histogram, get_telemetry
+
+WEIGHTS_FILE = os.environ.get("INTENT_ROUTER_FILE", "intent_router.npz")
+TRAINING_FILE = os.environ.get("INTENT_TRAINING_FILE")
+# Minimum probability for answering from a template
+CONFIDENCE_THRESHOLD = float(os.environ.get("INTENT_ROUTER_THRESHOLD", "0.8"))
+
+FEATURE_BITS = 13
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+# "other" turns go to the model
+INTENTS = ("other", "pricing", "booking", "illegal", "sanctioned")
+
+JURISDICTION_NAMES = ["Singapore", "Hong Kong", "HK", "the UK", "the US", "the USA", "Malaysia", "Thailand", "Florida"]
+SERVICES = ["incorporation", "company setup", "company formation", "bank account opening", "accounting", "company secretary", "nominee director", "registered address"]
+SANCTIONED = ["Myanmar", "North Korea", "Iran", "Syria", "Cuba", "Crimea", "Russia", "Belarus", "Venezuela", "Afghanistan"]
+SANCTIONED_NATIONALITIES = ["Burmese", "North Korean", "Iranian", "Syrian", "Cuban", "Crimean", "Russian", "Belarusian", "Venezuelan", "Afghan"]
+# Lawful countries filled into the sanctioned templates as "other", so only the country carries the signal
+COUNTRIES = ["India", "China", "Germany", "Australia", "Singapore", "Malaysia", "Dubai", "France", "Brazil", "Japan", "Canada", "the UK"]
+NATIONALITIES = ["Indian", "Chinese", "German", "Australian", "Singaporean", "Malaysian", "French", "Brazilian", "Japanese", "Canadian", "British", "American"]
+# A sanctioned answer also needs one of these in the message, whatever the classifier says
+SANCTIONED_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(name) for name in SANCTIONED + SANCTIONED_NATIONALITIES + ["Burma", "DPRK"]) + r")\b",
+    re.IGNORECASE
+)
+
+TRAINING_TEMPLATES = {
+    "pricing": [
+        "How much does it cost?", "How much do you charge?", "What are your fees?", "What is the price?",
+        "Can you send me a price list?", "How much is {service}?", "What does {service} cost?",
+        "How much for {service} in {place}?", "What are your fees for {service}?", "Is it expensive?",
+        "Give me a quote", "Can I get a quote for {service}?", "What is your pricing for {place}?",
+        "How much would it cost me in total?", "Price please", "What's the cost of {service} in {place}?",
+        "Do you have a fee schedule?", "How much are your packages?", "What is the total cost?",
+        "how much", "cost?", "What are the charges for {service}?", "What's your rate for {service}?",
+        "How much does it cost to set up a company?", "What's the price of opening a company in {place}?",
+        "How much is the annual fee?", "fees?", "What would the yearly fees be?",
+    ],
+    "booking": [
+        "Can we schedule a call?", "I want to book a consultation", "Let's set up a meeting",
+        "Can I speak to someone?", "I'd like to talk to an expert", "How do I book a call?",
+        "Send me the calendar link", "Can someone call me?", "I want to proceed, how do we start?",
+        "Let's talk", "Book me in", "Can we have a meeting tomorrow?", "I'd like a consultation about {service}",
+        "Please arrange a call with your consultant", "Can I talk to a consultant about {place}?",
+        "Let's get started", "I'm ready to sign up",
+        "Can I schedule a meeting to discuss {service} in {place}?", "Connect me with your team",
+        "I want to speak with an advisor", "Call me please",
+    ],
+    "illegal": [
+        "Can you help me launder money?", "I want to hide money from the tax authorities",
+        "Can I set up a company to evade taxes?", "I need a shell company to hide the real owner from the bank",
+        "Can you open an account with fake documents?", "Help me avoid sanctions through {place}",
+        "I want to move money without the bank knowing the source", "Can you backdate documents for me?",
+        "I need fake invoices for my company", "Can you register a company under someone else's name to hide me?",
+        "How do I hide assets from my creditors?", "We sell drugs online and need a company in {place}",
+        "I need to get around anti money laundering checks", "Can you bypass KYC for me?",
+        "Set up a company so my ex wife can't find my money", "I want to do tax evasion through {place}",
+        "Help me hide income from the IRS", "Can I use a nominee to conceal that I'm sanctioned?",
+        "We run an unlicensed gambling site", "Can you help with money laundering?",
+        "How do I evade taxes with a company in {place}?", "I don't want to declare my profits to the tax office",
+        "Can I take money out of my company without declaring it?", "Help me pay no tax by hiding the income offshore",
+    ],
+    "sanctioned": [
+        "I am from {sanctioned}", "I'm a resident of {sanctioned}", "Our clients are in {sanctioned}",
+        "Can you set up a company for a {nationality} citizen?", "We do business with {sanctioned}",
+        "The shareholders are from {sanctioned}", "I want to open a company in {place} but I live in {sanctioned}",
+        "Can you open a bank account for a company owned by a {nationality} national?",
+        "We trade oil with {sanctioned}", "Do you work with clients from {sanctioned}?",
+        "Can {sanctioned} residents incorporate in {place}?", "My partner is based in {sanctioned}",
+        "We want to send payments to {sanctioned}", "Our supplier is in {sanctioned}",
+        "I live in {sanctioned}", "We are based in {sanctioned}", "Our company is located in {sanctioned}",
+        "I have a {nationality} passport", "I'm {nationality}", "Can you help a business from {sanctioned}?",
+    ],
+    "other": [
+        "Hello", "Hi there", "Thanks", "Ok", "I see", "Sounds good", "Yes", "No", "Maybe later",
+        "I'm looking to set up a company in {place}. What do I need to know?",
+        "What do I need for {service} in {place}?", "How long does {service} take?",
+        "What banking options are available in {place}?", "Do I need a local director in {place}?",
+        "Which is better, {place} or {place2}?", "I need to compare {place} and {place2} for my startup",
+        "What are the tax rates in {place}?", "Is {place} good for ecommerce?", "We are a software company",
+        "We trade textiles with Europe", "I'm a non-resident from Germany", "What documents do you need from me?",
+        "What are the ongoing compliance requirements in {place}?", "Can foreigners own a company in {place}?",
+        "How much does it cost to incorporate in {place} and what's the timeline?",
+        "What's the process and timeline for {service}?", "Can you help with the banking too?",
+        "How much capital do I need in {place}?", "What is the corporate tax in {place}?",
+        "Is the 8.25% tax rate available for us?", "Would Florida or New Mexico be better?",
+        "We plan to raise funding next year", "Which has better taxation for software revenue?",
+        "When could we get started with {service}?", "Do you offer {service}?", "Tell me about {service} in {place}",
+        "What is the minimum number of shareholders in {place}?", "Can I open a bank account remotely?",
+        "What payment processors do you work with?", "Do you help with visas in {place}?",
+        "Is it urgent to decide this month?", "I run a consulting business from home",
+        "How are dividends taxed in {place}?", "Can I be the only director?", "What is a registered agent?",
+        "We are an ecommerce business selling electronics", "Is {place} a good place for a holding company?",
+        "What happens after incorporation?", "Do I need to visit {place}?", "Who are your banking partners?",
+        "What's your email?", "How can I contact you?", "Where is your office?",
+        # Lawful tax planning and owner payouts, worded close to the illegal examples
+        "Can you help me lower my taxes?", "How can I reduce my tax bill legally?", "Can you help with tax planning?",
+        "Which structure is the most tax efficient?", "What tax incentives can we get in {place}?",
+        "Is there a way to pay less tax in {place}?", "Do we qualify for the tax exemption in {place}?",
+        "How do I move money from my company to my personal account?", "How do I pay myself from my company?",
+        "Should I take a salary or dividends?", "How can I withdraw profits from my company?",
+        "Can I transfer the profits to my personal bank account?", "How do I pay dividends to the shareholders?",
+        "How do I get money out of my {place} company?", "Can I send the profits to my home country?",
+    ],
+}
+
+# Template answers for confidently routed turns
+ROUTED_RESPONSES = {
+    "pricing": "Sure, no problem. Pricing is customized based on your specific requirements and we provide quotes individually after a free expert consultation. What's your timeline looking like?",
+    "booking": "I will put you in touch with one of our consultants. Please, choose your preferred time in the calendar CALENDLY_LINK or via email EMAIL to discuss the details.",
+    "illegal": "We're unable to help with that. We only support lawful business setups that meet all regulatory and compliance requirements.",
+    "sanctioned": "Unfortunately we are unable to assist with this request. Is there another market or business setup we can help you with?",
+}
+
+# Turns that must (intent) or must not (None) be answered from a template, checked by running this module
+ROUTING_CHECKS = [
+    ("I am from India", None), ("Our supplier is in China", None), ("Our supplier is in Germany", None),
+    ("I live in Australia", None), ("I am from Singapore", None), ("I have a British passport", None),
+    ("Our company is located in Dubai", None), ("I'm a resident of Malaysia", None), ("What's your email?", None),
+    ("I am from Iran", "sanctioned"), ("Our supplier is in Syria", "sanctioned"), ("I have a Russian passport", "sanctioned"),
+    ("How much does it cost?", "pricing"), ("Can we schedule a call?", "booking"),
+    ("Can you help me launder money?", "illegal"), ("I want to hide money from the tax authorities", "illegal"),
+    ("Can you help me lower my taxes?", None), ("How do I move money from my company to my personal account?", None),
+    ("How can we reduce the tax our company pays?", None), ("How do I pay myself a salary from the company?", None),
+    ("Can I move the profits to my personal account in Germany?", None),
+]
+
+_shared_router = None
+_shared_lock = threading.Lock()
+
+def generate_examples(seed: int = 13, variants: int = 3) -> List[Tuple[str, str]]:
+    """Built-in (text, intent) examples, templates filled with a few sampled values each"""
+    rng = random.Random(seed)
+    examples = []
+    for intent, templates in TRAINING_TEMPLATES.items():
+        for template in templates:
+            seen = set()
+            # The country is the signal for sanctions, so every one of them is covered, and the
+            # same sentence about a lawful country or nationality is an "other" example
+            if "{sanctioned}" in template:
+                fills = [(country, intent) for country in SANCTIONED] + [(country, "other") for country in COUNTRIES]
+            elif "{nationality}" in template:
+                fills = [(name, intent) for name in SANCTIONED_NATIONALITIES] + [(name, "other") for name in NATIONALITIES]
+            else:
+                fills = [(None, intent)] * (variants if "{" in template else 1)
+            for country, label in fills:
+                text = template.format(
+                    place=rng.choice(JURISDICTION_NAMES), place2=rng.choice(JURISDICTION_NAMES),
+                    service=rng.choice(SERVICES), sanctioned=country, nationality=country
+                )
+                if text not in seen:
+                    seen.add(text)
+                    examples.append((text, label))
+    return examples
+
+def load_examples(path: Optional[str] = TRAINING_FILE) -> List[Tuple[str, str]]:
+    """Built-in examples plus labeled lines from the training file"""
+    examples = generate_examples()
+    if path and os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and record.get("intent") in INTENTS and record.get("text"):
+                    examples.append((record["text"], record["intent"]))
+    return examples
+
+@lru_cache(maxsize=4096)
+def featurize(text: str) -> np.ndarray:
+    """Bucket ids of the message's word unigrams and bigrams"""
+    words = WORD_PATTERN.findall(text.lower())
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    mask = (1 << FEATURE_BITS) - 1
+    buckets = np.fromiter((zlib.crc32(gram.encode()) & mask for gram in grams), dtype=np.int64, count=len(grams))
+    buckets.flags.writeable = False
+    return buckets
+
+def softmax(scores: np.ndarray) -> np.ndarray:
+    scores = scores - scores.max(axis=-1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+class RouteDecision:
+    """How one turn was routed, with the classifier's confidence"""
+    __slots__ = ("intent", "confidence", "handled")
+
+    def __init__(self, intent: str, confidence: float, handled: bool):
+        self.intent = intent
+        self.confidence = confidence
+        self.handled = handled
+
+class IntentRouter:
+    """Hashed n-gram linear classifier with per-intent routing metrics"""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, threshold: float = CONFIDENCE_THRESHOLD,
+                 fingerprint: str = ""):
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+        self.fingerprint = fingerprint
+        self.lock = threading.Lock()
+        self.routes = {intent: {"handled": 0, "passed": 0} for intent in INTENTS}
+        self.confidence = Histogram(buckets=(0.3, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99))
+
+    def scores(self, text: str) -> np.ndarray:
+        """Intent probabilities for one message"""
+        buckets = featurize(text)
+        # Longer messages spread their weight, so mixed questions score less confidently
+        scale = 1.0 / np.sqrt(max(1, len(buckets)))
+        return softmax(self.weights[buckets].sum(axis=0) * scale + self.bias)
+
+    def route(self, text: str) -> RouteDecision:
+        probabilities = self.scores(text)
+        best = int(probabilities.argmax())
+        intent, confidence = INTENTS[best], float(probabilities[best])
+        handled = intent != "other" and confidence >= self.threshold
+        if intent == "sanctioned" and not SANCTIONED_PATTERN.search(text):
+            handled = False
+        with self.lock:
+            self.routes[intent]["handled" if handled else "passed"] += 1
+            self.confidence.observe(confidence)
+        return RouteDecision(intent, confidence, handled)
+
+    @classmethod
+    def train(cls, examples: List[Tuple[str, str]], epochs: int = 400, learning_rate: float = 10.0,
+              l2: float = 1e-4, **kwargs) -> "IntentRouter":
+        """Fit softmax regression with full-batch gradient descent"""
+        features = np.zeros((len(examples), 1 << FEATURE_BITS), dtype=np.float32)
+        labels = np.array([INTENTS.index(intent) for _, intent in examples])
+        for row, (text, _) in enumerate(examples):
+            buckets = featurize(text)
+            np.add.at(features[row], buckets, 1.0 / np.sqrt(max(1, len(buckets))))
+        targets = np.eye(len(INTENTS), dtype=np.float32)[labels]
+
+        weights = np.zeros((features.shape[1], len(INTENTS)), dtype=np.float32)
+        bias = np.zeros(len(INTENTS), dtype=np.float32)
+        for _ in range(epochs):
+            error = (softmax(features @ weights + bias) - targets) / len(examples)
+            weights -= learning_rate * (features.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        return cls(weights, bias, **kwargs)
+
+    def save(self, path: str):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, weights=self.weights, bias=self.bias, fingerprint=np.array(self.fingerprint))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, fingerprint: str, **kwargs) -> Optional["IntentRouter"]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["fingerprint"]) != fingerprint:
+                    return None
+                return cls(data["weights"], data["bias"], fingerprint=fingerprint, **kwargs)
+        except Exception:
+            return None
+
+    def export_prometheus(self) -> str:
+        with self.lock:
+            lines = [
+                "# HELP sales_agent_intent_routes_total Turns by predicted intent and whether a template answered them.",
+                "# TYPE sales_agent_intent_routes_total counter"
+            ]
+            for intent, counts in self.routes.items():
+                for outcome, count in counts.items():
+                    lines.append(f'sales_agent_intent_routes_total{{intent="{intent}",outcome="{outcome}"}} {count}')
+            lines += [
+                "# HELP sales_agent_intent_confidence Probability of the predicted intent.",
+                "# TYPE sales_agent_intent_confidence histogram"
+            ]
+            lines += self.confidence.lines("sales_agent_intent_confidence")
+        return "\n".join(lines) + "\n"
+
+def check_routes(router: IntentRouter, checks: List[Tuple[str, Optional[str]]] = ROUTING_CHECKS) -> List[str]:
+    """Describe every check the router gets wrong"""
+    failures = []
+    for text, expected in checks:
+        decision = router.route(text)
+        answered = decision.intent if decision.handled else None
+        if answered != expected:
+            failures.append(f"{text!r}: expected {expected or 'model'}, got {answered or 'model'} "
+                            f"({decision.intent} {decision.confidence:.2f})")
+    return failures
+
+def fingerprint_examples(examples: List[Tuple[str, str]]) -> str:
+    payload = json.dumps([FEATURE_BITS, INTENTS, examples])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def load_or_train_router(path: str = WEIGHTS_FILE, training_file: Optional[str] = TRAINING_FILE) -> IntentRouter:
+    """Load the saved weights, or train and save them when the examples changed"""
+    examples = load_examples(training_file)
+    fingerprint = fingerprint_examples(examples)
+    router = IntentRouter.load(path, fingerprint)
+    if router is None:
+        router = IntentRouter.train(examples, fingerprint=fingerprint)
+        try:
+            router.save(path)
+        except OSError:
+            pass
+    return router
+
+def get_intent_router(wait: bool = True) -> Optional[IntentRouter]:
+    """Get the intent router shared by every session in the process.
+
+    With wait=False, returns None instead of blocking while another thread
+    is still loading or training it.
+    """
+    global _shared_router
+    if not _shared_lock.acquire(blocking=wait):
+        return None
+    try:
+        if _shared_router is None:
+            _shared_router = load_or_train_router()
+            get_telemetry().add_collector(_shared_router.export_prometheus)
+        return _shared_router
+    finally:
+        _shared_lock.release()
+
+if __name__ == "__main__":
+    failures = check_routes(load_or_train_router())
+    print("\n".join(failures) or f"all {len(ROUTING_CHECKS)} routing checks pass")
+    raise SystemExit(1 if failures else 0)
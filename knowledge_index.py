@@ -0,0 +1,277 @@
+import glob
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+from typing import Dict, List, Tuple
+
+KNOWLEDGE_DIR = os.environ.get("KNOWLEDGE_DIR", "knowledge")
+INDEX_FILE = os.environ.get("KNOWLEDGE_INDEX_FILE", "knowledge_index.bin")
+
+# Built-in facts, indexed alongside any documents found in KNOWLEDGE_DIR
+BUILTIN_KNOWLEDGE = {
+    "singapore": {
+        "incorporation": "Singapore Private Limited Company can be incorporated usually around one week. Minimum 1 director required (can be foreigner). Minimum paid-up capital SGD $1. Corporate secretary mandatory.",
+        "taxation": "Corporate tax rate 17%. No capital gains tax. Extensive tax incentives available. Annual filing required.",
+        "benefits": "Strategic location, business-friendly environment, strong legal framework, access to ASEAN markets."
+    },
+    "hong_kong": {
+        "incorporation": "Hong Kong Limited Company incorporation takes usually around one week. Minimum 1 director and 1 shareholder. Company secretary required. No minimum capital requirement.",
+        "taxation": "Profits tax rate 8.25% for first HK$2M and 16.5% above. No capital gains tax, dividend tax, or withholding tax. Territorial taxation system.",
+        "benefits": "International financial center, simple tax system, no foreign exchange controls, strategic Asian hub."
+    },
+    "uk": {
+        "incorporation": "UK Limited Company formation usually around one week. Minimum 1 director and 1 shareholder. Company secretary optional.",
+        "taxation": "Corporation tax rate 25% (19% for small companies). VAT registration may be required. Annual confirmation statement required.",
+        "benefits": "Access to global markets, strong legal system, established business infrastructure, English-speaking."
+    },
+    "usa": {
+        "incorporation": "US Corporation or LLC formation usually around one week. Requirements vary by state. Florida and New Mexico are popular options. Registered agent required.",
+        "taxation": "Federal corporate tax 21% plus state taxes. LLC has pass-through taxation. We work with several banking partners in USA.",
+        "benefits": "World's largest economy, access to capital markets, strong IP protection, established business ecosystem."
+    },
+    "malaysia": {
+        "incorporation": "Malaysian Sdn Bhd incorporation takes usually around one week. Minimum 1 director (Malaysian resident required). Company secretary mandatory.",
+        "taxation": "Corporate tax rate 24%. MSC status companies get tax incentives. Labuan jurisdiction offers attractive tax rates.",
+        "benefits": "ASEAN hub, multicultural workforce, government incentives, strategic location."
+    },
+    "thailand": {
+        "incorporation": "Thai Limited Company registration takes usually around one week. Minimum 3 shareholders. Foreign ownership restrictions apply.",
+        "taxation": "Corporate income tax 20%. BOI promoted companies get tax privileges. VAT 7%.",
+        "benefits": "Growing economy, ASEAN member, government investment promotion, skilled workforce."
+    }
+}
+
+MAGIC = b"KIDX1\n"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("a an and are as at be by can do for from how i in is it me my of on or our the to we what which with you your".split())
+
+_shared_index = None
+_shared_lock = threading.Lock()
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def load_documents(knowledge_dir: str = KNOWLEDGE_DIR) -> List[Dict]:
+    """Load built-in facts plus .jsonl/.md/.txt documents from the knowledge directory
+
+    JSONL lines need a "text" and may set "title", "jurisdiction" and "field".
+    Markdown/text files are one document each, titled by their first heading.
+    """
+    documents = []
+    for jurisdiction, fields in BUILTIN_KNOWLEDGE.items():
+        for field, text in fields.items():
+            documents.append({
+                "id": f"{jurisdiction}/{field}",
+                "title": jurisdiction.replace("_", " ").title(),
+                "jurisdiction": jurisdiction,
+                "field": field,
+                "text": text
+            })
+
+    for path in sorted(glob.glob(os.path.join(knowledge_dir, "**", "*"), recursive=True)):
+        name = os.path.relpath(path, knowledge_dir)
+        if path.endswith(".jsonl"):
+            with open(path, 'r') as f:
+                for line_number, line in enumerate(f):
+                    if line.strip():
+                        doc = json.loads(line)
+                        documents.append({
+                            "id": doc.get("id", f"{name}:{line_number}"),
+                            "title": doc.get("title", ""),
+                            "jurisdiction": doc.get("jurisdiction", ""),
+                            "field": doc.get("field", ""),
+                            "text": doc["text"]
+                        })
+        elif path.endswith((".md", ".txt")):
+            with open(path, 'r') as f:
+                lines = f.read().strip().splitlines()
+            title = os.path.splitext(os.path.basename(path))[0].replace("_", " ")
+            if lines and lines[0].startswith("#"):
+                title = lines.pop(0).lstrip("#").strip()
+            documents.append({
+                "id": name,
+                "title": title,
+                "jurisdiction": "",
+                "field": "",
+                "text": " ".join(line.strip() for line in lines if line.strip())
+            })
+    return documents
+
+def fingerprint_documents(documents: List[Dict]) -> str:
+    return hashlib.sha1(json.dumps(documents, sort_keys=True).encode()).hexdigest()
+
+class KnowledgeIndex:
+    """BM25 inverted index over knowledge documents.
+
+    The on-disk file is a JSON header (term dictionary and document metadata)
+    followed by packed posting lists and document texts. Loading maps the file
+    and only reads the postings of query terms and the texts of returned hits.
+    """
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a knowledge index")
+        header_length = struct.unpack_from("<I", self.mm, len(MAGIC))[0]
+        header_start = len(MAGIC) + 4
+        header = json.loads(self.mm[header_start:header_start + header_length])
+        self.fingerprint = header["fingerprint"]
+        self.docs = header["docs"]
+        self.terms = header["terms"]
+        self.avgdl = header["avgdl"] or 1.0
+        self.data_start = header_start + header_length
+        self.view = memoryview(self.mm)
+
+        # Per-document BM25 length normalization, computed once on load
+        self.norms = [self.k1 * (1 - self.b + self.b * doc["length"] / self.avgdl) for doc in self.docs]
+
+        # Jurisdictions the documents are tagged with, named in text as words (hong_kong -> hong kong)
+        self.jurisdictions = frozenset(doc["jurisdiction"] for doc in self.docs if doc["jurisdiction"])
+        self.jurisdiction_names = {" ".join(tokenize(jurisdiction.replace("_", " "))): jurisdiction
+                                   for jurisdiction in self.jurisdictions}
+        self.jurisdiction_pattern = re.compile(r"\b(?:" + "|".join(
+            r"\s+".join(map(re.escape, name.split())) for name in sorted(self.jurisdiction_names, key=len, reverse=True) if name
+        ) + r")\b") if self.jurisdictions else None
+
+    @classmethod
+    def build(cls, documents: List[Dict], path: str) -> "KnowledgeIndex":
+        """Build the index, write it to path and map it"""
+        postings = {}
+        docs = []
+        texts = bytearray()
+        for doc_id, doc in enumerate(documents):
+            tokens = tokenize(" ".join([doc["title"], doc["field"], doc["text"]]))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((doc_id, count))
+            encoded = doc["text"].encode()
+            docs.append({
+                "id": doc["id"],
+                "title": doc["title"],
+                "jurisdiction": doc["jurisdiction"],
+                "field": doc["field"],
+                "length": len(tokens),
+                "text": [len(texts), len(encoded)]
+            })
+            texts += encoded
+
+        # Posting lists: doc ids (uint32) then term frequencies (uint32)
+        data = bytearray()
+        terms = {}
+        for term in sorted(postings):
+            entries = postings[term]
+            terms[term] = [len(data), len(entries)]
+            data += array('I', [doc_id for doc_id, _ in entries]).tobytes()
+            data += array('I', [count for _, count in entries]).tobytes()
+        text_start = len(data)
+        data += texts
+        for doc in docs:
+            doc["text"][0] += text_start
+
+        header = {
+            "fingerprint": fingerprint_documents(documents),
+            "avgdl": sum(doc["length"] for doc in docs) / len(docs) if docs else 0.0,
+            "docs": docs,
+            "terms": terms
+        }
+        encoded = json.dumps(header).encode()
+        # Pad the header so the posting lists start 4-byte aligned
+        padding = -(len(MAGIC) + 4 + len(encoded)) % 4
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(encoded) + padding))
+            f.write(encoded + b" " * padding)
+            f.write(data)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def postings(self, term: str) -> Tuple[memoryview, memoryview]:
+        offset, count = self.terms[term]
+        start = self.data_start + offset
+        doc_ids = self.view[start:start + 4 * count].cast('I')
+        frequencies = self.view[start + 4 * count:start + 8 * count].cast('I')
+        return doc_ids, frequencies
+
+    def get_text(self, doc_id: int) -> str:
+        offset, length = self.docs[doc_id]["text"]
+        start = self.data_start + offset
+        return bytes(self.view[start:start + length]).decode()
+
+    def jurisdictions_in(self, text: str) -> List[str]:
+        """Indexed jurisdictions the text names, in order of appearance"""
+        if self.jurisdiction_pattern is None:
+            return []
+        found = []
+        for match in self.jurisdiction_pattern.finditer(text.lower()):
+            jurisdiction = self.jurisdiction_names[" ".join(match.group().split())]
+            if jurisdiction not in found:
+                found.append(jurisdiction)
+        return found
+
+    def search(self, query: str, top_k: int = 5, jurisdictions=None) -> List[Dict]:
+        """Rank documents for the query with BM25
+
+        When jurisdictions are given, only documents for those jurisdictions
+        and general documents (no jurisdiction) are considered.
+        """
+        total_docs = len(self.docs)
+        scores = {}
+        for term in set(tokenize(query)):
+            if term not in self.terms:
+                continue
+            doc_ids, frequencies = self.postings(term)
+            idf = math.log(1 + (total_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            for doc_id, frequency in zip(doc_ids, frequencies):
+                if jurisdictions:
+                    jurisdiction = self.docs[doc_id]["jurisdiction"]
+                    if jurisdiction and jurisdiction not in jurisdictions:
+                        continue
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + self.norms[doc_id])
+
+        results = []
+        for doc_id, score in heapq.nlargest(top_k, scores.items(), key=lambda item: item[1]):
+            doc = self.docs[doc_id]
+            results.append({
+                "id": doc["id"],
+                "title": doc["title"],
+                "jurisdiction": doc["jurisdiction"],
+                "field": doc["field"],
+                "score": score,
+                "text": self.get_text(doc_id)
+            })
+        return results
+
+def load_or_build_index(knowledge_dir: str = KNOWLEDGE_DIR, path: str = INDEX_FILE) -> KnowledgeIndex:
+    """Map the persisted index, rebuilding it when the documents changed"""
+    documents = load_documents(knowledge_dir)
+    if os.path.exists(path):
+        try:
+            index = KnowledgeIndex(path)
+            if index.fingerprint == fingerprint_documents(documents):
+                return index
+        except Exception:
+            pass
+    return KnowledgeIndex.build(documents, path)
+
+def get_knowledge_index() -> KnowledgeIndex:
+    """Get the knowledge index shared by every session in the process"""
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = load_or_build_index()
+        return _shared_index
@@ -0,0 +1,232 @@
+"""Background strategy learning, off the request path.
+
+Analyses of finished conversations (see conversation_analyzer) are
+submitted to a bounded queue and a worker thread appends them to the
+strategy store in one transaction per batch and refreshes the strategy
+once per batch. A conversation submitted again while still queued
+replaces its queued analysis instead of being learned twice, and the
+strategy store skips conversation ids it has already learned from, so a
+resubmission after the queue drained is not counted again either.
+Strategy variants are assigned through the queue too, so every
+assignment is counted in the store with the next batch, whether or not
+the conversation is ever learned from. When the queue is full, submit
+waits up to block_seconds and then drops the conversation, so a stalled
+disk slows learning rather than replies. Queue depth, drops, coalescing,
+batch sizes and lag are exported with the telemetry metrics.
+"""
+import atexit
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+from strategy_manager import StrategyManager, get_shared_strategy_manager
+from telemetry import Histogram, get_telemetry
+
+MAX_PENDING = int(os.environ.get("AGENT_LEARNING_MAX_PENDING", "1000"))
+BATCH_SIZE = int(os.environ.get("AGENT_LEARNING_BATCH_SIZE", "100"))
+# Wait this long for more conversations before learning a partial batch
+BATCH_WAIT_SECONDS = float(os.environ.get("AGENT_LEARNING_BATCH_WAIT", "0.5"))
+
+_shared_queue = None
+_shared_lock = threading.Lock()
+
+class PendingConversation:
+    __slots__ = ("analysis", "conversation_id", "submitted_at")
+
+    def __init__(self, analysis: Dict, conversation_id: Optional[Hashable] = None):
+        self.analysis = analysis
+        self.conversation_id = conversation_id
+        self.submitted_at = time.monotonic()
+
+class LearningQueue:
+    """Bounded, coalescing queue drained in batches by a worker thread"""
+
+    def __init__(self, manager: StrategyManager, max_pending: int = MAX_PENDING, batch_size: int = BATCH_SIZE,
+                 batch_wait: float = BATCH_WAIT_SECONDS, block_seconds: float = 0.0):
+        self.manager = manager
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.block_seconds = block_seconds
+
+        self.pending = OrderedDict()
+        # Variant assignments not yet counted in the store
+        self.assignments = {}
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.closed = False
+        self.anonymous_keys = itertools.count()
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.learned = 0
+        self.failed = 0
+        self.batches = 0
+        self.batch_sizes = Histogram(buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500))
+        self.lag = Histogram()
+
+        self.worker = threading.Thread(target=self.run, name="strategy-learning", daemon=True)
+        self.worker.start()
+
+    def submit(self, analysis: Dict, conversation_id: Optional[Hashable] = None) -> bool:
+        """Queue a conversation analysis for learning; False if it was dropped because the queue is full"""
+        conversation = PendingConversation(analysis, conversation_id)
+        key = conversation_id if conversation_id is not None else ("anonymous", next(self.anonymous_keys))
+        with self.condition:
+            if self.closed:
+                return False
+            self.submitted += 1
+            if key in self.pending:
+                # Keep the queue position, learn from the latest analysis once
+                self.pending[key] = conversation
+                self.coalesced += 1
+                return True
+            if len(self.pending) >= self.max_pending:
+                deadline = time.monotonic() + self.block_seconds
+                while len(self.pending) >= self.max_pending and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.dropped += 1
+                        return False
+                    self.condition.wait(remaining)
+            self.pending[key] = conversation
+            self.condition.notify_all()
+            return True
+
+    def assign_variant(self) -> str:
+        """Assign the strategy variant of a new conversation and count it towards the experiment"""
+        variant = self.manager.assign_variant()
+        with self.condition:
+            self.assignments[variant] = self.assignments.get(variant, 0) + 1
+            self.condition.notify_all()
+        return variant
+
+    def take_batch(self) -> Tuple[List[PendingConversation], Dict[str, int]]:
+        """Wait for work, then give the batch window a chance to fill; returns conversations and assignments"""
+        with self.condition:
+            while not self.pending and not self.assignments and not self.closed:
+                self.condition.wait()
+            if self.batch_wait and not self.closed:
+                deadline = time.monotonic() + self.batch_wait
+                while len(self.pending) < self.batch_size and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+            batch = []
+            while self.pending and len(batch) < self.batch_size:
+                batch.append(self.pending.popitem(last=False)[1])
+            assignments, self.assignments = self.assignments, {}
+            self.in_flight = len(batch) + bool(assignments)
+            # Wake submitters blocked on a full queue
+            self.condition.notify_all()
+            return batch, assignments
+
+    def run(self):
+        while True:
+            batch, assignments = self.take_batch()
+            if not batch and not assignments:
+                return
+            try:
+                self.learn(batch, assignments)
+            except Exception:
+                with self.condition:
+                    self.failed += len(batch)
+                    # Counted with the next batch instead
+                    for variant, count in assignments.items():
+                        self.assignments[variant] = self.assignments.get(variant, 0) + count
+            finally:
+                with self.condition:
+                    self.in_flight = 0
+                    self.condition.notify_all()
+
+    def learn(self, batch: List[PendingConversation], assignments: Dict[str, int] = None):
+        telemetry = get_telemetry()
+        with telemetry.time("strategy_learning_batch"):
+            self.manager.learn_batch([conversation.analysis for conversation in batch], assignments,
+                                     [conversation.conversation_id for conversation in batch])
+        if not batch:
+            return
+        now = time.monotonic()
+        with self.condition:
+            self.learned += len(batch)
+            self.batches += 1
+            self.batch_sizes.observe(len(batch))
+            for conversation in batch:
+                self.lag.observe(now - conversation.submitted_at)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far has been learned"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            self.condition.notify_all()
+            while self.pending or self.assignments or self.in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Learn what is still queued, then stop the worker"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.worker.join(timeout)
+        # The worker stops at the first empty batch; pick up anything left behind
+        with self.condition:
+            remaining = list(self.pending.values())
+            self.pending.clear()
+            assignments, self.assignments = self.assignments, {}
+        if remaining or assignments:
+            self.learn(remaining, assignments)
+
+    def stats(self) -> Dict:
+        with self.condition:
+            return {
+                "pending": len(self.pending),
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "learned": self.learned,
+                "failed": self.failed,
+                "batches": self.batches
+            }
+
+    def export_prometheus(self) -> str:
+        stats = self.stats()
+        with self.condition:
+            batch_sizes = self.batch_sizes.lines("sales_agent_learning_batch_size")
+            lag = self.lag.lines("sales_agent_learning_lag_seconds")
+        lines = [
+            "# HELP sales_agent_learning_pending Conversations waiting to be learned from.",
+            "# TYPE sales_agent_learning_pending gauge",
+            f"sales_agent_learning_pending {stats['pending'] + stats['in_flight']}",
+            "# HELP sales_agent_learning_conversations_total Conversations submitted for learning by outcome.",
+            "# TYPE sales_agent_learning_conversations_total counter",
+        ]
+        lines += [f'sales_agent_learning_conversations_total{{outcome="{outcome}"}} {stats[outcome]}'
+                  for outcome in ("submitted", "coalesced", "dropped", "learned", "failed")]
+        lines += [
+            "# HELP sales_agent_learning_batch_size Conversations learned per batch.",
+            "# TYPE sales_agent_learning_batch_size histogram"
+        ] + batch_sizes
+        lines += [
+            "# HELP sales_agent_learning_lag_seconds Time from submission until the strategy learned from it.",
+            "# TYPE sales_agent_learning_lag_seconds histogram"
+        ] + lag
+        return "\n".join(lines) + "\n"
+
+def get_learning_queue() -> LearningQueue:
+    """Get the learning queue feeding the shared strategy manager"""
+    global _shared_queue
+    with _shared_lock:
+        if _shared_queue is None:
+            _shared_queue = LearningQueue(get_shared_strategy_manager())
+            get_telemetry().add_collector(_shared_queue.export_prometheus)
+            atexit.register(_shared_queue.close)
+        return _shared_queue
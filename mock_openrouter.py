@@ -0,0 +1,213 @@
+"""Local OpenAI-compatible stand-in for OpenRouter, for benchmarks and offline runs.
+
+    python mock_openrouter.py --port 8765 --latency 0.4 --tokens-per-second 60
+
+then point the agent at it with OPENROUTER_BASE_URL=http://127.0.0.1:8765/v1.
+--error-rate and --stall-rate simulate a degraded provider. LocalClient
+gives the same replies in-process, without HTTP, for high-volume runs.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from intent_matcher import classify
+
+USER_LINE = re.compile(r"^USER: (.*)$", re.MULTILINE)
+EXCHANGE_COUNT = re.compile(r"Current exchange count: (\d+)")
+TOKEN_PIECES = re.compile(r"\S+\s*")
+
+def generate_reply(messages) -> str:
+    """Deterministic consultant reply for the last user turn"""
+    prompt = messages[-1]["content"] if messages else ""
+    if isinstance(prompt, list):
+        prompt = " ".join(part.get("text", "") for part in prompt)
+    match = USER_LINE.search(prompt)
+    user_message = match.group(1) if match else prompt
+    match = EXCHANGE_COUNT.search(prompt)
+    exchange_count = int(match.group(1)) if match else 1
+    intents = classify(user_message)
+
+    if intents.has("cost"):
+        reply = "Sure, no problem. Pricing is customized and we provide quotes individually after a free expert consultation. What's your timeline looking like?"
+    elif intents.has("bank", "account", "payment"):
+        reply = "Let me share some details. We have established relationships with banking institutions and the best option depends on your industry. What industry are you in?"
+    elif intents.has("tax"):
+        reply = "Happy to help. Hong Kong offers an 8.25% tax rate for the first HK$2M of profits and Singapore has attractive incentives. What's your main priority for the setup?"
+    elif len(intents.jurisdictions) > 1:
+        reply = "Yes, no problem. Both jurisdictions have excellent benefits and the best choice depends on your business needs. What's driving your decision to expand there?"
+    elif intents.jurisdictions:
+        reply = "Sure, no problem. Incorporation usually takes around one week and we have many clients in that market. What industry are you in?"
+    else:
+        reply = "Happy to help. We assist with company incorporation and secretarial services across several jurisdictions. May I know what services you are looking for?"
+
+    if exchange_count >= 4:
+        reply += " I will put you in touch with one of our experts. Please, choose your preferred time in the calendar CALENDLY_LINK or via email EMAIL to discuss the details."
+    return reply
+
+def count_prompt_tokens(messages) -> int:
+    return sum(len(json.dumps(message["content"])) // 4 for message in messages)
+
+class LocalClient:
+    """In-process stand-in for the OpenAI client, answering with generate_reply"""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model: str, messages, stream: bool = False, timeout: float = None, **params):
+        content = generate_reply(messages)
+        pieces = TOKEN_PIECES.findall(content)
+        usage = SimpleNamespace(prompt_tokens=count_prompt_tokens(messages), completion_tokens=len(pieces),
+                                prompt_tokens_details=None)
+        if stream:
+            return self.stream(pieces, usage)
+        message = SimpleNamespace(role="assistant", content=content)
+        return SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")],
+                               usage=usage)
+
+    @staticmethod
+    def stream(pieces, usage):
+        for piece in pieces:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece), finish_reason=None)], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+class MockOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+    tokens_per_second = 0.0
+    # Provider degradation: share of requests answered with a 503, and share
+    # of requests that stall for stall_seconds before the first token
+    error_rate = 0.0
+    stall_rate = 0.0
+    stall_seconds = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        messages = body.get("messages", [])
+        model = body.get("model", "mock")
+        pieces = TOKEN_PIECES.findall(generate_reply(messages))
+        usage = {
+            "prompt_tokens": count_prompt_tokens(messages),
+            "completion_tokens": len(pieces),
+            "total_tokens": count_prompt_tokens(messages) + len(pieces)
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        if random.random() < self.error_rate:
+            self.send_json(503, {"error": {"message": "Provider temporarily unavailable", "code": 503}})
+            return
+        time.sleep(self.latency + (self.stall_seconds if random.random() < self.stall_rate else 0.0))
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                self.send_stream(completion_id, model, pieces, usage, body.get("stream_options", {}).get("include_usage"))
+            except ConnectionError:
+                # Clients may hang up right after [DONE]
+                pass
+            return
+
+        if self.tokens_per_second:
+            time.sleep(len(pieces) / self.tokens_per_second)
+        self.send_json(200, {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(pieces)}, "finish_reason": "stop"}],
+            "usage": usage
+        })
+
+    def send_json(self, status: int, data):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, completion_id: str, model: str, pieces, usage, include_usage: bool):
+        for piece in pieces:
+            self.send_event({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+            })
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+        self.send_event({
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        })
+        if include_usage:
+            self.send_event({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [], "usage": usage
+            })
+        self.send_chunk(b"data: [DONE]\n\n")
+        self.send_chunk(b"")
+
+    def send_event(self, data):
+        self.send_chunk(f"data: {json.dumps(data)}\n\n".encode())
+
+    def send_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+class MockOpenRouterServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Pooled clients drop idle keep-alive connections, that is not an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, tokens_per_second: float = 0.0,
+                      error_rate: float = 0.0, stall_rate: float = 0.0, stall_seconds: float = 0.0) -> MockOpenRouterServer:
+    """Start the mock server on a background thread; port 0 picks a free port"""
+    handler = type("ConfiguredMockHandler", (MockOpenRouterHandler,), {
+        "latency": latency,
+        "tokens_per_second": tokens_per_second,
+        "error_rate": error_rate,
+        "stall_rate": stall_rate,
+        "stall_seconds": stall_seconds
+    })
+    server = MockOpenRouterServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def get_base_url(server: MockOpenRouterServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible OpenRouter stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.4, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="0 sends all tokens at once")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="share of requests that stall before the first token")
+    parser.add_argument("--stall-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = start_mock_server(args.host, args.port, args.latency, args.tokens_per_second,
+                               args.error_rate, args.stall_rate, args.stall_seconds)
+    print(f"Mock OpenRouter listening on {get_base_url(server)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Model routing, retries and hedged requests for the OpenRouter call path.
+
+Each turn gets a chain of models: a cheaper fast model for short, simple
+turns, then the primary model, then the fallbacks. Every call runs under
+a turn deadline; retryable errors (timeouts, connection errors, 429 and
+5xx) are retried with exponential backoff and full jitter before moving
+on to the next model in the chain. With a hedge delay configured, a call
+that has not answered after that delay is raced against the next model
+in the chain and whichever finishes first wins.
+
+    OPENROUTER_MODEL            primary model
+    OPENROUTER_FAST_MODEL       model for simple turns, empty to disable
+    OPENROUTER_FALLBACK_MODELS  comma-separated models tried after the primary
+    OPENROUTER_DEADLINE         seconds a turn may spend on the model call
+    OPENROUTER_MAX_RETRIES      retries per model
+    OPENROUTER_HEDGE_AFTER      seconds before a hedged request, unset to disable
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from intent_matcher import classify
+from openrouter_client import MAX_CONNECTIONS, REQUEST_TIMEOUT, load_openai
+
+PRIMARY_MODEL = os.environ.get("OPENROUTER_MODEL", "anthropic/claude-3.5-sonnet")
+FAST_MODEL = os.environ.get("OPENROUTER_FAST_MODEL", "anthropic/claude-3.5-haiku")
+FALLBACK_MODELS = [model.strip() for model in os.environ.get("OPENROUTER_FALLBACK_MODELS", "openai/gpt-4o-mini").split(",") if model.strip()]
+DEADLINE = float(os.environ.get("OPENROUTER_DEADLINE", "30"))
+MAX_RETRIES = int(os.environ.get("OPENROUTER_MAX_RETRIES", "2"))
+HEDGE_AFTER = float(os.environ["OPENROUTER_HEDGE_AFTER"]) if os.environ.get("OPENROUTER_HEDGE_AFTER") else None
+
+_shared_router = None
+_shared_lock = threading.Lock()
+_hedge_executor = None
+
+@lru_cache(maxsize=None)
+def error_classes() -> Dict[str, Tuple]:
+    """OpenAI error classes by how the router handles them, resolved on the first failed call"""
+    openai = load_openai()
+    return {
+        # Worth retrying on the same model; anything else moves down the chain
+        "retryable": (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                      openai.InternalServerError, openai.ConflictError),
+        # No other model will fix these
+        "fatal": (openai.AuthenticationError, openai.PermissionDeniedError),
+        # Model-specific rejections, e.g. an unavailable model or unsupported parameter
+        "model": (openai.BadRequestError, openai.NotFoundError, openai.UnprocessableEntityError)
+    }
+
+def deadline_error() -> Exception:
+    return load_openai().APITimeoutError(request=None)
+
+def get_hedge_executor() -> ThreadPoolExecutor:
+    """Threads for racing sync requests, sized like the connection pool"""
+    global _hedge_executor
+    with _shared_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix="hedge")
+        return _hedge_executor
+
+class ModelRouter:
+    """Choose the models for a turn and call them with deadlines, retries and hedging"""
+
+    def __init__(self, primary: str = PRIMARY_MODEL, fast: Optional[str] = FAST_MODEL, fallbacks: List[str] = None,
+                 deadline: float = DEADLINE, attempt_timeout: float = REQUEST_TIMEOUT, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = 0.25, backoff_max: float = 4.0, hedge_after: Optional[float] = HEDGE_AFTER,
+                 simple_max_words: int = 12):
+        self.primary = primary
+        self.fast = fast or None
+        self.fallbacks = FALLBACK_MODELS if fallbacks is None else fallbacks
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.simple_max_words = simple_max_words
+
+    def is_simple_turn(self, user_message: str) -> bool:
+        """Short turns without pricing, banking, tax or comparisons"""
+        intents = classify(user_message)
+        return (intents.word_count <= self.simple_max_words
+                and not intents.has("cost", "bank", "account", "payment", "tax")
+                and len(intents.jurisdictions) <= 1)
+
+    def choose_models(self, user_message: str) -> List[str]:
+        """Model chain for this turn, best first"""
+        first = self.fast if self.fast and self.is_simple_turn(user_message) else self.primary
+        chain = [first]
+        for model in [self.primary] + self.fallbacks:
+            if model not in chain:
+                chain.append(model)
+        return chain
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def next_step(self, error: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """Seconds to wait before retrying the same model, or None to move on"""
+        errors = error_classes()
+        if isinstance(error, errors["fatal"]) or not isinstance(error, errors["retryable"] + errors["model"]):
+            raise error
+        if isinstance(error, errors["model"]) or attempt >= self.max_retries:
+            return None
+        delay = self.backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def hedge_for(self, models: List[str], index: int) -> Optional[str]:
+        if self.hedge_after is None or index + 1 >= len(models):
+            return None
+        return models[index + 1]
+
+    def run(self, call: Callable, models: List[str], trace, discard: Callable = None):
+        """Call call(model, timeout) down the chain until one attempt succeeds"""
+        deadline = time.monotonic() + self.deadline
+        last_error = None
+        for index, model in enumerate(models):
+            hedge_model = self.hedge_for(models, index)
+            attempt = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise last_error or deadline_error()
+                trace.attempts += 1
+                try:
+                    model_used, result = self.attempt(call, model, hedge_model, min(self.attempt_timeout, remaining), trace, discard)
+                    trace.model = model_used
+                    return result
+                except Exception as e:
+                    last_error = e
+                    delay = self.next_step(e, attempt, deadline)
+                    if delay is None:
+                        break
+                    time.sleep(delay)
+                    attempt += 1
+        raise last_error
+
+    def attempt(self, call: Callable, model: str, hedge_model: Optional[str], timeout: float, trace, discard: Callable = None) -> Tuple:
+        if hedge_model is None:
+            return model, call(model, timeout)
+
+        executor = get_hedge_executor()
+        primary = executor.submit(call, model, timeout)
+        try:
+            return model, primary.result(timeout=self.hedge_after)
+        except FutureTimeoutError:
+            pass
+
+        # Race the next model in the chain against the slow call
+        trace.hedged = True
+        hedge = executor.submit(call, hedge_model, timeout)
+        futures = {primary: model, hedge: hedge_model}
+        error = None
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if discard is not None:
+                # The loser may still produce a result, e.g. an open stream
+                for other in futures:
+                    if other is not future:
+                        other.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+            trace.hedge_won = future is hedge
+            return futures[future], result
+        raise error
+
+    async def run_async(self, call: Callable, models: List[str], trace, discard: Callable = None):
+        """Async variant of run; call(model, timeout) returns an awaitable"""
+        deadline = time.monotonic() + self.deadline
+        last_error = None
+        for index, model in enumerate(models):
+            hedge_model = self.hedge_for(models, index)
+            attempt = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise last_error or deadline_error()
+                trace.attempts += 1
+                try:
+                    model_used, result = await self.attempt_async(call, model, hedge_model, min(self.attempt_timeout, remaining), trace, discard)
+                    trace.model = model_used
+                    return result
+                except Exception as e:
+                    last_error = e
+                    delay = self.next_step(e, attempt, deadline)
+                    if delay is None:
+                        break
+                    await asyncio.sleep(delay)
+                    attempt += 1
+        raise last_error
+
+    async def attempt_async(self, call: Callable, model: str, hedge_model: Optional[str], timeout: float, trace, discard: Callable = None) -> Tuple:
+        if hedge_model is None:
+            return model, await call(model, timeout)
+
+        primary = asyncio.ensure_future(call(model, timeout))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return model, primary.result()
+
+        # Race the next model in the chain against the slow call
+        trace.hedged = True
+        hedge = asyncio.ensure_future(call(hedge_model, timeout))
+        tasks = {primary: model, hedge: hedge_model}
+        pending = set(tasks)
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task
+                    elif discard is not None:
+                        await discard(task.result())
+                if winner is not None:
+                    trace.hedge_won = winner is hedge
+                    return tasks[winner], winner.result()
+            raise error
+        finally:
+            # Cancelling the loser closes its connection
+            for task in pending:
+                task.cancel()
+
+    def complete(self, client, messages: List, models: List[str], trace, **params):
+        """Non-streaming completion down the model chain"""
+        return self.run(
+            lambda model, timeout: client.chat.completions.create(model=model, messages=messages, timeout=timeout, **params),
+            models, trace
+        )
+
+    def open_stream(self, client, messages: List, models: List[str], trace, **params) -> Tuple:
+        """Open a completion stream down the model chain.
+
+        An attempt counts as answered once the first chunk arrives, so
+        retries and hedging cover the time to first token; returns the
+        stream and its first chunk (None for an empty stream).
+        """
+        def call(model, timeout):
+            stream = client.chat.completions.create(model=model, messages=messages, timeout=timeout, stream=True, **params)
+            try:
+                return stream, next(stream, None)
+            except BaseException:
+                stream.close()
+                raise
+
+        return self.run(call, models, trace, discard=lambda result: result[0].close())
+
+    async def complete_async(self, client, messages: List, models: List[str], trace, **params):
+        """Non-streaming completion down the model chain"""
+        return await self.run_async(
+            lambda model, timeout: client.chat.completions.create(model=model, messages=messages, timeout=timeout, **params),
+            models, trace
+        )
+
+    async def open_stream_async(self, client, messages: List, models: List[str], trace, **params) -> Tuple:
+        """Async variant of open_stream"""
+        async def call(model, timeout):
+            stream = await client.chat.completions.create(model=model, messages=messages, timeout=timeout, stream=True, **params)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                await stream.close()
+                raise
+
+        async def discard(result):
+            await result[0].close()
+
+        return await self.run_async(call, models, trace, discard=discard)
+
+def get_model_router() -> ModelRouter:
+    """Get the model router shared by every session in the process"""
+    global _shared_router
+    with _shared_lock:
+        if _shared_router is None:
+            _shared_router = ModelRouter()
+        return _shared_router
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+import threading
+import weakref
+from typing import TYPE_CHECKING
+
+# The OpenAI SDK takes ~0.5 s to import and is loaded on first use, see load_openai
+if TYPE_CHECKING:
+    import httpx
+    import openai
+
+OPENROUTER_BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# Connection pool shared by every session in the process
+MAX_CONNECTIONS = int(os.environ.get("OPENROUTER_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENROUTER_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.environ.get("OPENROUTER_KEEPALIVE_EXPIRY", "60"))
+REQUEST_TIMEOUT = float(os.environ.get("OPENROUTER_TIMEOUT", "60"))
+CONNECT_TIMEOUT = float(os.environ.get("OPENROUTER_CONNECT_TIMEOUT", "5"))
+
+_lock = threading.Lock()
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+
+def load_openai():
+    """Import the OpenAI SDK, e.g. on a background thread before the first model call"""
+    import openai
+    return openai
+
+def get_api_key() -> str:
+    """Get API key from Streamlit secrets or environment variables"""
+    api_key = None
+    # Secrets only exist inside the Streamlit app; elsewhere streamlit is not worth importing
+    streamlit = sys.modules.get("streamlit")
+    if streamlit is not None:
+        try:
+            api_key = streamlit.secrets["OPENROUTER_API_KEY"]
+        except Exception:
+            pass
+    if not api_key:
+        api_key = os.environ.get("OPENROUTER_API_KEY")
+
+    if not api_key:
+        raise ValueError("OpenRouter API key not found. Please set it in Streamlit secrets or environment variables.")
+
+    return api_key
+
+def get_pool_limits() -> "httpx.Limits":
+    """Bounded pool with keep-alive so sessions reuse warm connections"""
+    import httpx
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+def get_timeout() -> "httpx.Timeout":
+    import httpx
+    return httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+def get_client() -> "openai.OpenAI":
+    """Get the process-wide OpenRouter client shared by all sessions"""
+    global _client
+    with _lock:
+        if _client is None:
+            import httpx
+            openai = load_openai()
+            _client = openai.OpenAI(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=get_api_key(),
+                http_client=httpx.Client(limits=get_pool_limits(), timeout=get_timeout()),
+                # Retries and fallbacks are handled by the model router
+                max_retries=0
+            )
+        return _client
+
+def get_async_client() -> "openai.AsyncOpenAI":
+    """Get the shared async OpenRouter client for the running event loop"""
+    # httpx async connections are bound to the loop that opened them, so the
+    # pool is shared per loop - in a server process that is a single client
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            import httpx
+            openai = load_openai()
+            client = openai.AsyncOpenAI(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=get_api_key(),
+                http_client=httpx.AsyncClient(limits=get_pool_limits(), timeout=get_timeout()),
+                # Retries and fallbacks are handled by the model router
+                max_retries=0
+            )
+            _async_clients[loop] = client
+        return client
+
+async def close_async_client():
+    """Close the async client of the running event loop, e.g. on server shutdown"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.close()
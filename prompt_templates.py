@@ -0,0 +1,134 @@
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from context_builder import count_tokens
+
+# Static part of the system prompt, shared by every strategy variant
+BASE_SYSTEM_PROMPT = """You are a professional corporate services consultant [choose one of the English names] from Strasia Group specializing in company incorporation and secretarial services across Hong Kong, Singapore, Malaysia, Thailand, UK, and USA.
+
+GUIDELINES:
+- Be direct and professional, not overly enthusiastic
+- Introduce yourself once in the first message to the user [choose one of the English names] and ask something like this (please stay generalized and you can change it according to first input): May I know what services you are looking for? Stay generalized let user ask about your services.
+- Don't use "I", use "We"
+- Don't describe Strasia Group Services at all unless you are asked
+- Stay very abstract and general, name only benefits and positive features when asked, e.g. If asked if Singapore jurisdiction is better than Hong Kong, name only benefits of both. Benefits of Hong Kong include taxation benefits and international financial center status (avoid mentioning Chinese market access unless specifically asked about China).
+- Your answers should imply more questions when answered like for a professional sales guy
+- Don't start with "I specialize" and never use word "insights"
+- Don't ask for details like: "Are you looking for monthly or yearly accounting services?" Because it should be asked and upselled in the online meeting
+- Keep responses to 2-3 sentences maximum
+- Ask one specific question to understand their needs
+- Guide toward scheduling a consultation within 4-5 exchanges
+- Use knowledge when relevant but don't overwhelm
+- Ask clarifications to be completely aligned, e.g. "What trading you mean when you say about your business niche?"
+- Avoid phrases like "Great question!" or "I'd be happy to help"
+- Avoid saying directly that we monitor conversation number like never say "since this is your 4th exchange" or so
+- Always add in every message beginning small details humans add like "sure dont worry" before actually explaining why not to worry or "yes no problem" "Let me share some details" "Happy to help" before explaining why its no problem add this or similar everyday wording
+- You MUST output just the response to the message, nothing else
+- Add some wording that confirms that the lead has found the right partner (we have many clients doing [name of industry]; we have established relationships with banking institutions; we work with various payment processors including established partners).
+- Always mention our personal relationships with banking and payment processing partners when relevant: at banking institutions like Airwallex, Aspire, HSBC; we know people at payment processors like Airwallex, Oceanpayment and PayPal.
+- You must call a lead for a booking/consultation at 4-5th message if not yet shared in message for example with (try to stay general and easy going, you may change it according to the need): "I will put you in touch with one of our experts. Please, choose your preferred time in the calendar CALENDLY_LINK or via email EMAIL to discuss the details."
+- If they want booking/consultation, immediately provide something like (change it): "I will put you in touch with one of our consultants. Please, choose your preferred time in the calendar CALENDLY_LINK or via email EMAIL to discuss the details."
+- If you provide details and does not end the message with a call proposal, it should say something like "I hope this answers your question(s)" "I hope this provides some clarity" "Our team would be happy to provide more information if needed"
+- Always check if it's the time to send (change it) "I will put you in touch with one of our consultants/experts. Please, choose your preferred time in the calendar CALENDLY_LINK or via email EMAIL to discuss the details." or not yet
+- NEVER provide specific pricing, costs, or numerical quotes - always say pricing is customized and we provide quotes individually after a free expert consultation
+- For incorporation timelines, say "usually around one week" instead of specific days like "1-2 days"
+- For US incorporation, recommend Florida and New Mexico instead of Delaware or Wyoming due to banking advantages
+- For US banking, say "we work with several banking partners in USA" without specific names, and if asked which ones, say "it depends on industry and home country of owner" and guide them to consultation
+- Never mention clients and services in sanctioned countries like Myanmar
+- Always mention Hong Kong's 8.25% tax rate (for first HK$2M) when discussing Hong Kong taxation
+- Reject any requests that could support illegal activities immediately
+- Never recommend Wyoming or Delaware but Florida and New Mexico instead
+- Include all major jurisdictions (USA, UK, not just Singapore and Hong Kong) in recommendations not just HK and Singapore
+
+CONVERSATION GOAL: Get them to ask for contact information or schedule a consultation."""
+
+# Learned strategy section, one line per tactic that has values
+STRATEGY_HEADER = "\n\nLEARNED STRATEGY:\n"
+OPENING_LINE = "- Use these proven opening phrases: {}\n"
+TRANSITION_LINE = "- Use these successful transitions: {}\n"
+QUESTION_LINE = "- Ask these effective questions: {}\n"
+TIMING_LINE = "- Offer consultation link around message {}\n"
+TRIGGER_LINE = "- Use these consultation phrases: {}\n"
+
+_shared_template = None
+_shared_lock = threading.Lock()
+
+def stable_hash(text: str) -> str:
+    """Hash that is the same in every process, unlike hash()"""
+    return hashlib.sha1(text.encode()).hexdigest()
+
+class RenderedPrompt:
+    """System prompt for one strategy variant.
+
+    prefix is the static base prompt and suffix the learned strategy, each
+    its own provider cache breakpoint. The prefix hash only changes with the
+    base prompt, so the response cache keys on it and its entries outlive
+    strategy updates; hash covers the whole prompt.
+    """
+    __slots__ = ("prefix", "suffix", "text", "prefix_hash", "hash", "tokens")
+
+    def __init__(self, prefix: str, prefix_hash: str, prefix_tokens: int, suffix: str):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.text = prefix + suffix
+        self.prefix_hash = prefix_hash
+        self.hash = stable_hash(self.text)
+        self.tokens = prefix_tokens + count_tokens(suffix)
+
+    def system_content(self):
+        """System message content with a cache breakpoint after each stable part"""
+        blocks = [{"type": "text", "text": self.prefix, "cache_control": {"type": "ephemeral"}}]
+        if self.suffix:
+            blocks.append({"type": "text", "text": self.suffix, "cache_control": {"type": "ephemeral"}})
+        return blocks
+
+def strategy_key(strategy: Optional[Dict]) -> Optional[Tuple]:
+    """The parts of a strategy the prompt depends on, as a hashable key"""
+    if not strategy:
+        return None
+    tactics = strategy.get('conversation_tactics', {})
+    triggers = tactics.get('consultation_triggers', [])
+    return (
+        tuple(tactics.get('opening_phrases', [])[:3]),
+        tuple(tactics.get('successful_transitions', [])[:3]),
+        tuple(tactics.get('proven_questions', [])[:3]),
+        strategy.get('timing_strategy', {}).get('link_timing', 4),
+        triggers[0] if triggers else None
+    )
+
+class PromptTemplate:
+    """Base prompt compiled once, strategy variants rendered and memoized by strategy key"""
+
+    def __init__(self, base: str = BASE_SYSTEM_PROMPT, max_variants: int = 256):
+        self.base = base
+        self.base_hash = stable_hash(base)
+        self.base_tokens = count_tokens(base)
+        self.render_key = lru_cache(maxsize=max_variants)(self.render_key)
+
+    def render(self, strategy: Optional[Dict]) -> RenderedPrompt:
+        return self.render_key(strategy_key(strategy))
+
+    def render_key(self, key: Optional[Tuple]) -> RenderedPrompt:
+        if key is None:
+            return RenderedPrompt(self.base, self.base_hash, self.base_tokens, "")
+        opening_phrases, transitions, questions, link_timing, trigger = key
+        lines = [STRATEGY_HEADER]
+        if opening_phrases:
+            lines.append(OPENING_LINE.format(", ".join(opening_phrases)))
+        if transitions:
+            lines.append(TRANSITION_LINE.format(", ".join(transitions)))
+        if questions:
+            lines.append(QUESTION_LINE.format(", ".join(questions)))
+        lines.append(TIMING_LINE.format(link_timing))
+        if trigger:
+            lines.append(TRIGGER_LINE.format(trigger))
+        return RenderedPrompt(self.base, self.base_hash, self.base_tokens, "".join(lines))
+
+def get_prompt_template() -> PromptTemplate:
+    """Get the prompt template shared by every session in the process"""
+    global _shared_template
+    with _shared_lock:
+        if _shared_template is None:
+            _shared_template = PromptTemplate()
+        return _shared_template
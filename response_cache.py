@@ -0,0 +1,163 @@
+import math
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from intent_matcher import classify
+from prompt_templates import RenderedPrompt
+
+EMBEDDING_DIMENSIONS = 256
+# Words that flip a question's meaning while barely moving its embedding
+NEGATIONS = frozenset("not no never nor without cannot can't don't dont doesn't isn't aren't won't wasn't didn't shouldn't wouldn't".split())
+# Words that point back into the conversation, e.g. "how long does that take?"
+ANAPHORA = frozenset("that this these those it its they them their there other another same also too either both one ones".split())
+# Follow-ups with fewer content words lean on the conversation for their meaning, e.g. "and the cost?"
+MIN_FOLLOW_UP_TERMS = 3
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+def exchange_bucket(exchange_count: int) -> int:
+    """Opening turn, discovery turns, and turns where the consultation is due"""
+    if exchange_count == 0:
+        return 0
+    return 1 if exchange_count < 4 else 2
+
+def embed(terms) -> Dict[int, float]:
+    """Hashed bag-of-words embedding, normalized to unit length"""
+    vector = {}
+    for term in terms:
+        slot = zlib.crc32(term.encode()) % EMBEDDING_DIMENSIONS
+        vector[slot] = vector.get(slot, 0.0) + 1.0
+    norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+    return {slot: value / norm for slot, value in vector.items()}
+
+def cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(slot, 0.0) for slot, value in a.items())
+
+class ResponseCache:
+    """LRU/TTL cache of model responses for repeated lead questions.
+
+    Exact hits are keyed on the canonical message terms (keywords folded to
+    their intent group, so "price" and "cost", "hk" and "hong kong" agree),
+    the exchange-count bucket, the prefix hash of the system prompt and the
+    strategy variant. The prefix hash only changes with the base prompt, so
+    entries survive strategy updates; the call to action is added after the
+    cache. Keying on the variant keeps experiment arms from answering with
+    each other's replies. The cache is shared by every lead, so after the opening turn,
+    short follow-ups and ones that refer back to the conversation are not
+    cached: their answer only fits the conversation they were asked in.
+    When a similarity threshold is set, a miss falls back to the most
+    similar cached message with the same intents, bucket, context and
+    negation. The fallback is off by default: a bag of words cannot tell
+    which way a question is asked.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, similarity_threshold: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.lock = threading.Lock()
+
+        # key -> (created_at, response, group_key, vector)
+        self.entries = OrderedDict()
+        # (bucket, context, intent groups, negated) -> keys, for the similarity lookup
+        self.groups = {}
+
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def make_key(self, message: str, exchange_count: int, prompt: Optional[RenderedPrompt] = None,
+                 variant: str = None) -> Optional[Tuple]:
+        """Cache key of a lead message, None when its answer depends on the conversation so far"""
+        intents = classify(message)
+        words = set(intents.canonical_terms)
+        if exchange_count and (len(words) < MIN_FOLLOW_UP_TERMS or not intents.words.isdisjoint(ANAPHORA)):
+            return None
+        terms = " ".join(sorted(words))
+        context = (prompt.prefix_hash if prompt is not None else "", variant)
+        return (terms, exchange_bucket(exchange_count), context, intents.groups, not words.isdisjoint(NEGATIONS))
+
+    def get(self, key: Optional[Tuple]) -> Optional[str]:
+        """Get a cached response, counting the hit or miss"""
+        if key is None:
+            with self.lock:
+                self.skipped += 1
+            return None
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl_seconds:
+                self.remove(key)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            # Fall back to the most similar message with the same intents
+            if self.similarity_threshold is not None:
+                vector = embed(key[0].split())
+                best_key, best_score = None, self.similarity_threshold
+                for candidate in self.groups.get(key[1:], ()):
+                    candidate_entry = self.entries[candidate]
+                    if now - candidate_entry[0] > self.ttl_seconds:
+                        continue
+                    score = cosine(vector, candidate_entry[3])
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    self.entries.move_to_end(best_key)
+                    self.similar_hits += 1
+                    return self.entries[best_key][1]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: Optional[Tuple], response: str):
+        if key is None or not response:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (time.monotonic(), response, key[1:], embed(key[0].split()))
+            self.groups.setdefault(key[1:], []).append(key)
+            while len(self.entries) > self.max_entries:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key: Tuple):
+        entry = self.entries.pop(key)
+        keys = self.groups[entry[2]]
+        keys.remove(key)
+        if not keys:
+            del self.groups[entry[2]]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.groups.clear()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "entries": len(self.entries),
+                "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else 0.0
+            }
+
+def get_response_cache() -> ResponseCache:
+    """Get the response cache shared by every session in the process"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
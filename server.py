@@ -0,0 +1,361 @@
+"""Standalone async server for the sales agent, independent of Streamlit.
+
+    python server.py --host 0.0.0.0 --port 8000
+
+A plain ASGI app (served by uvicorn) that hosts one agent per session id:
+
+    POST   /sessions/{id}/messages   {"message": "..."} -> {"response": "..."};
+                                     with "stream": true the reply is sent
+                                     as server-sent events
+    WS     /sessions/{id}/ws         send {"message": "..."}, receive
+                                     {"type": "delta", "text": "..."} events
+                                     and a final {"type": "done", "response": "..."}
+    DELETE /sessions/{id}            end the conversation, learn from it and
+                                     forget the stored transcript
+    GET    /health, GET /metrics
+
+Session ids are lead ids: conversations are stored per lead and resumed
+on the lead's next message, even after a restart. Sessions in RAM live in a
+bounded LRU and are ended after an idle timeout. Ending a session, and
+the lead answering the consultation link, hands the transcript to the
+background learning queue so strategy learning never delays a reply.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional
+from agent_openrouter import create_async_agent, warm_up_shared_resources
+from learning_queue import get_learning_queue
+from openrouter_client import close_async_client
+from session_store import get_session_store
+from strategy_manager import get_shared_strategy_manager
+from telemetry import get_telemetry
+
+MAX_SESSIONS = int(os.environ.get("AGENT_MAX_SESSIONS", "10000"))
+SESSION_IDLE_SECONDS = float(os.environ.get("AGENT_SESSION_IDLE_SECONDS", "1800"))
+MAX_MESSAGE_CHARS = 4000
+MAX_BODY_BYTES = 64 * 1024
+
+SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+ROUTE = re.compile(r"^/sessions/(?P<session_id>[^/]+)(?P<action>/messages|/ws)?/?$")
+
+class Session:
+    """One lead's conversation: the agent, which holds the transcript, and a turn lock
+
+    The agent is built on the session's first turn, off the event loop.
+    """
+    __slots__ = ("session_id", "agent", "last_active", "lock", "analyzed")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.agent = None
+        self.last_active = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.analyzed = False
+
+class SessionPool:
+    """Bounded LRU of sessions with idle eviction; evicted sessions go to on_end"""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_seconds: float = SESSION_IDLE_SECONDS,
+                 on_end: Callable[[Session], None] = None):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.on_end = on_end
+        self.sessions = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, session_id: str) -> Session:
+        """Get or start a session, marking it most recently used
+
+        While every other session is mid-turn, the pool may run over
+        max_sessions until one of them finishes.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session(session_id)
+            self.created += 1
+            # Oldest first, skipping sessions in the middle of a turn
+            while len(self.sessions) > self.max_sessions:
+                oldest = next((other for other, candidate in self.sessions.items()
+                               if other != session_id and not candidate.lock.locked()), None)
+                if oldest is None:
+                    break
+                self.end(oldest)
+                self.evicted += 1
+        else:
+            self.sessions.move_to_end(session_id)
+        session.last_active = time.monotonic()
+        return session
+
+    def end(self, session_id: str) -> Optional[Session]:
+        session = self.sessions.pop(session_id, None)
+        if session is not None and self.on_end is not None:
+            self.on_end(session)
+        return session
+
+    def evict_idle(self) -> int:
+        """End sessions idle for longer than the timeout, oldest first"""
+        cutoff = time.monotonic() - self.idle_seconds
+        expired = []
+        for session_id, session in self.sessions.items():
+            if session.last_active > cutoff:
+                break
+            if not session.lock.locked():
+                expired.append(session_id)
+        for session_id in expired:
+            self.end(session_id)
+        self.evicted += len(expired)
+        return len(expired)
+
+    def end_all(self):
+        for session_id in list(self.sessions):
+            self.end(session_id)
+
+class AgentServer:
+    """ASGI app serving agent sessions over HTTP and WebSocket"""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_seconds: float = SESSION_IDLE_SECONDS):
+        self.manager = get_shared_strategy_manager()
+        self.learning_queue = get_learning_queue()
+        self.sessions = SessionPool(max_sessions, idle_seconds, on_end=self.learn_from_session)
+        self.telemetry = get_telemetry()
+        self.sweeper = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle_http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self.handle_websocket(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Accept connections once the shared resources are loaded, no turn builds them inline
+                await asyncio.to_thread(warm_up_shared_resources(sync_client=False).join)
+                self.sweeper = asyncio.create_task(self.sweep_idle_sessions())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def shutdown(self):
+        if self.sweeper is not None:
+            self.sweeper.cancel()
+        self.sessions.end_all()
+        await asyncio.get_running_loop().run_in_executor(None, self.learning_queue.flush, 30.0)
+        await close_async_client()
+
+    async def sweep_idle_sessions(self):
+        while True:
+            await asyncio.sleep(min(60.0, self.sessions.idle_seconds / 2))
+            self.sessions.evict_idle()
+            store = get_session_store()
+            if store is not None:
+                await asyncio.to_thread(store.expire)
+
+    def learn_from_session(self, session: Session):
+        """Learn from an ended conversation, like Clear Conversation in the app"""
+        if session.agent is None:
+            return
+        messages = session.agent.memory
+        # Resumed conversations were learned from when they last ended
+        if session.analyzed or messages.total == session.agent.resumed_count:
+            return
+        analyzer = session.agent.analyzer
+        if analyzer.link_shared or len(messages) >= 6:
+            self.learning_queue.submit(analyzer.finalize(variant=session.agent.variant), session.agent.conversation_id)
+        session.analyzed = True
+
+    def open_conversation(self, lead_id: str):
+        """Build the lead's agent and resume their stored conversation, on a worker thread
+
+        A new conversation gets its variant and learning key here.
+        """
+        agent = create_async_agent(lead_id)
+        agent.resume()
+        if agent.conversation_id is None:
+            agent.conversation_id = uuid.uuid4().hex
+            agent.variant = self.learning_queue.assign_variant()
+        return agent
+
+    async def start_conversation(self, session: Session):
+        session.agent = await asyncio.to_thread(self.open_conversation, session.session_id)
+        # A resumed conversation that already got the link was learned from back then
+        session.analyzed = session.agent.analyzer.link_shared
+
+    async def delete_conversation(self, session_id: str) -> bool:
+        """End the session and forget the stored conversation; True if the session was in memory"""
+        session = self.sessions.end(session_id)
+        if session is not None:
+            # A turn in flight saves the conversation when it finishes, forget it after that turn
+            async with session.lock:
+                if session.agent is not None:
+                    await asyncio.to_thread(session.agent.clear_memory)
+                    return True
+        store = get_session_store()
+        if store is not None:
+            await asyncio.to_thread(store.delete, session_id)
+        return session is not None
+
+    async def respond(self, session: Session, user_message: str):
+        """Run one turn, yielding response deltas"""
+        async with session.lock:
+            session.last_active = time.monotonic()
+            if session.agent is None:
+                await self.start_conversation(session)
+            session.agent.set_strategy_context(self.manager.get_variant_strategy(session.agent.variant), self.manager.version)
+            async for delta in session.agent.generate_response_stream(user_message):
+                yield delta
+            session.last_active = time.monotonic()
+
+            # Learn once the lead has answered the link, like the app's auto-analysis;
+            # a link left unanswered is learned from when the session ends
+            analyzer = session.agent.analyzer
+            if not session.analyzed and analyzer.link_answered:
+                session.analyzed = True
+                self.learning_queue.submit(analyzer.finalize(variant=session.agent.variant), session.agent.conversation_id)
+
+    def parse_message(self, body: bytes) -> str:
+        data = json.loads(body or b"{}")
+        message = data.get("message") if isinstance(data, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            raise ValueError("message is required")
+        if len(message) > MAX_MESSAGE_CHARS:
+            raise ValueError(f"message is longer than {MAX_MESSAGE_CHARS} characters")
+        return message.strip()
+
+    async def handle_http(self, scope, receive, send):
+        method, path = scope["method"], scope["path"]
+        if path == "/health":
+            return await send_json(send, 200, {"status": "ok", "sessions": len(self.sessions)})
+        if path == "/metrics":
+            return await send_text(send, 200, self.export_metrics(), "text/plain; version=0.0.4")
+
+        match = ROUTE.match(path)
+        if match is None or match["action"] == "/ws":
+            return await send_json(send, 404, {"error": "not found"})
+        session_id = match["session_id"]
+        if not SESSION_ID.match(session_id):
+            return await send_json(send, 400, {"error": "invalid session id"})
+
+        if match["action"] is None:
+            if method != "DELETE":
+                return await send_json(send, 405, {"error": "method not allowed"})
+            ended = await self.delete_conversation(session_id)
+            return await send_json(send, 200, {"session_id": session_id, "ended": ended})
+
+        if method != "POST":
+            return await send_json(send, 405, {"error": "method not allowed"})
+        try:
+            body = await read_body(receive)
+            message = self.parse_message(body)
+            stream = bool(json.loads(body).get("stream"))
+        except ValueError as e:
+            return await send_json(send, 400, {"error": str(e)})
+
+        session = self.sessions.get(session_id)
+        if not stream:
+            response = "".join([delta async for delta in self.respond(session, message)])
+            return await send_json(send, 200, {"session_id": session_id, "response": response})
+
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")
+        ]})
+        response = []
+        async for delta in self.respond(session, message):
+            response.append(delta)
+            await send({"type": "http.response.body", "body": sse({"type": "delta", "text": delta}), "more_body": True})
+        await send({"type": "http.response.body", "body": sse({"type": "done", "response": "".join(response)})})
+
+    async def handle_websocket(self, scope, receive, send):
+        match = ROUTE.match(scope["path"])
+        if (await receive())["type"] != "websocket.connect":
+            return
+        if match is None or match["action"] != "/ws" or not SESSION_ID.match(match["session_id"]):
+            return await send({"type": "websocket.close", "code": 4404})
+        session_id = match["session_id"]
+        await send({"type": "websocket.accept"})
+
+        while True:
+            event = await receive()
+            if event["type"] == "websocket.disconnect":
+                return
+            try:
+                message = self.parse_message(event.get("text") or event.get("bytes"))
+            except ValueError as e:
+                await send({"type": "websocket.send", "text": json.dumps({"type": "error", "error": str(e)})})
+                continue
+
+            # Look the session up per message, it may have been evicted while idle
+            session = self.sessions.get(session_id)
+            response = []
+            async for delta in self.respond(session, message):
+                response.append(delta)
+                await send({"type": "websocket.send", "text": json.dumps({"type": "delta", "text": delta})})
+            await send({"type": "websocket.send", "text": json.dumps({"type": "done", "response": "".join(response)})})
+
+    def export_metrics(self) -> str:
+        return self.telemetry.export_prometheus() + "\n".join([
+            "# HELP sales_agent_sessions Sessions held in memory.",
+            "# TYPE sales_agent_sessions gauge",
+            f"sales_agent_sessions {len(self.sessions)}",
+            "# HELP sales_agent_sessions_created_total Sessions started.",
+            "# TYPE sales_agent_sessions_created_total counter",
+            f"sales_agent_sessions_created_total {self.sessions.created}",
+            "# HELP sales_agent_sessions_evicted_total Sessions ended by the LRU bound or idle timeout.",
+            "# TYPE sales_agent_sessions_evicted_total counter",
+            f"sales_agent_sessions_evicted_total {self.sessions.evicted}",
+        ]) + "\n"
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError("request body too large")
+        if not message.get("more_body"):
+            return body
+
+def sse(data) -> bytes:
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+async def send_text(send, status: int, text: str, content_type: str):
+    payload = text.encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", content_type.encode()), (b"content-length", str(len(payload)).encode())
+    ]})
+    await send({"type": "http.response.body", "body": payload})
+
+async def send_json(send, status: int, data):
+    await send_text(send, status, json.dumps(data), "application/json")
+
+def create_app(max_sessions: int = MAX_SESSIONS, idle_seconds: float = SESSION_IDLE_SECONDS) -> AgentServer:
+    return AgentServer(max_sessions, idle_seconds)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the sales agent over HTTP and WebSocket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS)
+    parser.add_argument("--idle-seconds", type=float, default=SESSION_IDLE_SECONDS)
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(args.max_sessions, args.idle_seconds), host=args.host, port=args.port, lifespan="on")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from conversation_memory import Message
+
+SESSION_DB = os.environ.get("AGENT_SESSION_DB", "conversation_sessions.db")
+# Stored conversations untouched for longer are deleted; 0 keeps them forever
+RETENTION_DAYS = float(os.environ.get("AGENT_SESSION_RETENTION_DAYS", "90") or 0)
+
+_shared_store = None
+_shared_lock = threading.Lock()
+
+class SessionStore:
+    """Durable per-lead conversations, so a returning lead keeps their context.
+
+    Every message is stored once, by lead id and position in the
+    conversation, next to a small state row with the turn counts and the
+    agent's running summary. Resuming reads the state row and only the most
+    recent page of messages; older messages stay on disk and are already
+    folded into the summary. The state row also keeps the strategy variant
+    and learning queue key of the conversation, so a returning lead stays in
+    its experiment arm and is learned from once. SQLite in WAL mode lets
+    every session and process share one file.
+    """
+
+    def __init__(self, db_path: str = SESSION_DB):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "lead_id TEXT NOT NULL, position INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+            "created_at REAL NOT NULL, PRIMARY KEY (lead_id, position)) WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "lead_id TEXT PRIMARY KEY, total INTEGER NOT NULL, user_turns INTEGER NOT NULL, "
+            "summarized_count INTEGER NOT NULL, summary TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "analysis TEXT NOT NULL DEFAULT '{}', variant TEXT, conversation_id TEXT)"
+        )
+        # Stores created before conversations carried their running analysis, variant and learning key
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(sessions)")]
+        if "analysis" not in columns:
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN analysis TEXT NOT NULL DEFAULT '{}'")
+        for column in ("variant", "conversation_id"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def save(self, lead_id: str, start_position: int, messages: Iterable[Message], state: Dict):
+        """Append messages from start_position on and replace the session state, atomically"""
+        rows = [(lead_id, start_position + i, m.role, m.content, m.timestamp) for i, m in enumerate(messages)]
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO messages (lead_id, position, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sessions (lead_id, total, user_turns, summarized_count, summary, updated_at, "
+                    "analysis, variant, conversation_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (lead_id, state["total"], state["user_turns"], state["summarized_count"],
+                     json.dumps(state["summary"]), time.time(), json.dumps(state.get("analysis", {})),
+                     state.get("variant"), state.get("conversation_id"))
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def load(self, lead_id: str, recent: int) -> Optional[Tuple[Dict, List[Message]]]:
+        """Get (state, newest messages) of a stored conversation, None for a new lead"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT total, user_turns, summarized_count, summary, analysis, variant, conversation_id "
+                "FROM sessions WHERE lead_id = ?", (lead_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            state = {"total": row[0], "user_turns": row[1], "summarized_count": row[2], "summary": json.loads(row[3]),
+                     "analysis": json.loads(row[4]), "variant": row[5], "conversation_id": row[6]}
+            # Everything not yet in the summary is needed, however old
+            start = max(0, min(state["summarized_count"], state["total"] - recent))
+            messages = self.read_messages(lead_id, start, state["total"])
+        return state, messages
+
+    def read_messages(self, lead_id: str, start: int, stop: int) -> List[Message]:
+        rows = self.conn.execute(
+            "SELECT role, content, created_at FROM messages WHERE lead_id = ? AND position >= ? AND position < ? "
+            "ORDER BY position", (lead_id, start, stop)
+        ).fetchall()
+        return [Message(role, content, created_at) for role, content, created_at in rows]
+
+    def delete(self, lead_id: str):
+        """Forget a conversation, e.g. when the lead starts over"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM messages WHERE lead_id = ?", (lead_id,))
+                self.conn.execute("DELETE FROM sessions WHERE lead_id = ?", (lead_id,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def expire(self, max_age_days: float = RETENTION_DAYS) -> int:
+        """Delete conversations untouched for longer than max_age_days, returns how many"""
+        if not max_age_days:
+            return 0
+        cutoff = time.time() - max_age_days * 86400
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "DELETE FROM messages WHERE lead_id IN (SELECT lead_id FROM sessions WHERE updated_at < ?)", (cutoff,)
+                )
+                expired = self.conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return expired
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def get_session_store() -> Optional[SessionStore]:
+    """Get the session store shared by every session in the process, None if AGENT_SESSION_DB is empty
+
+    Expired conversations are deleted when the store is opened; long-running
+    servers also expire them from their idle sweep.
+    """
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None and SESSION_DB:
+            _shared_store = SessionStore(SESSION_DB)
+            _shared_store.expire()
+        return _shared_store
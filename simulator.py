@@ -0,0 +1,247 @@
+"""Synthetic leads for high-volume offline strategy training.
+
+    python simulator.py --conversations 5000 --workers 8 --round-size 500
+
+Generates lead personas matching ConversationAnalyzer.user_style
+(brief, detailed and inquisitive), lets them talk to OpenRouterSalesAgent
+across a process pool with the deterministic in-process model from
+mock_openrouter, and feeds the outcomes to a StrategyManager round by
+round. Each lead has a patience of a few turns and leaves if the agent
+has not shared the consultation link by then, and a readiness: a link
+shared before the lead is ready is answered with a polite no instead of
+a booked call. So sharing the link too early or too late both cost calls,
+and the learned link timing and the strategy variants actually change
+conversion. Reports
+conversations per second, learning cost and how the strategy metrics
+converge. Strategy files go to a temporary directory unless --dir is set.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+from strategy_manager import StrategyManager
+
+JURISDICTIONS = ["Singapore", "Hong Kong", "UK", "USA", "Malaysia", "Thailand"]
+INDUSTRIES = ["ecommerce", "consulting", "software", "trading", "logistics", "fintech"]
+
+PERSONAS = {
+    "brief": {
+        "openers": ["{jurisdiction} company?", "Company in {jurisdiction}?", "{jurisdiction} incorporation help", "Need {jurisdiction} company"],
+        "follow_ups": ["Cost?", "Timeline?", "Bank account?", "Documents needed?", "Local director?", "Annual fees?", "Tax rate?", "Process?"],
+        "patience": (2, 5),
+        "readiness": (1, 3)
+    },
+    "detailed": {
+        "openers": [
+            "Hello, we are a small {industry} business currently operating from Germany and we are looking to set up a company in {jurisdiction} to serve our customers in the region more efficiently.",
+            "Good morning, I run a {industry} startup with three co-founders and we are considering {jurisdiction} for our holding company because of investors asking us to move there soon."
+        ],
+        "follow_ups": [
+            "We would also need a corporate bank account that can receive payments in several currencies from our customers in Europe and Asia, ideally within the next two months.",
+            "Our main concern is the timeline because we have a contract starting next quarter and the client insists on invoicing from a local entity in the region.",
+            "Could you explain what the annual compliance obligations look like, including the accounting, audit and company secretary requirements for a company of our size?",
+            "We are also comparing the total cost of ownership over the first three years, so a rough idea of the government fees and your service fees would really help us.",
+            "None of the founders will relocate for now, so we would need to understand the local director and registered address requirements and how you handle them."
+        ],
+        "patience": (4, 8),
+        "readiness": (3, 5)
+    },
+    "inquisitive": {
+        "openers": ["What do I need to open a {industry} company in {jurisdiction}?", "Can you help me incorporate in {jurisdiction}? How does it work?"],
+        "follow_ups": [
+            "How long does the whole process take?",
+            "Do I need to travel there in person?",
+            "Which documents do you need from me?",
+            "Can you also help with a bank account?",
+            "What are the ongoing compliance requirements?",
+            "Is a local director mandatory?",
+            "How much are the annual fees?",
+            "What happens after incorporation?"
+        ],
+        "patience": (3, 6),
+        "readiness": (2, 4)
+    }
+}
+
+# Lead answers to the link, depending on whether they were ready for a call
+ACCEPT_REPLY = "Sounds good, I'll book a slot."
+DECLINE_REPLY = "Thanks, I'll think about it."
+
+_client = None
+
+def lead_messages(persona: str, rng: random.Random) -> List[str]:
+    """Everything the lead would say, in order, until their patience runs out"""
+    spec = PERSONAS[persona]
+    opener = rng.choice(spec["openers"]).format(jurisdiction=rng.choice(JURISDICTIONS), industry=rng.choice(INDUSTRIES))
+    follow_ups = rng.sample(spec["follow_ups"], min(len(spec["follow_ups"]), rng.randint(*spec["patience"]) - 1))
+    return [opener] + follow_ups
+
+def init_worker():
+    # One client and one set of process-wide agent resources per worker, loaded before timing starts
+    global _client
+    from intent_router import get_intent_router
+    from knowledge_index import get_knowledge_index
+    from mock_openrouter import LocalClient
+    _client = LocalClient()
+    get_knowledge_index()
+    get_intent_router()
+
+def warm_up(_) -> int:
+    return os.getpid()
+
+def run_conversation(persona: str, seed: int, variant: str, strategy: Dict, version) -> Tuple[Dict, int]:
+    """Talk to a fresh agent until the link is shared or the lead leaves; returns (analysis, turns)"""
+    from agent_openrouter import OpenRouterSalesAgent
+
+    rng = random.Random(seed)
+    # The agent picks phrases and triggers with the global random module
+    random.seed(seed)
+    agent = OpenRouterSalesAgent(client=_client)
+    agent.variant = variant
+    agent.set_strategy_context(strategy, version)
+    ready = rng.randint(*PERSONAS[persona]["readiness"])
+    turns = 0
+    for message in lead_messages(persona, rng):
+        reply = agent.generate_response(message)
+        turns += 1
+        if "CALENDLY_LINK" in reply or "EMAIL" in reply:
+            agent.add_to_history("user", ACCEPT_REPLY if turns >= ready else DECLINE_REPLY)
+            break
+    analysis = agent.analyzer.finalize(variant=variant)
+    analysis["persona"] = persona
+    return analysis, turns
+
+def run_chunk(strategies: Dict[str, Dict], version, tasks: List[Tuple[str, int, str]]) -> List[Tuple[Dict, int]]:
+    return [run_conversation(persona, seed, variant, strategies[variant], version) for persona, seed, variant in tasks]
+
+def simulate(manager: StrategyManager, conversations: int, workers: int, round_size: int, chunk_size: int,
+             mix: Dict[str, float], seed: int = 7) -> Dict:
+    rng = random.Random(seed)
+    personas, weights = list(mix), list(mix.values())
+    rounds = []
+    totals = {"conversations": 0, "turns": 0, "simulate_seconds": 0.0, "learn_seconds": 0.0}
+    per_persona = {persona: {"conversations": 0, "conversions": 0, "calls": 0, "style_matches": 0} for persona in personas}
+
+    # Build the knowledge index and train the intent model once here, the workers then load them
+    from intent_router import get_intent_router
+    from knowledge_index import get_knowledge_index
+    get_knowledge_index()
+    get_intent_router()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        list(pool.map(warm_up, range(workers)))
+        startup = time.perf_counter() - start
+        index = 0
+        while index < conversations:
+            size = min(round_size, conversations - index)
+            tasks = [(rng.choices(personas, weights)[0], seed * 1000003 + index + i, manager.assign_variant()) for i in range(size)]
+            index += size
+            strategies = {variant: manager.get_variant_strategy(variant) for variant in manager.experiment.variants}
+            version = manager.version
+
+            start = time.perf_counter()
+            futures = [pool.submit(run_chunk, strategies, version, tasks[i:i + chunk_size]) for i in range(0, size, chunk_size)]
+            results = [result for future in futures for result in future.result()]
+            simulated = time.perf_counter() - start
+
+            analyses = []
+            for analysis, turns in results:
+                persona = analysis.pop("persona")
+                stats = per_persona[persona]
+                stats["conversations"] += 1
+                stats["conversions"] += analysis["link_shared"]
+                stats["calls"] += analysis["call_accepted"]
+                stats["style_matches"] += analysis["user_response_style"] == persona
+                totals["turns"] += turns
+                analyses.append(analysis)
+            assignments = {}
+            for _, _, variant in tasks:
+                assignments[variant] = assignments.get(variant, 0) + 1
+            start = time.perf_counter()
+            manager.learn_batch(analyses, assignments)
+            learned = time.perf_counter() - start
+
+            totals["conversations"] += size
+            totals["simulate_seconds"] += simulated
+            totals["learn_seconds"] += learned
+            strategy = manager.get_current_strategy()
+            best = manager.experiment.probability_best()
+            leader = max(best, key=best.get)
+            rounds.append({
+                "conversations": totals["conversations"],
+                "round_conversion": sum(a["link_shared"] for a in analyses) / size,
+                "round_calls": sum(a["call_accepted"] for a in analyses) / size,
+                "conversion_rate": strategy["success_metrics"].get("conversion_rate", 0),
+                "link_timing": strategy["timing_strategy"].get("link_timing", 4),
+                "leading_variant": leader,
+                "probability_best": best[leader],
+                "conversations_per_second": size / simulated,
+                "learn_ms": learned * 1000
+            })
+
+    elapsed = totals["simulate_seconds"] + totals["learn_seconds"]
+    return {
+        "rounds": rounds,
+        "personas": per_persona,
+        "variants": manager.experiment.report(manager.get_current_strategy().get("experiment", {})),
+        "conversations_per_second": totals["conversations"] / elapsed if elapsed else 0.0,
+        "turns_per_second": totals["turns"] / elapsed if elapsed else 0.0,
+        "learn_share": totals["learn_seconds"] / elapsed if elapsed else 0.0,
+        "startup_seconds": startup
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the strategy offline on synthetic leads")
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--round-size", type=int, default=200, help="conversations learned from per batch")
+    parser.add_argument("--chunk-size", type=int, default=25, help="conversations per worker task")
+    parser.add_argument("--mix", default="brief=1,detailed=1,inquisitive=1", help="persona weights")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--dir", help="keep the trained strategy files here instead of a temporary directory")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    unknown = set(mix) - set(PERSONAS)
+    if unknown:
+        parser.error(f"unknown personas: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.dir or tmp
+        os.makedirs(directory, exist_ok=True)
+        manager = StrategyManager(
+            strategy_file=os.path.join(directory, "conversation_strategies.json"),
+            store_path=os.path.join(directory, "conversation_strategies.db"),
+            archive_file=os.path.join(directory, "conversation_archive.jsonl"),
+            analytics_file=os.path.join(directory, "conversation_analytics.npz")
+        )
+        results = simulate(manager, args.conversations, args.workers, args.round_size, args.chunk_size, mix, args.seed)
+        manager.store.close()
+
+    print(f"{'conversations':>13} {'round conv':>10} {'calls':>6} {'conv rate':>9} {'timing':>6} {'leading variant':>16} {'P(best)':>7} {'conv/s':>8} {'learn ms':>8}")
+    for row in results["rounds"]:
+        print(f"{row['conversations']:>13} {row['round_conversion']:>10.1%} {row['round_calls']:>6.1%} {row['conversion_rate']:>8.1f}% {row['link_timing']:>6} "
+              f"{row['leading_variant']:>16} {row['probability_best']:>7.0%} {row['conversations_per_second']:>8.1f} {row['learn_ms']:>8.1f}")
+    print("\nPersonas")
+    for persona, stats in results["personas"].items():
+        if stats["conversations"]:
+            print(f"  {persona:>12}: {stats['conversations']} conversations, {stats['conversions'] / stats['conversations']:.0%} converted, "
+                  f"{stats['calls'] / stats['conversations']:.0%} booked a call, "
+                  f"style detected {stats['style_matches'] / stats['conversations']:.0%}")
+    print("\nVariants")
+    for name, row in results["variants"].items():
+        print(f"  {name:>16}: {row['conversations']} conversations, posterior {row['posterior_mean']:.1%}, P(best) {row['probability_best']:.0%}")
+    print(f"\n{results['conversations_per_second']:.1f} conversations/s, {results['turns_per_second']:.1f} turns/s, "
+          f"{results['learn_share']:.1%} of the time spent learning, {results['startup_seconds']:.1f} s worker startup")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""A/B testing of strategy variants with Thompson sampling.
+
+Each new conversation is assigned a variant by sampling every variant's
+Beta posterior over its conversion rate (link shared) and taking the
+best draw, so traffic shifts towards what converts while weaker variants
+keep getting explored. Conversions arrive through the strategy manager's
+event log: every analysis carries its variant, the counts live in the
+strategy under "experiment" and the posteriors are rebuilt once per
+learned batch. The denominator is every conversation assigned to the
+variant (counted in the strategy store), not only the ones that were
+learned from, so abandoned conversations count as failures; one still
+running counts as a failure until it converts. Assignment reads an
+immutable snapshot of the posteriors and takes no lock.
+"""
+import json
+import os
+from typing import Dict, List, Optional
+import numpy as np
+
+VARIANTS_FILE = os.environ.get("AGENT_STRATEGY_VARIANTS")
+
+# Overrides of the learned strategy; "control" runs it unchanged
+DEFAULT_VARIANTS = {
+    "control": {},
+    "early_link": {"link_timing": 3},
+    "late_link": {"link_timing": 5},
+    "direct_trigger": {
+        "consultation_triggers": [
+            "The quickest way forward is a short call with one of our experts. Please, choose your preferred time in the calendar CALENDLY_LINK or via email EMAIL."
+        ]
+    },
+    "warm_openers": {
+        "opening_phrases": ["Sure, don't worry.", "Yes, no problem at all.", "Happy to help with that."]
+    },
+}
+
+def load_variants(path: Optional[str] = VARIANTS_FILE) -> Dict[str, Dict]:
+    """Variants from a JSON file of {name: overrides}, or the defaults"""
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                variants = json.load(f)
+            if isinstance(variants, dict) and variants:
+                return variants
+        except ValueError:
+            pass
+    return dict(DEFAULT_VARIANTS)
+
+def apply_variant(strategy: Dict, overrides: Dict) -> Dict:
+    """Copy of the strategy with a variant's overrides, sharing untouched sections"""
+    if not overrides:
+        return strategy
+    variant = dict(strategy)
+    if "link_timing" in overrides:
+        variant["timing_strategy"] = dict(strategy.get("timing_strategy", {}), link_timing=overrides["link_timing"])
+    tactic_overrides = {key: overrides[key] for key in ("opening_phrases", "consultation_triggers", "successful_transitions") if key in overrides}
+    if tactic_overrides:
+        variant["conversation_tactics"] = dict(strategy.get("conversation_tactics", {}), **tactic_overrides)
+    return variant
+
+class Posterior:
+    """Beta posterior parameters of every variant, replaced as a whole on update"""
+    __slots__ = ("names", "alpha", "beta")
+
+    def __init__(self, names: List[str], alpha: np.ndarray, beta: np.ndarray):
+        self.names = names
+        self.alpha = alpha
+        self.beta = beta
+
+class StrategyExperiment:
+    """Thompson-sampling assignment of strategy variants"""
+
+    def __init__(self, variants: Dict[str, Dict] = None, seed: int = None):
+        self.variants = variants if variants is not None else load_variants()
+        names = list(self.variants)
+        self.posterior = Posterior(names, np.ones(len(names)), np.ones(len(names)))
+        self.rng = np.random.default_rng(seed)
+        self.assignments = {name: 0 for name in names}
+        # Assignments recorded in the store by every process, as of the last update
+        self.assigned = {}
+
+    def assign(self) -> str:
+        """Sample a variant for a new conversation"""
+        posterior = self.posterior
+        name = posterior.names[int(np.argmax(self.rng.beta(posterior.alpha, posterior.beta)))]
+        # Counts are only for metrics, a lost increment under contention is harmless
+        self.assignments[name] += 1
+        return name
+
+    @staticmethod
+    def record(stats: Dict, analysis: Dict):
+        """Count one analyzed conversation towards its variant"""
+        name = analysis.get("variant")
+        if not name:
+            return
+        counts = stats.setdefault(name, {"conversations": 0, "conversions": 0})
+        counts["conversations"] += 1
+        if analysis.get("link_shared"):
+            counts["conversions"] += 1
+
+    def update(self, stats: Dict, assigned: Dict[str, int] = None):
+        """Rebuild the posteriors from the recorded counts and the assignments of every process"""
+        names = list(self.variants)
+        assigned = assigned or {}
+        conversions = np.array([stats.get(name, {}).get("conversions", 0) for name in names], dtype=float)
+        # Conversations learned without a recorded assignment (older logs, re-analyzed archives) still count
+        conversations = np.array([max(assigned.get(name, 0), stats.get(name, {}).get("conversations", 0)) for name in names],
+                                 dtype=float)
+        self.posterior = Posterior(names, 1.0 + conversions, 1.0 + conversations - conversions)
+        self.assigned = assigned
+
+    def probability_best(self, draws: int = 2000) -> Dict[str, float]:
+        """Monte Carlo estimate of how likely each variant converts best"""
+        posterior = self.posterior
+        samples = self.rng.beta(posterior.alpha, posterior.beta, size=(draws, len(posterior.names)))
+        wins = np.bincount(samples.argmax(axis=1), minlength=len(posterior.names))
+        return {name: float(w / draws) for name, w in zip(posterior.names, wins)}
+
+    def report(self, stats: Dict) -> Dict:
+        """Per-variant counts, posterior mean and probability of being best"""
+        posterior = self.posterior
+        best = self.probability_best()
+        return {
+            name: {
+                "conversations": stats.get(name, {}).get("conversations", 0),
+                "conversions": stats.get(name, {}).get("conversions", 0),
+                "posterior_mean": float(a / (a + b)),
+                "probability_best": best[name],
+                "assigned": self.assigned.get(name, 0)
+            }
+            for name, a, b in zip(posterior.names, posterior.alpha, posterior.beta)
+        }
+
+    def export_prometheus(self) -> str:
+        posterior = self.posterior
+        lines = [
+            "# HELP sales_agent_variant_assignments_total Conversations assigned to each strategy variant.",
+            "# TYPE sales_agent_variant_assignments_total counter"
+        ]
+        lines += [f'sales_agent_variant_assignments_total{{variant="{name}"}} {self.assignments.get(name, 0)}' for name in posterior.names]
+        lines += [
+            "# HELP sales_agent_variant_conversion_rate Posterior mean conversion rate of each strategy variant.",
+            "# TYPE sales_agent_variant_conversion_rate gauge"
+        ]
+        lines += [f'sales_agent_variant_conversion_rate{{variant="{name}"}} {a / (a + b)}'
+                  for name, a, b in zip(posterior.names, posterior.alpha, posterior.beta)]
+        return "\n".join(lines) + "\n"
@@ -1,14 +1,126 @@
 import json
 import os
-from datetime import datetime
-from typing import Dict, List
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from conversation_analyzer import ConversationAnalyzer
+from conversion_analytics import ConversionAnalytics
+from strategy_experiment import StrategyExperiment, apply_variant
+from strategy_snapshot import HISTORY_KEYS, PackedRecords, json_default
+from strategy_store import StrategyStore
+from telemetry import get_telemetry
+
+# Fold the event log into the snapshot after this many conversations
+COMPACT_EVERY = 100
+
+_shared_manager = None
+_shared_lock = threading.Lock()
+
+def analyze_conversation_outcome(messages: List[Dict]):
+    """Analyze if link was shared and consultation requested"""
+    link_shared = False
+    consultation_requested = False
+    
+    for message in messages:
+        if message["role"] == "assistant":
+            content = message["content"].upper()
+            if "CALENDLY_LINK" in content or "EMAIL" in content:
+                link_shared = True
+            if "CONSULTATION" in content or "EXPERTS" in content or "CONSULTANTS" in content:
+                consultation_requested = True
+    
+    return link_shared, consultation_requested
+
+def copy_tree(value):
+    if isinstance(value, dict):
+        return {key: copy_tree(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_tree(item) for item in value]
+    return value
+
+def snapshot_strategies(strategies: Dict) -> Dict:
+    """Copy of the strategies for readers on other threads
+
+    Learned conversation records are never changed once appended, so the
+    history lists are copied without copying the records.
+    """
+    snapshot = {}
+    for key, value in strategies.items():
+        if key == 'learned_patterns':
+            value = {
+                name: (records.copy() if isinstance(records, PackedRecords) else list(records)) if name in HISTORY_KEYS
+                else copy_tree(records)
+                for name, records in value.items()
+            }
+        else:
+            value = copy_tree(value)
+        snapshot[key] = value
+    return snapshot
 
 class StrategyManager:
-    def __init__(self):
-        self.strategy_file = "conversation_strategies.json"
+    def __init__(self, strategy_file: str = "conversation_strategies.json", store_path: str = "conversation_strategies.db",
+                 archive_file: str = "conversation_archive.jsonl", max_conversations: int = 50,
+                 max_age_days: float = None, max_phrases: int = 200,
+                 analytics_file: str = "conversation_analytics.npz"):
+        self.strategy_file = strategy_file
+        self.store = StrategyStore(store_path, archive_path=archive_file)
+        
+        # Features of every conversation ever learned from, for choosing by lift
+        self.analytics_file = analytics_file
+        self.analytics = None
+        
+        # Retention of learned history, older records live in the archive file
+        self.max_conversations = max_conversations
+        self.max_age_days = max_age_days
+        self.max_phrases = max_phrases
+        
+        # Strategy variants under test, assigned per conversation
+        self.experiment = StrategyExperiment()
+        self.variant_strategies = {}
+        
+        # Bumped on every change so callers can skip work while it is unchanged
+        self.version = 0
+        self.lock = threading.RLock()
+        # Copy of self.strategies for readers, taken once per version; learning only mutates the original
+        self.published = None
+        self.published_version = None
+        self.store_version = None
+        
+        self.snapshot_event_id = 0
+        self.last_event_id = 0
         self.strategies = self.load_strategies()
         
     def load_strategies(self) -> Dict:
+        """Load the compacted snapshot and replay conversations logged after it"""
+        with self.lock:
+            self.store_version = self.store.data_version()
+            self.snapshot_event_id, strategies = self.store.read_snapshot()
+            if strategies is None:
+                strategies = self.import_json_strategies()
+            self.strategies = strategies
+            self.last_event_id = self.snapshot_event_id
+            self.analytics = self.load_analytics()
+            self.experiment.update(self.strategies.setdefault('experiment', {}), self.store.read_assignments())
+            self.version += 1
+            self.refresh()
+            return self.strategies
+    
+    def import_json_strategies(self) -> Dict:
+        """Seed the store from the JSON strategy file, archiving its full history"""
+        strategies = self.load_json_strategies()
+        patterns = strategies['learned_patterns']
+        history = patterns['successful_conversations'] + patterns['failed_conversations']
+        self.normalize_learned_patterns(strategies)
+        if not history:
+            return strategies
+        
+        # Keep only the retained window and write it as the first snapshot
+        self.store.compact(0, strategies, archive_records=history)
+        self.snapshot_event_id, snapshot = self.store.read_snapshot()
+        return snapshot if snapshot is not None else strategies
+    
+    def load_json_strategies(self) -> Dict:
+        """Seed from the JSON strategy file when the store has no snapshot yet"""
         if os.path.exists(self.strategy_file):
             try:
                 with open(self.strategy_file, 'r') as f:
@@ -17,7 +129,37 @@ class StrategyManager:
                 pass
         return self.get_default_strategies()
     
-    def get_default_strategies(self) -> Dict:
+    def refresh(self) -> bool:
+        """Apply conversations other sessions have logged since our last read"""
+        with self.lock:
+            events = self.store.read_events(self.last_event_id)
+            if events is None:
+                # Another process compacted past our position
+                self.load_strategies()
+                return True
+            for event_id, analysis in events:
+                self.apply_analysis(analysis)
+                self.last_event_id = event_id
+            assigned = self.store.read_assignments()
+            if events:
+                # Once per batch of events, the analytics cover all of them
+                self.optimize_strategy()
+            if events or assigned != self.experiment.assigned:
+                self.experiment.update(self.strategies['experiment'], assigned)
+                self.version += 1
+            return bool(events)
+    
+    def refresh_if_stale(self) -> bool:
+        """Refresh only when another connection has written to the store"""
+        store_version = self.store.data_version()
+        if store_version == self.store_version:
+            return False
+        with self.lock:
+            self.store_version = store_version
+            return self.refresh()
+    
+    @staticmethod
+    def get_default_strategies() -> Dict:
         return {
             "conversation_tactics": {
                 "opening_phrases": [
@@ -55,122 +197,135 @@ class StrategyManager:
             "learned_patterns": {
                 "successful_conversations": [],
                 "failed_conversations": [],
-                "successful_phrases": [],
-                "high_conversion_topics": []
+                "successful_phrases": {},
+                "high_conversion_topics": {}
             },
             "success_metrics": {
                 "link_shared": 0,
                 "consultations_requested": 0,
                 "conversations_completed": 0,
                 "conversion_rate": 0.0
-            }
+            },
+            "experiment": {}
         }
     
-    def analyze_conversation_success(self, messages: List[Dict], link_shared: bool, consultation_requested: bool):
+    def analyze_conversation_success(self, messages: List[Dict], link_shared: bool, consultation_requested: bool,
+                                     variant: str = None):
         """Analyze conversation and learn from it"""
-        # Extract conversation patterns
-        conversation_analysis = {
-            "timestamp": datetime.now().isoformat(),
-            "message_count": len([m for m in messages if m["role"] == "user"]),
-            "link_shared": link_shared,
-            "consultation_requested": consultation_requested,
-            "user_engagement": self.calculate_engagement(messages),
-            "topics_discussed": self.extract_topics(messages),
-            "successful_phrases": self.extract_phrases(messages, link_shared),
-            "conversation_flow": self.analyze_flow(messages),
-            "user_response_style": self.analyze_user_style(messages)
-        }
+        with get_telemetry().time("strategy_analysis"):
+            conversation_analysis = self.build_analysis(messages, link_shared, consultation_requested, variant=variant)
+        
+            self.learn_batch([conversation_analysis])
+            return True
+    
+    def learn_batch(self, analyses: List[Dict], assignments: Dict[str, int] = None,
+                    conversation_ids: List[Optional[str]] = None):
+        """Log analyses and variant assignments in one transaction, then merge everything logged since our last read
+
+        Analyses of conversations already learned from (by conversation_ids) are skipped.
+        """
+        with self.lock:
+            self.store.append_events(analyses, assignments, conversation_ids)
+            self.refresh()
+            self.compact_if_needed()
+    
+    @classmethod
+    def build_analysis(cls, messages: List[Dict], link_shared: bool, consultation_requested: bool, timestamp: str = None,
+                       variant: str = None) -> Dict:
+        """Extract the conversation patterns learned from; needs no manager state"""
+        return ConversationAnalyzer.from_messages(messages).finalize(link_shared, consultation_requested, timestamp, variant)
+    
+    def apply_analysis(self, conversation_analysis: Dict):
+        """Learn from one analyzed conversation"""
+        link_shared = conversation_analysis['link_shared']
+        consultation_requested = conversation_analysis['consultation_requested']
+        
+        patterns = self.strategies['learned_patterns']
         
         # Learn from conversations
         if link_shared:
-            self.strategies['learned_patterns']['successful_conversations'].append(conversation_analysis)
+            patterns['successful_conversations'].append(conversation_analysis)
             
-            # Add successful phrases to strategy
+            # Count successful phrases
+            phrase_counts = patterns['successful_phrases']
             for phrase in conversation_analysis['successful_phrases']:
-                if phrase not in self.strategies['learned_patterns']['successful_phrases']:
-                    self.strategies['learned_patterns']['successful_phrases'].append(phrase)
+                phrase_counts[phrase] = phrase_counts.get(phrase, 0) + 1
             
-            # Track high conversion topics
+            # Count high conversion topics
+            topic_counts = patterns['high_conversion_topics']
             for topic in conversation_analysis['topics_discussed']:
-                if topic not in self.strategies['learned_patterns']['high_conversion_topics']:
-                    self.strategies['learned_patterns']['high_conversion_topics'].append(topic)
+                topic_counts[topic] = topic_counts.get(topic, 0) + 1
             
             # Update response patterns based on what worked
             self.update_response_patterns(conversation_analysis)
         else:
-            self.strategies['learned_patterns']['failed_conversations'].append(conversation_analysis)
+            patterns['failed_conversations'].append(conversation_analysis)
+        
+        self.apply_retention(self.strategies)
         
         # Update metrics
         self.update_metrics(link_shared, consultation_requested)
+        self.experiment.record(self.strategies.setdefault('experiment', {}), conversation_analysis)
+        self.analytics.add(conversation_analysis)
+    
+    def normalize_learned_patterns(self, strategies: Dict):
+        """Convert phrase/topic lists from older strategy files to count maps"""
+        patterns = strategies['learned_patterns']
+        for key in ('successful_phrases', 'high_conversion_topics'):
+            if isinstance(patterns.get(key), list):
+                patterns[key] = {item: 1 for item in patterns[key]}
+        self.apply_retention(strategies)
+    
+    def apply_retention(self, strategies: Dict):
+        """Trim learned history to the configured window"""
+        patterns = strategies['learned_patterns']
+        for key in ('successful_conversations', 'failed_conversations'):
+            conversations = patterns[key]
+            if len(conversations) > self.max_conversations:
+                del conversations[:len(conversations) - self.max_conversations]
+            if self.max_age_days is not None and conversations:
+                # Measured from the newest record so replays evict the same records
+                newest = datetime.fromisoformat(conversations[-1]['timestamp'])
+                cutoff = (newest - timedelta(days=self.max_age_days)).isoformat()
+                expired = 0
+                while expired < len(conversations) and conversations[expired]['timestamp'] < cutoff:
+                    expired += 1
+                del conversations[:expired]
         
-        # Optimize strategy
-        self.optimize_strategy()
-        
-        # Save locally
-        self.save_strategies()
-        return True
-    
-    def extract_topics(self, messages: List[Dict]) -> List[str]:
-        topics = set()
-        for msg in messages:
-            content = msg["content"].lower()
-            if "singapore" in content: topics.add("singapore")
-            if "hong kong" in content or "hk" in content: topics.add("hong_kong")
-            if "usa" in content or "america" in content or "florida" in content or "new mexico" in content: topics.add("usa")
-            if "uk" in content or "britain" in content: topics.add("uk")
-            if "malaysia" in content: topics.add("malaysia")
-            if "thailand" in content: topics.add("thailand")
-            if "cost" in content or "price" in content: topics.add("pricing")
-            if "timeline" in content or "urgent" in content: topics.add("urgency")
-            if "bank" in content: topics.add("banking")
-            if "tax" in content: topics.add("taxation")
-        return list(topics)
-    
-    def extract_phrases(self, messages: List[Dict], was_successful: bool) -> List[str]:
-        if not was_successful:
-            return []
-        
-        phrases = []
-        for msg in messages:
-            if msg["role"] == "assistant":
-                content = msg["content"]
-                # Extract opening phrases that worked
-                sentences = content.split('. ')
-                for sentence in sentences:
-                    if any(start in sentence for start in ["Sure", "Yes", "Happy to help", "Let me share", "No problem"]):
-                        phrase = sentence.strip().split('.')[0][:50]
-                        if phrase:
-                            phrases.append(phrase)
-        return phrases
-    
-    def analyze_flow(self, messages: List[Dict]) -> List[str]:
-        flow = []
-        for msg in messages:
-            if msg["role"] == "assistant":
-                content = msg["content"].lower()
-                if "?" in content: flow.append("question_asked")
-                if "calendly" in content or "email" in content: flow.append("consultation_offered")
-                if "banking" in content or "payment" in content: flow.append("banking_discussed")
-                if "tax" in content: flow.append("taxation_discussed")
-                if "timeline" in content or "week" in content: flow.append("timeline_discussed")
-        return flow
-    
-    def analyze_user_style(self, messages: List[Dict]) -> str:
-        user_messages = [m for m in messages if m["role"] == "user"]
-        if not user_messages:
-            return "unknown"
-        
-        avg_length = sum(len(m["content"].split()) for m in user_messages) / len(user_messages)
-        question_count = sum(1 for m in user_messages if "?" in m["content"])
-        
-        if avg_length < 5:
-            return "brief"
-        elif avg_length > 20:
-            return "detailed"
-        elif question_count > 2:
-            return "inquisitive"
-        else:
-            return "standard"
+        # Drop the least used phrases once over the cap
+        phrase_counts = patterns['successful_phrases']
+        while len(phrase_counts) > self.max_phrases:
+            del phrase_counts[min(phrase_counts, key=phrase_counts.get)]
+    
+    def compact_if_needed(self):
+        if self.last_event_id - self.snapshot_event_id >= COMPACT_EVERY:
+            self.compact()
+    
+    def compact(self) -> bool:
+        """Fold the logged conversations into the stored snapshot"""
+        if self.store.compact(self.last_event_id, self.strategies):
+            self.snapshot_event_id = self.last_event_id
+            self.analytics.save(self.analytics_file, self.last_event_id)
+            return True
+        return False
+    
+    def load_analytics(self) -> ConversionAnalytics:
+        """Load the analytics saved with the snapshot, or rebuild them from the archive"""
+        analytics = ConversionAnalytics.load(self.analytics_file)
+        if analytics is not None and analytics.last_event_id == self.snapshot_event_id:
+            return analytics
+        
+        # Every conversation folded into the snapshot has been archived
+        analytics = ConversionAnalytics()
+        archive_path = self.store.archive_path
+        if archive_path and os.path.exists(archive_path):
+            with open(archive_path, 'r') as f:
+                for line in f:
+                    try:
+                        analytics.add(json.loads(line))
+                    except ValueError:
+                        continue
+        return analytics
     
     def update_response_patterns(self, analysis: Dict):
         topics = analysis.get('topics_discussed', [])
@@ -186,14 +341,6 @@ class StrategyManager:
             if 'banking' in topics:
                 self.strategies['conversation_tactics']['response_patterns']['banking_inquiry'] = f"{best_phrase}. We work with several banking partners and the best option depends on your industry and home country. Would you like to discuss this in detail?"
     
-    def calculate_engagement(self, messages: List[Dict]) -> float:
-        user_messages = [m for m in messages if m["role"] == "user"]
-        if not user_messages:
-            return 0.0
-        
-        avg_length = sum(len(m["content"].split()) for m in user_messages) / len(user_messages)
-        return min(avg_length / 15, 1.0)
-    
     def update_metrics(self, link_shared: bool, consultation_requested: bool):
         self.strategies["success_metrics"]["conversations_completed"] += 1
         if link_shared:
@@ -209,33 +356,70 @@ class StrategyManager:
             ) * 100
     
     def optimize_strategy(self):
-        successful_conversations = self.strategies['learned_patterns']['successful_conversations']
-        
-        if len(successful_conversations) < 3:
-            return
-        
-        # Optimize timing based on successful conversations
-        recent_successes = successful_conversations[-10:]
-        if recent_successes:
-            avg_timing = sum(conv['message_count'] for conv in recent_successes) / len(recent_successes)
-            new_timing = max(3, min(6, int(avg_timing)))
-            self.strategies['timing_strategy']['link_timing'] = new_timing
-        
-        # Update successful transitions based on high conversion topics
-        if self.strategies['learned_patterns']['high_conversion_topics']:
-            for topic in self.strategies['learned_patterns']['high_conversion_topics'][-5:]:
-                if topic == 'banking':
-                    transition = "We have established relationships with banking institutions"
-                    if transition not in self.strategies['conversation_tactics']['successful_transitions']:
-                        self.strategies['conversation_tactics']['successful_transitions'].append(transition)
+        """Choose link timing, opening phrases and transitions by conversion lift"""
+        tactics = self.strategies['conversation_tactics']
+        
+        link_timing = self.analytics.choose_link_timing()
+        if link_timing is not None:
+            self.strategies['timing_strategy']['link_timing'] = link_timing
+        
+        phrases = self.analytics.choose_phrases()
+        if phrases:
+            tactics['opening_phrases'] = phrases
+        
+        transitions = self.analytics.choose_transitions()
+        if transitions:
+            tactics['successful_transitions'] = transitions
+        
+        self.strategies['analytics'] = self.analytics.report()
     
     def get_current_strategy(self) -> Dict:
-        return self.strategies
+        """Snapshot of the current strategy, never modified by later learning"""
+        self.refresh_if_stale()
+        with self.lock:
+            if self.published_version != self.version:
+                self.published = snapshot_strategies(self.strategies)
+                self.published_version = self.version
+            return self.published
+    
+    def assign_variant(self) -> str:
+        """Pick the strategy variant for a new conversation
+
+        The assignment is only counted once it reaches learn_batch, see
+        LearningQueue.assign_variant.
+        """
+        return self.experiment.assign()
+    
+    def get_variant_strategy(self, variant: str = None) -> Dict:
+        """Current strategy with a variant's overrides, built once per strategy version"""
+        strategy = self.get_current_strategy()
+        overrides = self.experiment.variants.get(variant)
+        if not overrides:
+            return strategy
+        with self.lock:
+            key = (self.published_version, variant)
+            cached = self.variant_strategies.get(key)
+            if cached is None:
+                cached = apply_variant(strategy, overrides)
+                # Only the current version is ever asked for again
+                self.variant_strategies = {k: v for k, v in self.variant_strategies.items() if k[0] == key[0]}
+                self.variant_strategies[key] = cached
+            return cached
     
     def save_strategies(self):
+        """Export the current strategy to the JSON strategy file"""
         try:
             with open(self.strategy_file, 'w') as f:
-                json.dump(self.strategies, f, indent=2)
+                json.dump(self.strategies, f, indent=2, default=json_default)
             return True
         except Exception:
             return False
+
+def get_shared_strategy_manager() -> StrategyManager:
+    """Get the strategy manager shared by every session in the process"""
+    global _shared_manager
+    with _shared_lock:
+        if _shared_manager is None:
+            _shared_manager = StrategyManager()
+            get_telemetry().add_collector(_shared_manager.experiment.export_prometheus)
+        return _shared_manager
@@ -0,0 +1,174 @@
+"""Compact binary format of the compacted strategy snapshot.
+
+A small JSON header holds the hot configuration (tactics, timing, metrics,
+phrase and topic counts, experiment counts) and is all a load parses. The
+retained conversation records follow as array-packed sections: a uint32
+offset table and the records as compact JSON, each a list of values in the
+header's field order. Records are decoded one at a time when first
+touched, and records nobody touched are copied as raw bytes when the
+snapshot is written again.
+"""
+import json
+import struct
+from array import array
+from collections.abc import MutableSequence
+from typing import Dict, Iterator, List
+
+MAGIC = b"SSNP1\n"
+HISTORY_KEYS = ("successful_conversations", "failed_conversations")
+
+class PackedRecords(MutableSequence):
+    """Conversation records of a snapshot section, decoded on first access"""
+
+    def __init__(self, fields: List[str], offsets: memoryview = None, blob: memoryview = None):
+        self.fields = fields
+        self.offsets = offsets
+        self.blob = blob
+        self.count = len(offsets) - 1 if offsets is not None else 0
+        # Decoded records, or the position of a record still in the blob; built on first access
+        self.items = None
+
+    def materialize(self) -> List:
+        if self.items is None:
+            self.items = list(range(self.count))
+        return self.items
+
+    def decode(self, position: int) -> Dict:
+        values = json.loads(bytes(self.raw(position)))
+        return dict(zip(self.fields, values)) if isinstance(values, list) else values
+
+    def raw(self, position: int) -> memoryview:
+        return self.blob[self.offsets[position]:self.offsets[position + 1]]
+
+    def __len__(self):
+        return self.count if self.items is None else len(self.items)
+
+    def __getitem__(self, index):
+        items = self.materialize()
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(items)))]
+        item = items[index]
+        if isinstance(item, int):
+            item = items[index] = self.decode(item)
+        return item
+
+    def __setitem__(self, index, value):
+        self.materialize()[index] = value
+
+    def __delitem__(self, index):
+        del self.materialize()[index]
+
+    def insert(self, index: int, value: Dict):
+        self.materialize().insert(index, value)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_list(self) -> List[Dict]:
+        return list(self)
+
+    def copy(self) -> "PackedRecords":
+        """Copy sharing the packed bytes and the decoded records"""
+        copy = PackedRecords(self.fields, self.offsets, self.blob)
+        copy.items = None if self.items is None else list(self.items)
+        return copy
+
+    def __reduce__(self):
+        # Memoryviews do not pickle, e.g. when a strategy is sent to a worker process
+        return list, (self.to_list(),)
+
+    def encoded(self, fields: List[str]) -> Iterator[bytes]:
+        """Records encoded for fields, reusing the bytes of records never decoded"""
+        items = self.items if self.items is not None else range(self.count)
+        # Positional records stay valid while the old fields are a prefix of the new ones
+        reusable = fields[:len(self.fields)] == self.fields
+        for item in items:
+            if isinstance(item, int):
+                if reusable:
+                    yield bytes(self.raw(item))
+                    continue
+                item = self.decode(item)
+            yield encode_record(item, fields)
+
+def encode_record(record: Dict, fields: List[str]) -> bytes:
+    keys = list(record)
+    if keys == fields[:len(keys)]:
+        return json.dumps(list(record.values()), separators=(",", ":")).encode()
+    return json.dumps(record, separators=(",", ":")).encode()
+
+def record_fields(sections: List) -> List[str]:
+    """Union of the record keys in first-seen order, starting from any packed section's fields"""
+    fields = []
+    for records in sections:
+        if isinstance(records, PackedRecords):
+            for field in records.fields:
+                if field not in fields:
+                    fields.append(field)
+    for records in sections:
+        items = (records.items or []) if isinstance(records, PackedRecords) else records
+        for record in items:
+            if isinstance(record, dict):
+                for field in record:
+                    if field not in fields:
+                        fields.append(field)
+    return fields
+
+def encode_snapshot(strategies: Dict) -> bytes:
+    patterns = strategies.get("learned_patterns", {})
+    hot = dict(strategies)
+    # History keys stay in the header as placeholders so the export keeps its key order
+    hot["learned_patterns"] = {key: None if key in HISTORY_KEYS else value for key, value in patterns.items()}
+    sections = [(key, patterns.get(key, [])) for key in HISTORY_KEYS]
+    fields = record_fields([records for _, records in sections])
+
+    # Per section: count + 1 record offsets (uint32), then the records, padded to 4 bytes
+    data = bytearray()
+    layout = []
+    for key, records in sections:
+        encoded = list(records.encoded(fields)) if isinstance(records, PackedRecords) else \
+            [encode_record(record, fields) for record in records]
+        offsets = array('I', [0])
+        for record in encoded:
+            offsets.append(offsets[-1] + len(record))
+        layout.append([key, len(encoded), len(data)])
+        data += offsets.tobytes()
+        data += b"".join(encoded)
+        data += b" " * (-len(data) % 4)
+
+    header = json.dumps({"strategies": hot, "fields": fields, "sections": layout}, separators=(",", ":")).encode()
+    # Pad the header so the sections start 4-byte aligned
+    padding = -(len(MAGIC) + 4 + len(header)) % 4
+    return MAGIC + struct.pack("<I", len(header) + padding) + header + b" " * padding + bytes(data)
+
+def is_snapshot(payload) -> bool:
+    return isinstance(payload, (bytes, bytearray, memoryview)) and bytes(payload[:len(MAGIC)]) == MAGIC
+
+def decode_snapshot(payload: bytes) -> Dict:
+    """Strategies with the history sections left packed until they are read"""
+    if not is_snapshot(payload):
+        raise ValueError("not a strategy snapshot")
+    view = memoryview(payload)
+    header_length = struct.unpack_from("<I", view, len(MAGIC))[0]
+    header_start = len(MAGIC) + 4
+    header = json.loads(bytes(view[header_start:header_start + header_length]))
+    data_start = header_start + header_length
+
+    strategies = header["strategies"]
+    patterns = strategies.setdefault("learned_patterns", {})
+    fields = header["fields"]
+    for key, count, start in header["sections"]:
+        start += data_start
+        offsets = view[start:start + 4 * (count + 1)].cast('I')
+        blob_start = start + 4 * (count + 1)
+        patterns[key] = PackedRecords(fields, offsets, view[blob_start:blob_start + offsets[count]])
+    return strategies
+
+def json_default(value):
+    if isinstance(value, PackedRecords):
+        return value.to_list()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def to_json(strategies: Dict, indent: int = None) -> str:
+    """JSON export of strategies that may hold packed records"""
+    return json.dumps(strategies, indent=indent, default=json_default)
@@ -0,0 +1,172 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from strategy_snapshot import decode_snapshot, encode_snapshot, is_snapshot
+
+class StrategyStore:
+    """Append-only log of analyzed conversations with a compacted snapshot.
+
+    Sessions and processes append one row per conversation instead of
+    rewriting the whole strategy file. Readers rebuild the strategy from the
+    latest snapshot plus the events logged after it, so every writer's
+    learning is merged. SQLite in WAL mode gives atomic appends and lets
+    readers run alongside a writer.
+
+    The snapshot is stored in the strategy_snapshot binary format, so a
+    load parses the hot configuration only and leaves the retained
+    conversation records packed. Snapshots written as JSON text by older
+    versions are still read.
+
+    Conversations submitted with an id are learned from once: the ids
+    already learned are remembered, so a conversation analyzed again later
+    (e.g. auto-analysis, then Clear Conversation after the queue drained) is
+    not counted twice, even by another process.
+
+    When an archive path is set, compaction moves the folded events to that
+    JSONL file, so it keeps every conversation while the snapshot only holds
+    the retained window.
+    """
+
+    def __init__(self, db_path: str = "conversation_strategies.db", archive_path: str = None):
+        self.db_path = db_path
+        self.archive_path = archive_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL, payload TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshot ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), last_event_id INTEGER NOT NULL, "
+            "created_at TEXT NOT NULL, payload TEXT NOT NULL)"
+        )
+        # Conversations assigned to each strategy variant, whether or not they were ever learned from
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS assignments (variant TEXT PRIMARY KEY, count INTEGER NOT NULL)"
+        )
+        # Ids of the conversations already learned from, kept after their events are compacted
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS learned (conversation_id TEXT PRIMARY KEY, created_at TEXT NOT NULL) WITHOUT ROWID"
+        )
+
+    def append_events(self, events: List[Dict], assignments: Dict[str, int] = None,
+                      conversation_ids: List[Optional[str]] = None) -> int:
+        """Append several analyses and add variant assignment counts in one transaction
+
+        conversation_ids, parallel to events, skip conversations already
+        learned from; None ids are always appended. Returns the last event id,
+        0 when no events were appended.
+        """
+        if not events and not assignments:
+            return 0
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = None
+                for event, conversation_id in zip(events, conversation_ids or [None] * len(events)):
+                    if conversation_id is not None and not self.conn.execute(
+                        "INSERT OR IGNORE INTO learned (conversation_id, created_at) VALUES (?, ?)", (str(conversation_id), now)
+                    ).rowcount:
+                        continue
+                    cursor = self.conn.execute(
+                        "INSERT INTO events (created_at, payload) VALUES (?, ?)",
+                        (now, json.dumps(event))
+                    )
+                for variant, count in (assignments or {}).items():
+                    self.conn.execute(
+                        "INSERT INTO assignments (variant, count) VALUES (?, ?) "
+                        "ON CONFLICT(variant) DO UPDATE SET count = count + excluded.count",
+                        (variant, count)
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            return cursor.lastrowid if cursor is not None else 0
+
+    def read_assignments(self) -> Dict[str, int]:
+        """Conversations assigned to each variant by every process"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT variant, count FROM assignments").fetchall())
+
+    def read_snapshot(self) -> Tuple[int, Optional[Dict]]:
+        """Get (last_event_id, strategies) of the compacted snapshot"""
+        with self.lock:
+            row = self.conn.execute("SELECT last_event_id, payload FROM snapshot WHERE id = 1").fetchone()
+        if row is None:
+            return 0, None
+        payload = row[1]
+        return row[0], decode_snapshot(payload) if is_snapshot(payload) else json.loads(payload)
+
+    def read_events(self, after_event_id: int) -> Optional[List[Tuple[int, Dict]]]:
+        """Get events logged after the given id.
+
+        Returns None when a compaction has folded events past that id into
+        the snapshot, in which case the caller has to reload the snapshot.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                row = self.conn.execute("SELECT last_event_id FROM snapshot WHERE id = 1").fetchone()
+                if row is not None and row[0] > after_event_id:
+                    return None
+                rows = self.conn.execute(
+                    "SELECT id, payload FROM events WHERE id > ? ORDER BY id", (after_event_id,)
+                ).fetchall()
+            finally:
+                self.conn.execute("COMMIT")
+        return [(event_id, json.loads(payload)) for event_id, payload in rows]
+
+    def compact(self, last_event_id: int, strategies: Dict, archive_records: List[Dict] = None) -> bool:
+        """Replace the snapshot with strategies folded up to last_event_id and drop those events
+
+        archive_records are extra records (e.g. imported history) to archive
+        along with the folded events. Returns False if another writer already
+        compacted this far.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT last_event_id FROM snapshot WHERE id = 1").fetchone()
+                if row is not None and row[0] >= last_event_id:
+                    self.conn.execute("ROLLBACK")
+                    return False
+                if self.archive_path:
+                    # Archive before deleting: a failed commit may duplicate records but never loses them
+                    rows = self.conn.execute(
+                        "SELECT payload FROM events WHERE id <= ? ORDER BY id", (last_event_id,)
+                    ).fetchall()
+                    self.archive((archive_records or []) + [json.loads(payload) for (payload,) in rows])
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO snapshot (id, last_event_id, created_at, payload) VALUES (1, ?, ?, ?)",
+                    (last_event_id, datetime.now().isoformat(), encode_snapshot(strategies))
+                )
+                self.conn.execute("DELETE FROM events WHERE id <= ?", (last_event_id,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def archive(self, records: List[Dict]):
+        """Append records to the cold archive file"""
+        if not records:
+            return
+        with open(self.archive_path, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    def data_version(self) -> int:
+        """Changes whenever another connection commits to the store"""
+        with self.lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,8 +1,12 @@
 import streamlit as st
 import json
+import uuid
 from datetime import datetime
-from agent_openrouter import create_agent
-from strategy_manager import StrategyManager
+from agent_openrouter import create_agent, warm_up_shared_resources
+from learning_queue import get_learning_queue
+from strategy_manager import get_shared_strategy_manager
+from strategy_snapshot import to_json
+from telemetry import get_telemetry
 
 # Page config
 st.set_page_config(
@@ -11,38 +15,47 @@ st.set_page_config(
     layout="wide"
 )
 
+# Main interface, rendered before anything is initialized
+st.title("🤖 Strasia Sales Agent")
+st.markdown("**AI-Powered Corporate Services Consultant**")
+st.markdown("---")
+
+# Shared resources load in the background once per process, the OpenAI SDK included
+warm_up_shared_resources()
+telemetry = get_telemetry()
+
 # Initialize session state
 if 'agent' not in st.session_state:
+    # The lead id lives in the URL, so a reload or a return visit resumes the conversation
+    lead_id = st.query_params.get("lead") or uuid.uuid4().hex
+    st.query_params["lead"] = lead_id
     with st.spinner("🤖 Initializing sales agent..."):
-        st.session_state.agent = create_agent()
+        with telemetry.startup_phase("session_agent"):
+            st.session_state.agent = create_agent(lead_id)
+        with telemetry.startup_phase("session_resume"):
+            st.session_state.agent.resume()
+    # A resumed conversation whose link was already answered was learned from back then
+    if st.session_state.agent.analyzer.link_answered:
+        st.session_state.conversation_analyzed = True
 
-if 'messages' not in st.session_state:
-    st.session_state.messages = []
+# The agent's memory is the transcript, rendered here without a second copy
+st.session_state.messages = st.session_state.agent.memory
 
 if 'session_id' not in st.session_state:
     st.session_state.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
 
 if 'strategy_manager' not in st.session_state:
-    st.session_state.strategy_manager = StrategyManager()
+    with telemetry.startup_phase("strategy_manager"):
+        st.session_state.strategy_manager = get_shared_strategy_manager()
 
-# Set strategy context for agent
-current_strategy = st.session_state.strategy_manager.get_current_strategy()
-st.session_state.agent.set_strategy_context(current_strategy)
+# Strategy variant under test and learning queue key, stored with a resumed conversation and renewed when it is cleared
+if st.session_state.agent.conversation_id is None:
+    st.session_state.agent.conversation_id = uuid.uuid4().hex
+    st.session_state.agent.variant = get_learning_queue().assign_variant()
 
-def analyze_conversation_outcome(messages):
-    """Analyze if link was shared and consultation requested"""
-    link_shared = False
-    consultation_requested = False
-    
-    for message in messages:
-        if message["role"] == "assistant":
-            content = message["content"].upper()
-            if "CALENDLY_LINK" in content or "EMAIL" in content:
-                link_shared = True
-            if "CONSULTATION" in content or "EXPERTS" in content or "CONSULTANTS" in content:
-                consultation_requested = True
-    
-    return link_shared, consultation_requested
+# Set strategy context for agent, rebuilt only when the shared strategy changed
+current_strategy = st.session_state.strategy_manager.get_variant_strategy(st.session_state.agent.variant)
+st.session_state.agent.set_strategy_context(current_strategy, st.session_state.strategy_manager.version)
 
 # Sidebar
 st.sidebar.title("🤖 Agent Controls")
@@ -53,7 +66,46 @@ metrics = strategy.get('success_metrics', {})
 
 st.sidebar.metric("Conversations", metrics.get('conversations_completed', 0))
 st.sidebar.metric("Conversion Rate", f"{metrics.get('conversion_rate', 0):.1f}%")
-st.sidebar.metric("Link Timing", f"Message {strategy.get('timing_strategy', {}).get('link_timing', 4)}")
+st.sidebar.metric("Link Timing", f"Message {current_strategy.get('timing_strategy', {}).get('link_timing', 4)}")
+
+# A/B variants and their posteriors
+with st.sidebar.expander("🎲 Strategy Variants"):
+    st.caption(f"This conversation: {st.session_state.agent.variant}")
+    report = st.session_state.strategy_manager.experiment.report(strategy.get('experiment', {}))
+    st.table([
+        {
+            "variant": name,
+            "conversations": row["conversations"],
+            "conversion": f"{row['posterior_mean']:.0%}",
+            "P(best)": f"{row['probability_best']:.0%}"
+        }
+        for name, row in report.items()
+    ])
+
+# Per-turn latency and cost
+with st.sidebar.expander("⏱️ Turn Telemetry"):
+    last_trace = st.session_state.agent.last_trace
+    if last_trace:
+        st.caption(f"Last turn: {last_trace.source} via {last_trace.model}")
+        st.metric("Turn Latency", f"{last_trace.duration_seconds * 1000:.0f} ms")
+        if last_trace.first_token_seconds is not None:
+            st.metric("First Token", f"{last_trace.first_token_seconds * 1000:.0f} ms")
+        st.table({stage: f"{seconds * 1000:.1f} ms" for stage, seconds in last_trace.stages.items()})
+        st.caption(f"Tokens: {last_trace.prompt_tokens} prompt / {last_trace.completion_tokens} completion, ${last_trace.cost:.5f}")
+        if last_trace.error:
+            st.warning(f"Fell back after {last_trace.error}")
+
+    summary = telemetry.summary()
+    st.caption(
+        f"All sessions: {summary['turns']} turns, p50 {summary['p50_ms']:.0f} ms, p95 {summary['p95_ms']:.0f} ms, "
+        f"cache hits {summary['cache_hit_rate']:.0%}, fallbacks {summary['fallback_rate']:.0%}, ${summary['cost_usd']:.4f}"
+    )
+    st.download_button("Prometheus metrics", telemetry.export_prometheus(), file_name="metrics.prom")
+    st.download_button("Trace JSONL", telemetry.export_jsonl(), file_name="turn_traces.jsonl")
+    startup = dict(telemetry.startup)
+    if startup:
+        st.caption("Startup phases")
+        st.table({phase: f"{seconds * 1000:.1f} ms" for phase, seconds in startup.items()})
 
 # View Strategy JSON
 if st.sidebar.button("📄 View Strategy JSON"):
@@ -61,17 +113,18 @@ if st.sidebar.button("📄 View Strategy JSON"):
 
 # Clear conversation with analysis
 if st.sidebar.button("🗑️ Clear Conversation"):
-    # Analyze current conversation before clearing
-    if len(st.session_state.messages) > 0:
-        link_shared, consultation_requested = analyze_conversation_outcome(st.session_state.messages)
+    # Analyze current conversation before clearing, unless auto-analysis already learned from it
+    if len(st.session_state.messages) > 0 and not hasattr(st.session_state, 'conversation_analyzed'):
+        analyzer = st.session_state.agent.analyzer
         
-        if link_shared or len(st.session_state.messages) >= 6:
-            st.session_state.strategy_manager.analyze_conversation_success(
-                st.session_state.messages, link_shared, consultation_requested
+        if analyzer.link_shared or len(st.session_state.messages) >= 6:
+            # Learned in the background
+            get_learning_queue().submit(
+                analyzer.finalize(variant=st.session_state.agent.variant), st.session_state.agent.conversation_id
             )
-            st.sidebar.success("✅ Strategy updated!")
+            st.sidebar.success("✅ Strategy update queued!")
     
-    st.session_state.messages = []
+    # Clearing drops the conversation id and variant, a new one is assigned on the rerun
     st.session_state.agent.clear_memory()
     if hasattr(st.session_state, 'conversation_analyzed'):
         delattr(st.session_state, 'conversation_analyzed')
@@ -99,23 +152,18 @@ with st.sidebar.expander("🧪 Test Scenarios"):
         st.session_state.test_message = test_message
         st.rerun()
 
-# Main interface
-st.title("🤖 Strasia Sales Agent")
-st.markdown("**AI-Powered Corporate Services Consultant**")
-st.markdown("---")
-
 # Show JSON if requested
 if hasattr(st.session_state, 'show_json') and st.session_state.show_json:
     with st.expander("📄 Strategy JSON", expanded=True):
-        st.json(current_strategy)
+        st.json(to_json(current_strategy))
         if st.button("Close JSON"):
             delattr(st.session_state, 'show_json')
             st.rerun()
 
 # Chat interface
 for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+    with st.chat_message(message.role):
+        st.markdown(message.content)
 
 # Input handling
 user_input = st.chat_input("Type your message here...")
@@ -126,13 +174,8 @@ if hasattr(st.session_state, 'test_message'):
     delattr(st.session_state, 'test_message')
 
 if user_input:
-    # Add user message
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    st.session_state.messages.append({
-        "role": "user", 
-        "content": user_input,
-        "timestamp": timestamp
-    })
+    # The agent adds the exchange to the transcript once it has replied
+    recorded = st.session_state.messages.total
     
     # Display user message
     with st.chat_message("user"):
@@ -140,35 +183,25 @@ if user_input:
     
     # Generate and display assistant response
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                response = st.session_state.agent.generate_response(user_input)
-                st.markdown(response)
-                
-                # Add assistant response to messages
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": response,
-                    "timestamp": datetime.now().strftime("%H:%M:%S")
-                })
-                
-            except Exception as e:
-                error_msg = f"Error: {str(e)}"
-                st.error(error_msg)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": error_msg,
-                    "timestamp": datetime.now().strftime("%H:%M:%S")
-                })
-
-# Auto-analyze when link is shared
-if len(st.session_state.messages) > 0:
-    link_shared, consultation_requested = analyze_conversation_outcome(st.session_state.messages)
+        try:
+            # Stream tokens into the bubble as they arrive
+            st.write_stream(st.session_state.agent.generate_response_stream(user_input))
+            
+        except Exception as e:
+            error_msg = f"Error: {str(e)}"
+            st.error(error_msg)
+            if st.session_state.messages.total == recorded:
+                st.session_state.agent.add_to_history("user", user_input)
+                st.session_state.agent.add_to_history("assistant", error_msg)
+
+# Auto-analyze once the lead has answered the link
+if len(st.session_state.messages) > 0 and not hasattr(st.session_state, 'conversation_analyzed'):
+    analyzer = st.session_state.agent.analyzer
     
-    # Auto-analyze when conversation ends (when link is shared)
-    if link_shared and not hasattr(st.session_state, 'conversation_analyzed'):
-        st.session_state.strategy_manager.analyze_conversation_success(
-            st.session_state.messages, link_shared, consultation_requested
+    # Their answer tells whether the call was accepted; an unanswered link is learned on Clear
+    if analyzer.link_answered:
+        get_learning_queue().submit(
+            analyzer.finalize(variant=st.session_state.agent.variant), st.session_state.agent.conversation_id
         )
         st.session_state.conversation_analyzed = True
         st.success("🧠 AI learned from this conversation!")
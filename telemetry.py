@@ -0,0 +1,428 @@
+"""Per-turn latency, token and cost tracing for the agent pipeline.
+
+Every agent turn produces a TurnTrace with stage durations (cache lookup,
+knowledge retrieval, history, LLM call, post-processing), token usage,
+estimated cost and how the turn was answered. Traces are aggregated into
+Prometheus-style counters and histograms by the process-wide Telemetry and
+can be appended to a JSONL trace file (AGENT_TRACE_FILE). The trace file
+is written by a background thread in batches, so a slow disk never holds
+up a turn or the metrics lock; lines beyond the writer's backlog are
+dropped and counted. Setting AGENT_METRICS_PORT also serves the metrics
+at http://host:port/metrics.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+TRACE_FILE = os.environ.get("AGENT_TRACE_FILE")
+METRICS_PORT = os.environ.get("AGENT_METRICS_PORT")
+# Trace lines waiting for the writer before new ones are dropped
+MAX_PENDING_TRACES = int(os.environ.get("AGENT_TRACE_MAX_PENDING", "10000"))
+
+# USD per million prompt and completion tokens
+MODEL_PRICES = {
+    "anthropic/claude-3.5-sonnet": (3.0, 15.0),
+    "anthropic/claude-3.5-haiku": (0.8, 4.0),
+    "anthropic/claude-3-haiku": (0.25, 1.25),
+    "openai/gpt-4o-mini": (0.15, 0.6),
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# How a turn was answered
+SOURCES = ("llm", "cache", "learned", "routed", "fallback")
+
+_shared_telemetry = None
+_shared_lock = threading.Lock()
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+class TurnTrace:
+    """Timings and usage recorded for one agent turn"""
+
+    def __init__(self, model: str, stream: bool = False):
+        self.model = model
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.stages = {}
+        self.source = "llm"
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.attempts = 0
+        self.hedged = False
+        self.hedge_won = False
+        self.intent = None
+        self.intent_confidence = None
+        self.first_token_seconds = None
+        self.duration_seconds = None
+        self.error = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a pipeline stage; repeated stages add up"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def first_token(self):
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.started
+
+    def record_usage(self, usage):
+        """Take token counts from an OpenAI-style usage object, if the provider sent one"""
+        if usage is None:
+            return
+        self.prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.cached_prompt_tokens = getattr(details, "cached_tokens", 0) or 0
+
+    def fail(self, error: Exception):
+        self.source = "fallback"
+        self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def cost(self) -> float:
+        return estimate_cost(self.model, self.prompt_tokens, self.completion_tokens)
+
+    def finish(self):
+        if self.duration_seconds is None:
+            self.duration_seconds = time.perf_counter() - self.started
+
+    def to_dict(self) -> Dict:
+        return {
+            "timestamp": self.timestamp,
+            "model": self.model,
+            "stream": self.stream,
+            "source": self.source,
+            "duration_ms": round((self.duration_seconds or 0.0) * 1000, 3),
+            "first_token_ms": round(self.first_token_seconds * 1000, 3) if self.first_token_seconds is not None else None,
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "cost_usd": round(self.cost, 8),
+            "attempts": self.attempts,
+            "hedged": self.hedged,
+            "hedge_won": self.hedge_won,
+            "intent": self.intent,
+            "intent_confidence": round(self.intent_confidence, 4) if self.intent_confidence is not None else None,
+            "error": self.error
+        }
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def lines(self, name: str, labels: str = "") -> List[str]:
+        sep = "," if labels else ""
+        lines = [f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}' for bound, count in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+class TraceWriter:
+    """Appends JSONL lines to a file from a worker thread, one open and write per batch"""
+
+    def __init__(self, path: str, max_pending: int = MAX_PENDING_TRACES):
+        self.path = path
+        self.max_pending = max_pending
+        self.pending = []
+        self.condition = threading.Condition()
+        self.writing = False
+        self.closed = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self.worker = threading.Thread(target=self.run, name="trace-writer", daemon=True)
+        self.worker.start()
+
+    def write(self, line: str) -> bool:
+        """Queue one line; False if it was dropped because the backlog is full or the writer closed"""
+        with self.condition:
+            if self.closed or len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self.pending.append(line)
+            self.condition.notify_all()
+            return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                lines, self.pending = self.pending, []
+                self.writing = True
+            try:
+                self.append(lines)
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
+
+    def append(self, lines: List[str]):
+        try:
+            with open(self.path, 'a') as f:
+                f.write("".join(lines))
+        except OSError:
+            with self.condition:
+                self.failed += len(lines)
+            return
+        with self.condition:
+            self.written += len(lines)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every line queued so far is in the file"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.pending or self.writing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Write what is still queued, then stop the worker"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.worker.join(timeout)
+
+class Telemetry:
+    """Process-wide aggregation of turn traces"""
+
+    def __init__(self, trace_file: Optional[str] = None, keep_recent: int = 200):
+        self.trace_file = trace_file
+        self.writer = TraceWriter(trace_file) if trace_file else None
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=keep_recent)
+
+        self.turns = {source: 0 for source in SOURCES}
+        self.model_calls = {}
+        self.retries = 0
+        self.hedges = {"won": 0, "lost": 0}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.cost = 0.0
+        self.errors = {}
+        self.turn_duration = Histogram()
+        self.first_token = Histogram()
+        self.stages = {}
+        # Extra metric sources, e.g. the learning queue, appended to the export
+        self.collectors = []
+        # Latest duration of each startup phase, in seconds
+        self.startup = {}
+
+    def record(self, trace: TurnTrace):
+        trace.finish()
+        with self.lock:
+            self.turns[trace.source] += 1
+            if trace.attempts:
+                self.model_calls[trace.model] = self.model_calls.get(trace.model, 0) + 1
+                self.retries += trace.attempts - 1
+            if trace.hedged:
+                self.hedges["won" if trace.hedge_won else "lost"] += 1
+            self.prompt_tokens += trace.prompt_tokens
+            self.completion_tokens += trace.completion_tokens
+            self.cached_prompt_tokens += trace.cached_prompt_tokens
+            self.cost += trace.cost
+            if trace.error:
+                error_type = trace.error.split(":", 1)[0]
+                self.errors[error_type] = self.errors.get(error_type, 0) + 1
+            self.turn_duration.observe(trace.duration_seconds)
+            if trace.first_token_seconds is not None:
+                self.first_token.observe(trace.first_token_seconds)
+            for name, seconds in trace.stages.items():
+                self.stages.setdefault(name, Histogram()).observe(seconds)
+            record = trace.to_dict()
+            self.recent.append(record)
+        if self.writer:
+            self.writer.write(json.dumps(record) + "\n")
+
+    def observe_stage(self, name: str, seconds: float):
+        with self.lock:
+            self.stages.setdefault(name, Histogram()).observe(seconds)
+
+    @contextmanager
+    def time(self, name: str):
+        """Time work outside a turn, e.g. strategy analysis, as a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(name, time.perf_counter() - start)
+
+    @contextmanager
+    def startup_phase(self, name: str):
+        """Time a startup phase, kept as its latest duration and as a startup_<name> stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe_stage(f"startup_{name}", seconds)
+            with self.lock:
+                self.startup[name] = seconds
+
+    def add_collector(self, collector: Callable[[], str]):
+        """Append another component's Prometheus text to every export"""
+        with self.lock:
+            self.collectors.append(collector)
+
+    def export_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        with self.lock:
+            lines = [
+                "# HELP sales_agent_turns_total Agent turns by how they were answered.",
+                "# TYPE sales_agent_turns_total counter"
+            ]
+            lines += [f'sales_agent_turns_total{{source="{source}"}} {count}' for source, count in self.turns.items()]
+            lines += [
+                "# HELP sales_agent_model_turns_total Turns answered by each model.",
+                "# TYPE sales_agent_model_turns_total counter"
+            ]
+            lines += [f'sales_agent_model_turns_total{{model="{model}"}} {count}' for model, count in self.model_calls.items()]
+            lines += [
+                "# HELP sales_agent_retries_total Model call attempts beyond the first in a turn.",
+                "# TYPE sales_agent_retries_total counter",
+                f"sales_agent_retries_total {self.retries}",
+                "# HELP sales_agent_hedges_total Hedged requests by whether the hedge answered first.",
+                "# TYPE sales_agent_hedges_total counter",
+                f'sales_agent_hedges_total{{outcome="won"}} {self.hedges["won"]}',
+                f'sales_agent_hedges_total{{outcome="lost"}} {self.hedges["lost"]}',
+                "# HELP sales_agent_tokens_total Tokens reported by the provider.",
+                "# TYPE sales_agent_tokens_total counter",
+                f'sales_agent_tokens_total{{kind="prompt"}} {self.prompt_tokens}',
+                f'sales_agent_tokens_total{{kind="completion"}} {self.completion_tokens}',
+                f'sales_agent_tokens_total{{kind="cached_prompt"}} {self.cached_prompt_tokens}',
+                "# HELP sales_agent_cost_usd_total Estimated model spend in USD.",
+                "# TYPE sales_agent_cost_usd_total counter",
+                f"sales_agent_cost_usd_total {self.cost}",
+                "# HELP sales_agent_errors_total Errors that made a turn fall back.",
+                "# TYPE sales_agent_errors_total counter"
+            ]
+            lines += [f'sales_agent_errors_total{{type="{error_type}"}} {count}' for error_type, count in self.errors.items()]
+            lines += [
+                "# HELP sales_agent_turn_duration_seconds Wall time of a full turn.",
+                "# TYPE sales_agent_turn_duration_seconds histogram"
+            ]
+            lines += self.turn_duration.lines("sales_agent_turn_duration_seconds")
+            lines += [
+                "# HELP sales_agent_first_token_seconds Time to the first streamed token.",
+                "# TYPE sales_agent_first_token_seconds histogram"
+            ]
+            lines += self.first_token.lines("sales_agent_first_token_seconds")
+            lines += [
+                "# HELP sales_agent_stage_duration_seconds Wall time per pipeline stage.",
+                "# TYPE sales_agent_stage_duration_seconds histogram"
+            ]
+            for name, histogram in self.stages.items():
+                lines += histogram.lines("sales_agent_stage_duration_seconds", f'stage="{name}"')
+            collectors = list(self.collectors)
+        if self.writer:
+            with self.writer.condition:
+                outcomes = {"written": self.writer.written, "dropped": self.writer.dropped, "failed": self.writer.failed}
+            lines += [
+                "# HELP sales_agent_trace_lines_total Trace file lines by what happened to them.",
+                "# TYPE sales_agent_trace_lines_total counter"
+            ]
+            lines += [f'sales_agent_trace_lines_total{{outcome="{outcome}"}} {count}' for outcome, count in outcomes.items()]
+        return "\n".join(lines) + "\n" + "".join(collector() for collector in collectors)
+
+    def export_jsonl(self) -> str:
+        """Recent traces, one JSON object per line"""
+        with self.lock:
+            return "".join(json.dumps(trace) + "\n" for trace in self.recent)
+
+    def summary(self) -> Dict:
+        """Aggregates over the recent traces for dashboards"""
+        with self.lock:
+            recent = list(self.recent)
+            turns = dict(self.turns)
+            cost = self.cost
+        durations = sorted(trace["duration_ms"] for trace in recent)
+        stage_totals = {}
+        for trace in recent:
+            for name, ms in trace["stages_ms"].items():
+                stage_totals[name] = stage_totals.get(name, 0.0) + ms
+
+        def pct(p):
+            return durations[min(len(durations) - 1, int(p / 100 * len(durations)))] if durations else 0.0
+
+        total_turns = sum(turns.values())
+        return {
+            "turns": total_turns,
+            "by_source": turns,
+            "cache_hit_rate": turns["cache"] / total_turns if total_turns else 0.0,
+            "fallback_rate": turns["fallback"] / total_turns if total_turns else 0.0,
+            "cost_usd": cost,
+            "p50_ms": pct(50),
+            "p95_ms": pct(95),
+            "stage_mean_ms": {name: total / len(recent) for name, total in stage_totals.items()}
+        }
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        payload = get_telemetry().export_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics for a Prometheus scraper on a background thread"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def get_telemetry() -> Telemetry:
+    """Get the telemetry collector shared by every session in the process"""
+    global _shared_telemetry
+    with _shared_lock:
+        if _shared_telemetry is None:
+            _shared_telemetry = Telemetry(TRACE_FILE)
+            if _shared_telemetry.writer:
+                atexit.register(_shared_telemetry.writer.close)
+            if METRICS_PORT:
+                start_metrics_server(int(METRICS_PORT))
+        return _shared_telemetry
@@ -0,0 +1,60 @@
+import pytest
+from conversation_memory import ConversationMemory, Message
+
+def fill(memory: ConversationMemory, count: int, start: int = 0):
+    for i in range(start, start + count):
+        memory.append("user" if i % 2 == 0 else "assistant", f"message {i}")
+
+def contents(messages) -> list:
+    return [message.content for message in messages]
+
+def test_keeps_the_newest_messages_after_wrapping():
+    memory = ConversationMemory(capacity=4)
+    fill(memory, 10)
+    assert (memory.total, len(memory), memory.first_position) == (10, 4, 6)
+    assert contents(memory) == ["message 6", "message 7", "message 8", "message 9"]
+    assert memory.user_turns == 5
+    assert memory.last().content == "message 9"
+
+def test_positions_stay_absolute():
+    memory = ConversationMemory(capacity=3)
+    fill(memory, 7)
+    assert memory.at(5).content == "message 5"
+    with pytest.raises(IndexError):
+        memory.at(3)
+    with pytest.raises(IndexError):
+        memory.at(7)
+    assert contents(memory.since(2)) == ["message 4", "message 5", "message 6"]
+    assert contents(memory.since(5)) == ["message 5", "message 6"]
+
+def test_views_index_and_slice_over_the_ring():
+    memory = ConversationMemory(capacity=5)
+    fill(memory, 8)
+    view = memory.recent(4)
+    assert len(view) == 4
+    assert (view[0].content, view[-1].content) == ("message 4", "message 7")
+    assert contents(view[1:3]) == ["message 5", "message 6"]
+    assert contents(memory.recent(50)) == [f"message {i}" for i in range(3, 8)]
+    assert memory[-2]["content"] == "message 6"
+    with pytest.raises(IndexError):
+        view[4]
+
+def test_restore_continues_at_the_stored_position():
+    memory = ConversationMemory(capacity=3)
+    stored = [Message("user", f"message {i}") for i in range(6, 10)]
+    memory.restore(stored, total=10, user_turns=5)
+    assert (memory.first_position, contents(memory)) == (7, ["message 7", "message 8", "message 9"])
+
+    fill(memory, 2, start=10)
+    assert contents(memory) == ["message 9", "message 10", "message 11"]
+    assert (memory.total, memory.user_turns) == (12, 6)
+
+def test_clear_empties_in_place():
+    memory = ConversationMemory(capacity=2)
+    fill(memory, 3)
+    memory.clear()
+    assert not memory
+    assert (memory.total, memory.user_turns, len(memory)) == (0, 0, 0)
+    assert memory.last() is None
+    fill(memory, 1)
+    assert contents(memory) == ["message 0"]
@@ -0,0 +1,67 @@
+import json
+import pytest
+from agent_openrouter import OpenRouterSalesAgent
+from knowledge_index import load_or_build_index
+from mock_openrouter import LocalClient
+
+DOCUMENTS = [
+    {"title": "Labuan", "jurisdiction": "labuan", "field": "taxation",
+     "text": "Labuan trading companies pay 3% tax on audited net profits."},
+    {"title": "BVI", "jurisdiction": "bvi", "field": "incorporation",
+     "text": "BVI business companies are formed in two days with one director and no local shareholder."},
+    {"title": "UAE", "jurisdiction": "uae", "field": "benefits",
+     "text": "UAE free zone companies allow full foreign ownership and a strong regional hub."},
+    {"title": "Banking", "text": "Opening a corporate bank account takes two to six weeks and needs the company documents."}
+]
+
+@pytest.fixture
+def index(tmp_path):
+    knowledge_dir = tmp_path / "knowledge"
+    knowledge_dir.mkdir()
+    with open(knowledge_dir / "offshore.jsonl", 'w') as f:
+        for document in DOCUMENTS:
+            f.write(json.dumps(document) + "\n")
+    (knowledge_dir / "licensing.md").write_text("# Licensing\nFintech companies need a licence before they start trading.\n")
+    return load_or_build_index(str(knowledge_dir), str(tmp_path / "index.bin"))
+
+def test_jurisdictions_come_from_the_documents(index):
+    assert {"labuan", "bvi", "uae", "singapore", "hong_kong"} <= index.jurisdictions
+    assert index.jurisdictions_in("Compare Hong  Kong, the BVI and Hong Kong again") == ["hong_kong", "bvi"]
+    assert index.jurisdictions_in("Do you help with licensing?") == []
+
+def test_search_keeps_named_jurisdictions_and_general_documents(index):
+    results = index.search("companies tax bank account", top_k=10, jurisdictions=["labuan"])
+    jurisdictions = {result["jurisdiction"] for result in results}
+    assert "labuan" in jurisdictions
+    assert jurisdictions <= {"labuan", ""}
+    assert any(result["title"] == "Banking" for result in results)
+
+def test_search_without_jurisdictions_ranks_every_document(index):
+    results = index.search("free zone foreign ownership", top_k=3)
+    assert results[0]["jurisdiction"] == "uae"
+
+def test_reloads_the_persisted_index_until_documents_change(index, tmp_path):
+    knowledge_dir = str(tmp_path / "knowledge")
+    path = str(tmp_path / "index.bin")
+    assert load_or_build_index(knowledge_dir, path).fingerprint == index.fingerprint
+    (tmp_path / "knowledge" / "banking.md").write_text("# Banking\nSome banks need an in-person visit.\n")
+    assert load_or_build_index(knowledge_dir, path).fingerprint != index.fingerprint
+
+@pytest.fixture
+def agent(index):
+    agent = OpenRouterSalesAgent(client=LocalClient())
+    agent.knowledge_index = index
+    return agent
+
+@pytest.mark.parametrize("message, title", [
+    ("What is the tax rate in Labuan?", "Labuan"),
+    ("How fast can you set up a BVI company?", "BVI"),
+    ("Why would we open a company in the UAE?", "UAE")
+])
+def test_agent_retrieves_documents_of_the_named_jurisdiction(agent, message, title):
+    knowledge = agent.get_knowledge(message)
+    assert knowledge.startswith(f"{title}: ")
+    assert "Singapore" not in knowledge
+
+def test_agent_does_not_filter_unnamed_jurisdictions(agent):
+    assert "UAE: " in agent.get_knowledge("Which free zone allows full foreign ownership?")
@@ -0,0 +1,87 @@
+import pytest
+from conversation_analyzer import ConversationAnalyzer
+from learning_queue import LearningQueue
+from strategy_manager import StrategyManager
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = StrategyManager(
+        strategy_file=str(tmp_path / "strategies.json"),
+        store_path=str(tmp_path / "strategies.db"),
+        archive_file=str(tmp_path / "archive.jsonl"),
+        analytics_file=str(tmp_path / "analytics.npz")
+    )
+    yield manager
+    manager.store.close()
+
+def analysis(link_shared: bool) -> dict:
+    reply = "Sure, no problem. Please choose a time CALENDLY_LINK." if link_shared else "Happy to help."
+    return ConversationAnalyzer.from_messages([
+        {"role": "user", "content": "I need a company in Singapore"},
+        {"role": "assistant", "content": reply}
+    ]).finalize(variant="control")
+
+def metrics(manager: StrategyManager) -> dict:
+    return manager.get_current_strategy()["success_metrics"]
+
+def test_resubmitted_conversation_is_learned_once(manager):
+    queue = LearningQueue(manager, batch_wait=0.5)
+    try:
+        assert queue.submit(analysis(False), "lead-1")
+        assert queue.submit(analysis(True), "lead-1")
+        assert queue.flush(10)
+        stats = queue.stats()
+        assert (stats["submitted"], stats["coalesced"], stats["learned"]) == (2, 1, 1)
+        # The latest analysis replaced the queued one
+        assert (metrics(manager)["conversations_completed"], metrics(manager)["link_shared"]) == (1, 1)
+
+        # Submitted again after the queue drained, the store skips it
+        assert queue.submit(analysis(True), "lead-1")
+        assert queue.flush(10)
+        assert metrics(manager)["conversations_completed"] == 1
+    finally:
+        queue.close()
+
+def test_anonymous_conversations_are_not_coalesced(manager):
+    queue = LearningQueue(manager, batch_wait=0.5)
+    try:
+        queue.submit(analysis(False))
+        queue.submit(analysis(False))
+        assert queue.flush(10)
+        assert queue.stats()["coalesced"] == 0
+        assert metrics(manager)["conversations_completed"] == 2
+    finally:
+        queue.close()
+
+def test_full_queue_drops(manager):
+    queue = LearningQueue(manager, max_pending=1, batch_wait=5, block_seconds=0)
+    assert queue.submit(analysis(True), "lead-1")
+    assert not queue.submit(analysis(True), "lead-2")
+    # Coalescing a queued conversation needs no room
+    assert queue.submit(analysis(False), "lead-1")
+    queue.close()
+    stats = queue.stats()
+    assert (stats["dropped"], stats["learned"]) == (1, 1)
+    assert metrics(manager)["conversations_completed"] == 1
+    assert not queue.submit(analysis(True), "lead-3")
+
+def test_full_queue_waits_for_room(manager):
+    queue = LearningQueue(manager, max_pending=1, batch_wait=0.2, block_seconds=10)
+    try:
+        assert queue.submit(analysis(True), "lead-1")
+        assert queue.submit(analysis(True), "lead-2")
+        assert queue.flush(10)
+        assert queue.stats()["dropped"] == 0
+        assert metrics(manager)["conversations_completed"] == 2
+    finally:
+        queue.close()
+
+def test_assignments_are_counted_without_learning(manager):
+    queue = LearningQueue(manager, batch_wait=0)
+    try:
+        variant = queue.assign_variant()
+        assert queue.flush(10)
+        assert manager.store.read_assignments() == {variant: 1}
+        assert metrics(manager)["conversations_completed"] == 0
+    finally:
+        queue.close()
@@ -0,0 +1,70 @@
+import time
+from prompt_templates import RenderedPrompt
+from response_cache import ResponseCache
+
+def prompt(prefix: str, suffix: str = "") -> RenderedPrompt:
+    return RenderedPrompt(prefix, f"hash of {prefix}", 10, suffix)
+
+def test_paraphrases_share_a_key():
+    cache = ResponseCache()
+    assert cache.make_key("How much does a HK company cost?", 0) == cache.make_key("What is the price of a Hong Kong company?", 0)
+
+def test_different_questions_do_not_collide():
+    cache = ResponseCache()
+    keys = {
+        cache.make_key("How much does a Hong Kong company cost?", 0),
+        cache.make_key("How much does a Singapore company cost?", 0),
+        cache.make_key("Is a local director required in Singapore?", 0),
+        cache.make_key("Is a local director not required in Singapore?", 0),
+        cache.make_key("Is a local director required in Singapore?", 2),
+        cache.make_key("Is a local director required in Singapore?", 5)
+    }
+    assert len(keys) == 6
+
+def test_keys_follow_the_prompt_prefix_and_variant():
+    cache = ResponseCache()
+    message = "How much does a Hong Kong company cost?"
+    base = cache.make_key(message, 0, prompt("base prompt", "strategy v1"), "control")
+    # Strategy updates only change the suffix, so entries outlive them
+    assert cache.make_key(message, 0, prompt("base prompt", "strategy v2"), "control") == base
+    assert cache.make_key(message, 0, prompt("new base prompt", "strategy v1"), "control") != base
+    assert cache.make_key(message, 0, prompt("base prompt", "strategy v1"), "early_link") != base
+
+    cache.put(base, "Hong Kong pricing")
+    assert cache.get(cache.make_key(message, 0, prompt("base prompt"), "early_link")) is None
+    assert cache.get(base) == "Hong Kong pricing"
+
+def test_context_dependent_follow_ups_are_not_cached():
+    cache = ResponseCache()
+    for message in ("How much is it?", "And what about that?", "Does this also apply to Singapore companies?"):
+        assert cache.make_key(message, 3) is None
+    # The opening message has no conversation to depend on
+    assert cache.make_key("How much is it?", 0) is not None
+
+    cache.put(None, "reply")
+    assert cache.get(None) is None
+    stats = cache.stats()
+    assert (stats["skipped"], stats["misses"], stats["entries"]) == (1, 0, 0)
+
+def test_similar_lookup_keeps_negations_apart():
+    cache = ResponseCache(similarity_threshold=0.5)
+    cache.put(cache.make_key("Is a local director required in Singapore?", 0), "Yes, one director must be local.")
+    assert cache.get(cache.make_key("Is a local resident director required for Singapore?", 0)) == "Yes, one director must be local."
+    assert cache.get(cache.make_key("Is a local director not required in Singapore?", 0)) is None
+    assert cache.stats()["similar_hits"] == 1
+
+def test_expiry_and_eviction(monkeypatch):
+    cache = ResponseCache(ttl_seconds=60)
+    key = cache.make_key("How much does a Hong Kong company cost?", 0)
+    cache.put(key, "reply")
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert cache.get(key) is None
+    monkeypatch.undo()
+
+    cache = ResponseCache(max_entries=2)
+    keys = [cache.make_key(f"How much does a company in {place} cost?", 0) for place in ("Singapore", "Hong Kong", "Malaysia")]
+    for key in keys:
+        cache.put(key, "reply")
+    assert cache.get(keys[0]) is None
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,100 @@
+import sqlite3
+import time
+import pytest
+import session_store
+from agent_openrouter import OpenRouterSalesAgent
+from conversation_memory import Message
+from mock_openrouter import LocalClient
+from session_store import SessionStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    yield store
+    store.close()
+
+def state(total: int, **extra) -> dict:
+    return dict({"total": total, "user_turns": total // 2, "summarized_count": 0, "summary": {"text": ""}}, **extra)
+
+def messages(start: int, stop: int) -> list:
+    return [Message("user" if i % 2 == 0 else "assistant", f"message {i}") for i in range(start, stop)]
+
+def test_save_appends_and_load_pages_the_newest(store):
+    store.save("lead", 0, messages(0, 4), state(4))
+    store.save("lead", 4, messages(4, 10), state(10, summarized_count=8, variant="early_link", conversation_id="c1"))
+
+    loaded, recent = store.load("lead", recent=3)
+    assert [m.content for m in recent] == ["message 7", "message 8", "message 9"]
+    assert (loaded["total"], loaded["user_turns"]) == (10, 5)
+    assert (loaded["variant"], loaded["conversation_id"]) == ("early_link", "c1")
+    assert store.load("other", recent=3) is None
+
+def test_load_reads_everything_not_yet_summarized(store):
+    store.save("lead", 0, messages(0, 10), state(10, summarized_count=4))
+    _, recent = store.load("lead", recent=2)
+    assert [m.content for m in recent] == [f"message {i}" for i in range(4, 10)]
+
+def test_delete_and_expire(store):
+    store.save("old", 0, messages(0, 2), state(2))
+    store.save("new", 0, messages(0, 2), state(2))
+    store.conn.execute("UPDATE sessions SET updated_at = ? WHERE lead_id = 'old'", (time.time() - 10 * 86400,))
+
+    assert store.expire(max_age_days=0) == 0
+    assert store.expire(max_age_days=5) == 1
+    assert store.load("old", recent=10) is None
+    assert store.conn.execute("SELECT COUNT(*) FROM messages WHERE lead_id = 'old'").fetchone()[0] == 0
+
+    store.delete("new")
+    assert store.load("new", recent=10) is None
+
+def test_opens_stores_without_the_newer_columns(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE sessions (lead_id TEXT PRIMARY KEY, total INTEGER NOT NULL, user_turns INTEGER NOT NULL, "
+        "summarized_count INTEGER NOT NULL, summary TEXT NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO sessions VALUES ('lead', 0, 0, 0, '{}', ?)", (time.time(),))
+    conn.commit()
+    conn.close()
+
+    store = SessionStore(path)
+    try:
+        loaded, _ = store.load("lead", recent=10)
+        assert (loaded["analysis"], loaded["variant"], loaded["conversation_id"]) == ({}, None, None)
+    finally:
+        store.close()
+
+@pytest.fixture
+def shared_store(store, monkeypatch):
+    monkeypatch.setattr(session_store, "_shared_store", store)
+    return store
+
+def test_agent_resumes_where_the_lead_left(shared_store):
+    client = LocalClient()
+    agent = OpenRouterSalesAgent(client=client, lead_id="lead")
+    agent.resume()
+    agent.variant, agent.conversation_id = "early_link", "c1"
+    agent.generate_response("I want to set up a company in Singapore")
+    agent.generate_response("How long does it take?")
+
+    returning = OpenRouterSalesAgent(client=client, lead_id="lead")
+    returning.resume()
+    assert [m.to_dict() for m in returning.memory] == [m.to_dict() for m in agent.memory]
+    assert returning.memory.user_turns == 2
+    assert (returning.variant, returning.conversation_id) == ("early_link", "c1")
+    assert returning.analyzer.state() == agent.analyzer.state()
+
+    # Only the new exchange is appended
+    returning.generate_response("Do I need a local director?")
+    _, stored = shared_store.load("lead", recent=100)
+    assert len(stored) == 6
+
+def test_cleared_agent_starts_a_new_conversation(shared_store):
+    agent = OpenRouterSalesAgent(client=LocalClient(), lead_id="lead")
+    agent.resume()
+    agent.conversation_id = "c1"
+    agent.generate_response("Hello")
+    agent.clear_memory()
+    assert agent.conversation_id is None
+    assert shared_store.load("lead", recent=10) is None
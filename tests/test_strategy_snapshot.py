@@ -0,0 +1,68 @@
+import json
+import pickle
+import pytest
+from conversation_analyzer import ConversationAnalyzer
+from strategy_manager import StrategyManager
+from strategy_snapshot import PackedRecords, decode_snapshot, encode_snapshot, is_snapshot, to_json
+
+def analysis(message: str, link_shared: bool) -> dict:
+    reply = "Sure, no problem. We have many clients in that industry."
+    if link_shared:
+        reply += " Please choose a time CALENDLY_LINK."
+    return ConversationAnalyzer.from_messages([
+        {"role": "user", "content": message},
+        {"role": "assistant", "content": reply}
+    ]).finalize(timestamp="2024-01-01T00:00:00", variant="control")
+
+def strategies() -> dict:
+    strategies = StrategyManager.get_default_strategies()
+    patterns = strategies["learned_patterns"]
+    patterns["successful_conversations"] = [analysis(f"Company in Singapore, case {i}?", True) for i in range(5)]
+    patterns["failed_conversations"] = [analysis(f"Bank account in Hong Kong, case {i}?", False) for i in range(3)]
+    patterns["successful_phrases"] = {"Sure, no problem": 5}
+    return strategies
+
+def test_round_trip_keeps_content_and_key_order():
+    original = strategies()
+    payload = encode_snapshot(original)
+    assert is_snapshot(payload)
+    decoded = decode_snapshot(payload)
+    assert to_json(decoded) == json.dumps(original)
+    assert list(decoded["learned_patterns"]) == list(original["learned_patterns"])
+
+def test_history_stays_packed_until_read():
+    decoded = decode_snapshot(encode_snapshot(strategies()))
+    records = decoded["learned_patterns"]["successful_conversations"]
+    assert isinstance(records, PackedRecords)
+    assert len(records) == 5
+    assert records.items is None
+    assert records[2]["topics_discussed"] == strategies()["learned_patterns"]["successful_conversations"][2]["topics_discussed"]
+    # Only the record read was decoded
+    assert sum(isinstance(item, dict) for item in records.items) == 1
+
+def test_untouched_records_are_copied_as_bytes():
+    payload = encode_snapshot(strategies())
+    assert encode_snapshot(decode_snapshot(payload)) == payload
+
+def test_records_added_after_decode_survive_a_rewrite():
+    decoded = decode_snapshot(encode_snapshot(strategies()))
+    records = decoded["learned_patterns"]["failed_conversations"]
+    added = dict(analysis("Tax rate in the UK?", False), persona="brief")
+    records.append(added)
+    del records[0]
+
+    rewritten = decode_snapshot(encode_snapshot(decoded))
+    failed = list(rewritten["learned_patterns"]["failed_conversations"])
+    assert len(failed) == 3
+    assert failed[-1] == added
+    assert failed[0] == strategies()["learned_patterns"]["failed_conversations"][1]
+
+def test_packed_records_pickle_as_lists():
+    decoded = decode_snapshot(encode_snapshot(strategies()))
+    records = pickle.loads(pickle.dumps(decoded["learned_patterns"]["successful_conversations"]))
+    assert records == strategies()["learned_patterns"]["successful_conversations"]
+
+def test_rejects_other_payloads():
+    assert not is_snapshot(b'{"learned_patterns": {}}')
+    with pytest.raises(ValueError):
+        decode_snapshot(b'{"learned_patterns": {}}')
@@ -0,0 +1,64 @@
+import json
+import pytest
+from strategy_manager import StrategyManager
+from strategy_snapshot import to_json
+from strategy_store import StrategyStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = StrategyStore(str(tmp_path / "strategies.db"), archive_path=str(tmp_path / "archive.jsonl"))
+    yield store
+    store.close()
+
+def events(count: int, start: int = 0) -> list:
+    return [{"conversation": start + i} for i in range(count)]
+
+def test_read_events_after_an_id(store):
+    last = store.append_events(events(3))
+    assert [event for _, event in store.read_events(0)] == events(3)
+    assert [event_id for event_id, _ in store.read_events(last - 1)] == [last]
+    assert store.read_events(last) == []
+
+def test_read_events_after_compaction(store, tmp_path):
+    first = store.append_events(events(2))
+    last = store.append_events(events(2, start=2))
+    strategies = StrategyManager.get_default_strategies()
+    assert store.compact(first, strategies)
+
+    # Readers that saw fewer events than were folded have to reload the snapshot
+    assert store.read_events(0) is None
+    assert [event for _, event in store.read_events(first)] == events(2, start=2)
+    snapshot_event_id, snapshot = store.read_snapshot()
+    assert snapshot_event_id == first
+    assert to_json(snapshot) == json.dumps(strategies)
+    assert not store.compact(first, strategies)
+
+    assert store.compact(last, strategies)
+    assert store.read_events(last) == []
+    with open(tmp_path / "archive.jsonl") as f:
+        assert [json.loads(line) for line in f] == events(4)
+
+def test_conversations_are_learned_once(store, tmp_path):
+    assert store.append_events(events(2), conversation_ids=["a", None])
+    assert store.append_events(events(1, start=2), conversation_ids=["a"]) == 0
+    store.compact(store.append_events(events(1, start=3), conversation_ids=[None]), StrategyManager.get_default_strategies())
+
+    # Remembered after compaction and by other connections
+    other = StrategyStore(str(tmp_path / "strategies.db"))
+    try:
+        assert other.append_events(events(1, start=4), conversation_ids=["a"]) == 0
+        assert other.append_events(events(1, start=5), conversation_ids=["b"])
+    finally:
+        other.close()
+
+def test_assignments_add_up(store):
+    store.append_events([], {"control": 2, "early_link": 1})
+    store.append_events(events(1), {"control": 1})
+    assert store.read_assignments() == {"control": 3, "early_link": 1}
+
+def test_reads_json_snapshots(store):
+    strategies = StrategyManager.get_default_strategies()
+    store.conn.execute(
+        "INSERT INTO snapshot (id, last_event_id, created_at, payload) VALUES (1, 7, '', ?)", (json.dumps(strategies),)
+    )
+    assert store.read_snapshot() == (7, strategies)